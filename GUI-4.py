@@ -1,9 +1,7 @@
 import dash
-from dash import dcc, html, Input, Output, State, clientside_callback, no_update, dash_table
+from dash import dcc, html, Input, Output, State, clientside_callback, dash_table, Patch, ClientsideFunction
 import dash_bootstrap_components as dbc
 import pandas as pd
-import io
-import json
 import os
 import base64
 from datetime import datetime
@@ -11,199 +9,64 @@ import time
 import traceback
 import tempfile
 import random
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import quote
+
+from flask import Response, abort, jsonify, request, send_file, stream_with_context
+
+from document_pages import PAGED_EXTENSIONS, DocumentTooLarge, plan_pages
+from excel_export import XLSX_MIMETYPE, iter_file_chunks, new_export_path, write_workbook
+from invoice_history import history_from_env, invoice_key
+from job_queue import JobQueue, iter_job_events
+import metrics
+from preview_cards import build_preview_card, build_preview_page, page_bounds, page_count
+from profiling import profile_controller_from_env
+from session_store import session_store_from_env
+from table_query import query_table, unparsed_filters
+from typed_export import EXPORT_FORMATS, PYARROW_AVAILABLE, export_headers, iter_export, typed_record
+from thumbnails import ThumbnailStore
 
 # ==================== OCR 处理模块 ====================
 try:
-    from Ranch5 import SimpleOCR
+    from Ranch5 import SimpleOCR, get_shared_ocr
+    from ocr_cache import cache_from_env
+    from invoice_parser import PARSER_VERSION, parse_aliyun_ocr_result
 
-    def parse_aliyun_ocr_result(raw_data):
-        try:
-            if 'Data' not in raw_data:
-                return {"error": "返回数据中没有'Data'字段", "raw_data": raw_data}
-            data_str = raw_data['Data']
-            if isinstance(data_str, str):
-                try:
-                    data_dict = json.loads(data_str)
-                except json.JSONDecodeError:
-                    return {"error": "解析Data字符串失败", "raw_data": data_str}
-            else:
-                data_dict = data_str
-
-            if 'data' in data_dict:
-                nested_data = data_dict['data']
-                if isinstance(nested_data, str):
-                    try:
-                        invoice_data = json.loads(nested_data)
-                    except:
-                        invoice_data = {}
-                else:
-                    invoice_data = nested_data
-
-                result = {
-                    "basic_info": {}, "seller_info": {}, "purchaser_info": {},
-                    "amount_info": {}, "invoice_details": [], "image_info": {},
-                }
-
-                basic_fields = {
-                    'invoiceCode': '发票代码', 'invoiceNumber': '发票号码', 'invoiceDate': '开票日期',
-                    'drawer': '开票人', 'remarks': '备注',
-                }
-                for api_field, display_name in basic_fields.items():
-                    if api_field in invoice_data and invoice_data[api_field]:
-                        result["basic_info"][display_name] = invoice_data[api_field]
-
-                seller_fields = {'sellerName': '名称', 'sellerTaxNumber': '税号'}
-                for api_field, display_name in seller_fields.items():
-                    if api_field in invoice_data and invoice_data[api_field]:
-                        result["seller_info"][display_name] = invoice_data[api_field]
-
-                purchaser_fields = {'purchaserName': '名称', 'purchaserTaxNumber': '税号'}
-                for api_field, display_name in purchaser_fields.items():
-                    if api_field in invoice_data and invoice_data[api_field]:
-                        result["purchaser_info"][display_name] = invoice_data[api_field]
-
-                amount_fields = {
-                    'totalAmount': '发票金额',
-                    'invoiceAmountPreTax': '不含税金额',
-                    'invoiceTax': '发票税额'
-                }
-                for api_field, display_name in amount_fields.items():
-                    if api_field in invoice_data and invoice_data[api_field]:
-                        result["amount_info"][display_name] = invoice_data[api_field]
-
-                if 'invoiceDetails' in invoice_data and invoice_data['invoiceDetails']:
-                    details = invoice_data['invoiceDetails']
-                    if isinstance(details, str):
-                        try:
-                            details = json.loads(details)
-                        except:
-                            details = []
-                    if isinstance(details, list):
-                        for detail in details:
-                            if isinstance(detail, dict):
-                                parsed_detail = {
-                                    '货物名称': detail.get('itemName', ''),
-                                    '数量': detail.get('quantity', ''),
-                                    '金额': detail.get('amount', ''),
-                                }
-                                parsed_detail = {k: v for k, v in parsed_detail.items() if v}
-                                if parsed_detail:
-                                    result["invoice_details"].append(parsed_detail)
-                if 'remarks' in invoice_data and invoice_data['remarks']:
-                    remarks = invoice_data['remarks']
-                    result["basic_info"]["备注"] = remarks
-                    def extract_bank_info_from_remarks(remarks):
-                        """
-                        从备注中提取银行信息和账号
-                        支持多种格式：
-                        1. "销方开户银行:中国农业银行股份有限公司三明徐碧支行;银行账号:13800101040002394;"
-                        2. "开户行：中国工商银行深圳分行\n账号：6222024000001234567"
-                        3. "中国银行北京分行 6225888888888888"
-                        """
-                        bank_info = {"开户行": "", "银行账号": ""}
-                        
-                        if not remarks:
-                            return bank_info
-                        
-                        import re
-                        
-                        # 清理备注文本
-                        remarks = remarks.replace('\r\n', '\n').replace('\r', '\n')
-                        
-                        # 模式1：包含"开户银行"和"银行账号"的格式（分号分隔）
-                        pattern1 = r'(?:销方开户银行|开户行)[:：]\s*([^;]+?)(?:;|银行账号)'
-                        pattern1_account = r'银行账号[:：]\s*(\d{16,19})'
-                        
-                        # 模式2：一行中包含银行和账号的格式
-                        pattern2 = r'([\u4e00-\u9fff]+银行[^;]*?)(\d{16,19})'
-                        
-                        # 模式3：分行显示，银行在一行，账号在另一行
-                        pattern3_bank = r'开户行[:：]\s*([^\n]+)'
-                        pattern3_account = r'账号[:：]\s*(\d{16,19})'
-                        
-                        # 首先尝试模式1（分号分隔格式）
-                        bank_match = re.search(pattern1, remarks)
-                        account_match = re.search(pattern1_account, remarks)
-                        
-                        if bank_match:
-                            bank_info["开户行"] = bank_match.group(1).strip()
-                        if account_match:
-                            bank_info["银行账号"] = account_match.group(1)
-                        
-                        # 如果模式1没找到，尝试模式2（一行内包含）
-                        if not bank_info["开户行"] or not bank_info["银行账号"]:
-                            match2 = re.search(pattern2, remarks)
-                            if match2:
-                                if not bank_info["开户行"]:
-                                    bank_info["开户行"] = match2.group(1).strip()
-                                if not bank_info["银行账号"]:
-                                    bank_info["银行账号"] = match2.group(2)
-                        
-                        # 如果还没找到，尝试模式3（分行格式）
-                        if not bank_info["开户行"]:
-                            match3_bank = re.search(pattern3_bank, remarks)
-                            if match3_bank:
-                                bank_info["开户行"] = match3_bank.group(1).strip()
-                        
-                        if not bank_info["银行账号"]:
-                            match3_account = re.search(pattern3_account, remarks)
-                            if match3_account:
-                                bank_info["银行账号"] = match3_account.group(1)
-                        
-                        # 最后尝试通用搜索：直接搜索银行关键词和账号
-                        if not bank_info["开户行"]:
-                            bank_keywords = ['银行', '农行', '工行', '建行', '中行', '招行', '交行', '邮储',
-                                            '农商行', '浦发', '兴业', '中信', '光大', '华夏', '民生', '平安']
-                            for keyword in bank_keywords:
-                                if keyword in remarks:
-                                    # 找到包含关键词的行
-                                    lines = remarks.split('\n')
-                                    for line in lines:
-                                        if keyword in line and '账号' not in line:
-                                            bank_info["开户行"] = line.strip().replace(':', '').replace('：', '').strip()
-                                            break
-                                    if bank_info["开户行"]:
-                                        break
-                        
-                        # 清理开户行文本
-                        if bank_info["开户行"]:
-                            # 移除可能的分隔符
-                            for sep in [';', '；', '，', ',', '。', '、']:
-                                if sep in bank_info["开户行"]:
-                                    bank_info["开户行"] = bank_info["开户行"].split(sep)[0]
-                            
-                            # 移除多余的空格和冒号
-                            bank_info["开户行"] = bank_info["开户行"].strip().rstrip(':：;；')
-                        
-                        return bank_info
-                    # 尝试从备注中提取银行信息
-                    bank_info = extract_bank_info_from_remarks(remarks)
-                    if bank_info:
-                        result["seller_info"]["开户行"] = bank_info.get("开户行", "")
-                        result["seller_info"]["银行账号"] = bank_info.get("银行账号", "")
-
-                return result
-            else:
-                return {"error": "没有找到嵌套的data字段", "raw_data": data_dict}
-        except Exception as e:
-            return {"error": f"解析过程中出错: {str(e)}", "raw_data": raw_data}
+    def build_invoice_result(raw_data, file_name):
+        parsed = parse_aliyun_ocr_result(raw_data)
+        if "error" not in parsed:
+            result = {**parsed, "file_name": file_name,
+                      "processing_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                      "ocr_status": "成功"}
+            record_history(result, raw_data)
+            return result
+        return {"error": parsed.get("error"), "file_name": file_name}
 
     def process_invoice_image(file_path, ocr_instance):
         try:
             result = ocr_instance.recognize_invoice_raw(file_path)
             if result["success"]:
-                parsed = parse_aliyun_ocr_result(result["data"])
-                if "error" not in parsed:
-                    return {**parsed, "file_name": os.path.basename(file_path),
-                            "processing_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                            "ocr_status": "成功"}
-                else:
-                    return {"error": parsed.get("error"), "file_name": os.path.basename(file_path)}
+                return build_invoice_result(result["data"], os.path.basename(file_path))
             else:
                 return {"error": result.get("error", "OCR失败"), "file_name": os.path.basename(file_path)}
         except Exception as e:
             traceback.print_exc()
             return {"error": f"处理失败: {str(e)}", "file_name": os.path.basename(file_path)}
+
+    def process_invoice_bytes(image_data, filename, ocr_instance, page_no=None):
+        try:
+            result = ocr_instance.recognize_invoice_bytes(image_data, filename, page_no=page_no)
+            if result["success"]:
+                return build_invoice_result(result["data"], filename)
+            else:
+                return {"error": result.get("error", "OCR失败"), "file_name": filename}
+        except Exception as e:
+            traceback.print_exc()
+            return {"error": f"处理失败: {str(e)}", "file_name": filename}
 except ImportError:
     print("未找到Ranch5模块，使用模拟OCR模式")
     def process_invoice_image(file_path, ocr_instance=None):
@@ -221,6 +84,33 @@ except ImportError:
             "ocr_status": "模拟成功"
         }
 
+    def process_invoice_bytes(image_data, filename, ocr_instance=None, page_no=None):
+        return process_invoice_image(filename, ocr_instance)
+
+def process_document_page(page, source_file, ocr_instance):
+    # 多页文档中的一页，结果中记录来源文件和页码
+    result = process_invoice_bytes(page.data, page.filename, ocr_instance, page_no=page.request_page_no)
+    result.update(file_name=f"{source_file} 第{page.page_no}页", source_file=source_file, page_no=page.page_no)
+    return result
+
+def process_document(image_data, filename, ocr_instance):
+    # 在后台任务中拆分多页PDF/TIFF并发识别各页，回调不必等待拆分；
+    # 预览卡片展示第一张识别成功的发票，各页结果在pages中，结果表格每页一行
+    try:
+        mode, pages = plan_pages(image_data, filename)
+    except DocumentTooLarge as e:
+        return {"error": str(e), "file_name": filename}
+    if mode == "single":
+        return process_invoice_bytes(image_data, filename, ocr_instance)
+    workers = max(1, min(len(pages), getattr(ocr_instance, 'page_workers', 1)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr-page") as executor:
+        page_results = list(executor.map(partial(process_document_page, source_file=filename,
+                                                 ocr_instance=ocr_instance), pages))
+    first = next((result for result in page_results if "error" not in result), page_results[0])
+    document = {key: value for key, value in first.items() if key not in ("source_file", "page_no")}
+    document.update(file_name=filename, pages=page_results)
+    return document
+
 # ==================== Dash 应用初始化 ====================
 app = dash.Dash(__name__, external_stylesheets=[
     dbc.themes.BOOTSTRAP,
@@ -370,19 +260,99 @@ app.index_string = '''
 </html>
 '''
 
-# 全局变量
-processed_results = []
-current_df = None
-uploaded_images_data = []
-temp_files = []
+# 批量识别时同时在途的OCR请求上限（受阿里云接口并发限制约束）
+OCR_MAX_WORKERS = max(1, int(os.environ.get('OCR_MAX_WORKERS', '4')))
 
-def save_base64_image(base64_str, filename):
+# 设为1时上传的图片先写入临时文件再识别，默认直接在内存中提交
+OCR_SPOOL_UPLOADS = os.environ.get('OCR_SPOOL_UPLOADS', '0') == '1'
+
+# OCR结果缓存，重复上传的图片直接使用缓存结果
+ocr_cache = cache_from_env(PARSER_VERSION) if 'SimpleOCR' in globals() else None
+
+# 后台识别任务队列，所有任务共用OCR_MAX_WORKERS个并发
+job_queue = JobQueue(max_workers=OCR_MAX_WORKERS)
+JOB_POLL_INTERVAL_MS = int(os.environ.get('JOB_POLL_INTERVAL_MS', '1000'))
+# 每个进度推送连接占用一个服务线程：限制同时连接数和单个连接的时长，超出时页面改为轮询
+SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', '8'))
+SSE_MAX_SECONDS = float(os.environ.get('SSE_MAX_SECONDS', '120'))
+_sse_slots = threading.BoundedSemaphore(max(1, SSE_MAX_STREAMS))
+
+# 历史记录表格每页行数
+HISTORY_PAGE_SIZE = 20
+HISTORY_COLUMNS = [
+    {"name": "开票日期", "id": "invoice_date"},
+    {"name": "发票代码", "id": "invoice_code"},
+    {"name": "发票号码", "id": "invoice_number"},
+    {"name": "销售方", "id": "seller_name"},
+    {"name": "销售方税号", "id": "seller_tax_no"},
+    {"name": "购买方", "id": "purchaser_name"},
+    {"name": "购买方税号", "id": "purchaser_tax_no"},
+    {"name": "发票金额", "id": "amount"},
+    {"name": "文件名", "id": "file_name"},
+    {"name": "识别时间", "id": "recognized_at"},
+]
+
+# 结果表格每页行数；排序、筛选和分页在服务器上进行，浏览器只接收当前页
+TABLE_PAGE_SIZE = max(1, int(os.environ.get('TABLE_PAGE_SIZE', '10')))
+TABLE_COLUMNS = ["序号", "文件名", "项目名称", "发票金额", "发票数量", "销售方", "开票日期", "购买方", "状态"]
+# 发票预览每页卡片数；只构建和发送当前页的卡片，翻页时再生成
+PREVIEW_PAGE_SIZE = max(1, int(os.environ.get('PREVIEW_PAGE_SIZE', '20')))
+# 导出Excel时"发票明细"工作表的列
+DETAIL_COLUMNS = ["序号", "文件名", "发票号码", "明细行号", "货物名称", "数量", "金额"]
+
+# 设为0时不提供 /metrics 性能指标地址
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+
+# 按需剖析上传批次的CPU和内存（PROFILE_UPLOADS 或管理地址 /admin/profile 开启）
+profiler = profile_controller_from_env()
+
+# 浏览器端上传前缩小图片（可选），见 assets/image_resize.js
+CLIENT_RESIZE_CONFIG = {
+    'enabled': os.environ.get('CLIENT_RESIZE_ENABLED', '0') == '1',
+    'maxEdge': int(os.environ.get('CLIENT_RESIZE_MAX_EDGE', '2000')),
+    'quality': float(os.environ.get('CLIENT_RESIZE_QUALITY', '0.85')),
+}
+
+# 预览缩略图，按图片内容摘要缓存在磁盘上，通过 /thumbnails/<摘要> 访问
+thumbnail_store = ThumbnailStore(
+    cache_dir=os.environ.get('THUMBNAIL_DIR') or None,
+    max_edge=int(os.environ.get('THUMBNAIL_MAX_EDGE', '400'))
+)
+
+# 发票历史记录：识别成功的结果长期保存，不随新的上传或清空而删除
+invoice_history = history_from_env()
+
+def record_history(result, raw_data):
+    # 保存失败不影响本次识别结果；同一张发票（发票代码+号码）之前已保存过时标记为重复
+    if invoice_history is None:
+        return
+    try:
+        key = invoice_key(result)
+        previous = invoice_history.find(key) if key else None
+        result["history_id"] = invoice_history.record(result, raw_data)
+        if previous is not None:
+            result["duplicate_of"] = {"file_name": previous["file_name"],
+                                      "recognized_at": previous["recognized_at"]}
+    except Exception as e:
+        print(f"保存发票历史记录失败: {e}")
+
+# 会话存储：每个浏览器页面的上传记录和识别结果相互独立，
+# 设置SESSION_STORE=sqlite后可由多个服务进程共享
+session_store = session_store_from_env()
+
+@metrics.STAGE_SECONDS.time(stage="decode")
+def decode_base64_image(base64_str):
     if ',' in base64_str:
         base64_str = base64_str.split(',')[1]
     try:
-        image_data = base64.b64decode(base64_str)
+        return base64.b64decode(base64_str)
     except:
-        image_data = base64_str.encode()
+        return base64_str.encode()
+
+def save_base64_image(base64_str, filename):
+    return save_image_bytes(decode_base64_image(base64_str), filename)
+
+def save_image_bytes(image_data, filename):
     temp_dir = tempfile.gettempdir()
     safe_filename = "".join(c for c in filename if c.isalnum() or c in ['.', '-', '_'])
     if not safe_filename:
@@ -397,8 +367,16 @@ def save_base64_image(base64_str, filename):
         f.write(image_data)
     return temp_path
 
+def remove_temp_files(paths):
+    for f in paths:
+        try:
+            if os.path.exists(f): 
+                os.remove(f)
+        except: 
+            pass
+
 # ==================== 简洁布局 ====================
-app.layout = dbc.Container([
+main_layout = dbc.Container([
     # 简洁标题栏
     dbc.Row([
         dbc.Col([
@@ -428,8 +406,8 @@ app.layout = dbc.Container([
                         children=html.Div([
                             html.I(className="bi bi-cloud-arrow-up display-6 text-muted mb-3"),
                             html.H5("点击或拖放文件", className="fw-semibold mb-2"),
-                            html.P("支持JPG、PNG格式", className="text-muted mb-0"),
-                            html.Small("可批量上传多张发票", className="text-muted")
+                            html.P("支持JPG、PNG、PDF、TIFF格式", className="text-muted mb-0"),
+                            html.Small("可批量上传多张发票，多页PDF/TIFF按页识别", className="text-muted")
                         ], className="text-center py-4"),
                         style={
                             'width': '100%',
@@ -444,15 +422,29 @@ app.layout = dbc.Container([
                             'justifyContent': 'center'
                         },
                         multiple=True,
-                        accept='image/*'
+                        accept='image/*,.pdf,.tif,.tiff'
                     ),
                     
-                    html.Div(id='upload-status', className="mt-3")
+                    html.Div(id='upload-status', className="mt-3"),
+                    dcc.Store(id='client-resize-config', data=CLIENT_RESIZE_CONFIG),
+                    dcc.Store(id='upload-payload'),
+                    dcc.Store(id='job-id'),
+                    dcc.Store(id='job-event'),
+                    html.Div(id='job-stream-status', style={'display': 'none'}),
+                    dcc.Interval(id='job-poller', interval=JOB_POLL_INTERVAL_MS, disabled=True)
                 ], className="px-4 py-3")
             ], className="clean-card mb-4"),
             
-            # 发票详情预览
-            html.Div(id='image-previews', className="mb-4"),
+            # 发票详情预览（分页，只包含当前页的卡片）
+            html.Div([
+                html.Div(id='image-previews'),
+                html.Div(
+                    dbc.Pagination(id='preview-pagination', max_value=1, active_page=1,
+                                   fully_expanded=False, previous_next=True, first_last=True,
+                                   class_name="justify-content-center mt-2 mb-0"),
+                    id='preview-pager', style={'display': 'none'}
+                )
+            ], className="mb-4"),
             
             # 识别结果表格
             dbc.Card([
@@ -465,7 +457,51 @@ app.layout = dbc.Container([
                         html.P("所有已识别发票的汇总信息", className="text-muted mb-4")
                     ]),
                     
-                    html.Div(id='data-table', className="simple-table mb-3"),
+                    # 数据由 update_results_table 按页填充
+                    html.Div(
+                        dash_table.DataTable(
+                            id='results-table',
+                            columns=[{"name": i, "id": i} for i in TABLE_COLUMNS],
+                            page_action='custom',
+                            sort_action='custom',
+                            sort_mode='multi',
+                            filter_action='custom',
+                            page_current=0,
+                            page_size=TABLE_PAGE_SIZE,
+                            sort_by=[],
+                            filter_query='',
+                            style_cell={
+                                'textAlign': 'left',
+                                'padding': '12px',
+                                'border': '1px solid #e0e0e0',
+                                'backgroundColor': 'white'
+                            },
+                            style_cell_conditional=[
+                                {"if": {"column_id": "序号"}, "textAlign": "center", "width": "60px"},
+                                {"if": {"column_id": "发票金额"}, "textAlign": "right"},
+                                {"if": {"column_id": "状态"}, "textAlign": "center", "width": "80px"},
+                            ],
+                            style_header={
+                                'backgroundColor': '#f8f9fa',
+                                'fontWeight': '600',
+                                'borderBottom': '2px solid #dee2e6',
+                                'textAlign': 'left'
+                            },
+                            style_data_conditional=[
+                                {'if': {'row_index': 'odd'}, 'backgroundColor': '#fafafa'},
+                                {'if': {'filter_query': '{状态} = "✅ 成功"'}, 'color': '#198754'},
+                                {'if': {'filter_query': '{状态} = "❌ 失败"'}, 'color': '#dc3545'},
+                            ],
+                            style_table={
+                                'overflowX': 'auto',
+                                'border': '1px solid #e0e0e0',
+                                'borderRadius': '8px'
+                            }
+                        ),
+                        id='data-table', className="simple-table mb-3", style={'display': 'none'}
+                    ),
+                    html.Div("暂无数据", id='table-placeholder', className="text-center py-4 text-muted"),
+                    dcc.Store(id='table-version'),
                     html.Div(id='data-info', className="mt-3")
                 ], className="px-4 py-3")
             ], className="clean-card mb-4"),
@@ -491,7 +527,7 @@ app.layout = dbc.Container([
                             dbc.Button([
                                 html.I(className="bi bi-file-earmark-excel me-2"),
                                 "下载Excel"
-                            ], id='download-excel-btn', color="success", 
+                            ], id='download-excel-btn', color="success", external_link=True,
                             className="w-100 btn-clean", disabled=True)
                         ], xs=12, md=4, className="mb-2"),
                         
@@ -504,287 +540,542 @@ app.layout = dbc.Container([
                         ], xs=12, md=4, className="mb-2")
                     ]),
                     
+                    html.Div([
+                        html.Small("数据分析格式（金额、日期带类型）：", className="text-muted me-2"),
+                        html.A("CSV", id='export-csv-link', className="me-3"),
+                        html.A("Parquet", id='export-parquet-link', className="me-3"),
+                        html.A("Arrow", id='export-arrow-link')
+                    ], className="mt-2"),
+
                     html.Div(id='action-status', className="mt-3"),
-                    dcc.Download(id="download-excel"),
                     dcc.Textarea(id='clipboard-text', style={'display': 'none'})
                 ], className="px-4 py-3")
+            ], className="clean-card mb-4"),
+
+            # 历史记录查询
+            dbc.Card([
+                dbc.CardBody([
+                    html.Div([
+                        html.H5([
+                            html.I(className="bi bi-clock-history me-2"),
+                            "历史记录"
+                        ], className="fw-bold mb-3"),
+                        html.P("查询以往识别过的发票，不会重新调用OCR接口", className="text-muted mb-4")
+                    ]),
+
+                    dbc.Row([
+                        dbc.Col(dbc.Input(id='history-invoice-number', placeholder="发票号码"), xs=12, md=4, className="mb-2"),
+                        dbc.Col(dbc.Input(id='history-seller-tax', placeholder="销售方税号"), xs=12, md=4, className="mb-2"),
+                        dbc.Col(dbc.Input(id='history-purchaser-tax', placeholder="购买方税号"), xs=12, md=4, className="mb-2"),
+                        dbc.Col(dbc.Input(id='history-date-from', placeholder="开票日期从，如 2025-03"), xs=6, md=3, className="mb-2"),
+                        dbc.Col(dbc.Input(id='history-date-to', placeholder="开票日期到"), xs=6, md=3, className="mb-2"),
+                        dbc.Col(dbc.Input(id='history-amount-min', type="number", placeholder="最低金额"), xs=6, md=2, className="mb-2"),
+                        dbc.Col(dbc.Input(id='history-amount-max', type="number", placeholder="最高金额"), xs=6, md=2, className="mb-2"),
+                        dbc.Col([
+                            dbc.Button([
+                                html.I(className="bi bi-search me-2"),
+                                "查询"
+                            ], id='history-search-btn', color="primary", className="w-100 btn-clean")
+                        ], xs=12, md=2, className="mb-2")
+                    ], className="mb-3"),
+
+                    html.Div(id='history-info', className="text-muted small mb-2"),
+                    dash_table.DataTable(
+                        id='history-table',
+                        columns=HISTORY_COLUMNS,
+                        data=[],
+                        page_action='custom',
+                        page_current=0,
+                        page_size=HISTORY_PAGE_SIZE,
+                        style_cell={
+                            'textAlign': 'left',
+                            'padding': '10px',
+                            'border': '1px solid #e0e0e0',
+                            'backgroundColor': 'white'
+                        },
+                        style_cell_conditional=[
+                            {"if": {"column_id": "amount"}, "textAlign": "right"},
+                        ],
+                        style_header={
+                            'backgroundColor': '#f8f9fa',
+                            'fontWeight': '600',
+                            'borderBottom': '2px solid #dee2e6',
+                            'textAlign': 'left'
+                        },
+                        style_data_conditional=[
+                            {'if': {'row_index': 'odd'}, 'backgroundColor': '#fafafa'},
+                        ],
+                        style_table={
+                            'overflowX': 'auto',
+                            'border': '1px solid #e0e0e0',
+                            'borderRadius': '8px'
+                        }
+                    )
+                ], className="px-4 py-3")
             ], className="clean-card")
         ], width=12, lg=10, xl=8, className="mx-auto")
     ], className="px-3")
 ], fluid=True)
 
-# ==================== 主回调：上传即识别 ====================
+def serve_layout():
+    """每次打开页面时生成新的会话ID，上传和识别结果按会话隔离"""
+    return html.Div([
+        dcc.Store(id='session-id', data=uuid.uuid4().hex),
+        main_layout
+    ])
+
+app.layout = serve_layout
+
+# ==================== 结果展示组件 ====================
+def build_table_row(idx, result, filename):
+    return {
+        "序号": idx + 1,
+        "文件名": result.get("file_name", filename),
+        "项目名称": (result.get("invoice_details") or [{}])[0].get("货物名称", ""),
+        "发票金额": f"¥{result.get('amount_info', {}).get('发票金额', '0.00')}",
+        "发票数量": "1",
+        "销售方": result.get("seller_info", {}).get("名称", ""),
+        "开票日期": result.get("basic_info", {}).get("开票日期", ""),
+        "购买方": result.get("purchaser_info", {}).get("名称", ""),
+        "状态": "✅ 成功" if "error" not in result else "❌ 失败"
+    }
+
+def build_detail_rows(idx, result, filename):
+    # 每条发票明细一行，序号与汇总表一致
+    for line_no, item in enumerate(result.get("invoice_details") or [], 1):
+        yield {
+            "序号": idx + 1,
+            "文件名": result.get("file_name", filename),
+            "发票号码": result.get("basic_info", {}).get("发票号码", ""),
+            "明细行号": line_no,
+            **item
+        }
+
+def build_data_info(results):
+    success_count = sum(1 for r in results if "error" not in r)
+    return html.Div([
+        html.Div([
+            html.I(className="bi bi-info-circle me-2"),
+            f"共处理 {len(results)} 张发票",
+            html.Span(f" • 成功: {success_count}", className="success-color ms-2"),
+            html.Span(f" • 失败: {len(results)-success_count}", className="error-color ms-2")
+        ], className="d-flex align-items-center flex-wrap")
+    ])
+
+def build_job_progress(completed, total):
+    return dbc.Alert([
+        html.Div([
+            html.I(className="bi bi-hourglass me-2"),
+            f"正在处理发票图片，请稍候... ({completed}/{total})"
+        ], className="d-flex align-items-center mb-2"),
+        dbc.Progress(value=completed * 100 / total if total else 100, striped=True, animated=True)
+    ], color="info")
+
+# ==================== 上传预处理：浏览器端缩小图片 ====================
+clientside_callback(
+    ClientsideFunction(namespace='invoice_upload', function_name='prepareUploads'),
+    Output('upload-payload', 'data'),
+    Input('upload-images', 'contents'),
+    State('upload-images', 'filename'),
+    State('client-resize-config', 'data')
+)
+
+# ==================== 缩略图 ====================
+def run_upload_task(ocr_task, image_data, digest, seen_invoices):
+    # 先生成缩略图，识别完成后预览卡片即可引用
+    thumbnail_key = thumbnail_store.add(image_data, digest)
+    result = ocr_task()
+    result["thumbnail_url"] = f"/thumbnails/{thumbnail_key}" if thumbnail_key else None
+    mark_batch_duplicates(result, seen_invoices)
+    return result
+
+# ==================== 重复上传 ====================
+_seen_invoices_lock = threading.Lock()
+
+def mark_batch_duplicates(result, seen_invoices):
+    """
+    识别后按发票代码+号码（与历史记录的 invoice_key 相同）确认重复：
+    同一批上传中已出现过的发票标记duplicate_of，多页文档逐页检查。
+    同一模板、仅号码或金额不同的发票不会被误判，重新拍摄或扫描的同一张发票仍能发现
+
+    Args:
+        result: 一个上传文件的识别结果
+        seen_invoices: 本批上传共用的 {invoice_key: 首次出现的文件名}
+    """
+    for item in result.get("pages") or [result]:
+        key = invoice_key(item)
+        if key is None:
+            continue
+        with _seen_invoices_lock:
+            if key not in seen_invoices:
+                seen_invoices[key] = item.get("file_name")
+                continue
+            first = seen_invoices[key]
+        item.setdefault("duplicate_of", {"file_name": first})
+    if result.get("pages") and not result.get("duplicate_of"):
+        duplicate_of = next((page["duplicate_of"] for page in result["pages"] if page.get("duplicate_of")), None)
+        if duplicate_of:
+            result["duplicate_of"] = duplicate_of
+
+@app.server.route('/thumbnails/<digest>')
+def serve_thumbnail(digest):
+    if len(digest) != 64 or any(c not in '0123456789abcdef' for c in digest):
+        abort(404)
+    found = thumbnail_store.lookup(digest)
+    if found is None:
+        abort(404)
+    path, mimetype = found
+    # 缩略图按内容摘要命名，内容不会变化，可长期缓存
+    return send_file(path, mimetype=mimetype, max_age=365 * 24 * 3600, conditional=True)
+
+# ==================== 主回调：上传后提交后台任务 ====================
 @app.callback(
     [Output('upload-status', 'children'),
      Output('image-previews', 'children'),
-     Output('data-table', 'children'),
+     Output('table-version', 'data'),
      Output('data-info', 'children'),
      Output('copy-btn', 'disabled'),
      Output('download-excel-btn', 'disabled'),
-     Output('action-status', 'children')],
-    Input('upload-images', 'contents'),
-    State('upload-images', 'filename')
+     Output('action-status', 'children'),
+     Output('job-id', 'data'),
+     Output('job-poller', 'disabled'),
+     Output('preview-pagination', 'max_value'),
+     Output('preview-pagination', 'active_page'),
+     Output('preview-pager', 'style')],
+    Input('upload-payload', 'data'),
+    State('session-id', 'data')
 )
-def handle_upload_and_process(contents_list, filename_list):
-    global processed_results, current_df, uploaded_images_data, temp_files
+def handle_upload_and_process(upload_payload, session_id):
+    contents_list = (upload_payload or {}).get('contents')
+    filename_list = (upload_payload or {}).get('filenames')
+    if not contents_list or not session_id:
+        return "", [], dash.no_update, "", True, True, "", None, True, 1, 1, {'display': 'none'}
 
-    if not contents_list:
-        return "", [], dash.no_update, "", True, True, ""
+    # 需要剖析本次上传时开始采样，批次全部完成后写出结果
+    capture = profiler.begin("upload")
 
-    # 清理旧数据
-    for f in temp_files:
-        try:
-            if os.path.exists(f): 
-                os.remove(f)
-        except: 
-            pass
-    temp_files.clear()
-    uploaded_images_data.clear()
-    processed_results.clear()
-
-    ocr_instance = SimpleOCR() if 'SimpleOCR' in globals() else None
-
-    preview_cards = []
-    table_rows = []
-
-    # 显示加载状态
-    status_msg = dbc.Alert([
-        html.I(className="bi bi-hourglass me-2"),
-        "正在处理发票图片，请稍候..."
-    ], color="info", className="d-flex align-items-center")
-
-    # 处理每张图片
-    for idx, (content, filename) in enumerate(zip(contents_list, filename_list)):
-        temp_path = save_base64_image(content, filename)
-        temp_files.append(temp_path)
-        uploaded_images_data.append((temp_path, filename, content))
-
-        result = process_invoice_image(temp_path, ocr_instance)
-        processed_results.append(result)
-
-        # 创建发票预览项
-        if "error" not in result:
-            # 成功识别
-            status_badge = dbc.Badge("成功", className="status-badge bg-success ms-2")
-            details = dbc.Row([                
-                # 第一行：开票日期（普通样式，无框包裹）
-                dbc.Row([
-                    dbc.Col([
-                        html.Div([
-                            html.Strong("开票日期: ", className="me-2"),
-                            html.Span(result["basic_info"].get("开票日期", "—"))
-                        ], className="py-2")
-                    ], xs=12, className="mb-3")
-                ]),
-                # 第而行：第一列发票识别详情（卡片框），第二列销售方和金额（相同格式框）
-                dbc.Row([
-                    # 第一列：发票识别详情（使用卡片框）
-                    dbc.Col([
-                        dbc.Card([
-                            dbc.CardBody([
-                                html.Div([
-                                    html.Small("销售方", className="text-muted d-block mb-2"),
-                                    html.Div([
-                                        html.Span(result["seller_info"].get("名称", "—"), className="fw-bold")
-                                    ], className="mb-1"),
-                                ])
-                            ], className="py-2 px-3")
-                        ], className="h-100")
-                    ], xs=12, md=6, className="mb-3"),
-                    
-                    # 第二列：销售方和金额（相同格式框）
-                    dbc.Col([
-                        dbc.Card([
-                            dbc.CardBody([
-                                html.Div([
-                                    html.Small("发票金额", className="text-muted d-block mb-2"),
-                                    html.Div([
-                                        html.Span("¥", className="me-1"),
-                                        html.Span(result["amount_info"].get("发票金额", "0.00"), 
-                                                className="fw-bold fs-4 success-color")
-                                    ])
-                                ])
-                            ], className="py-2 px-3")
-                        ], className="h-100")
-                    ], xs=12, md=6, className="mb-3")
-                ], className="mb-3"),
-                   
-                # 第三行：备注信息（开户行和账号）
-                dbc.Row([
-                    # 第一列：开户行
-                    dbc.Col([
-                        dbc.Card([
-                            dbc.CardBody([
-                                html.Div([
-                                    html.Small("开户行信息", className="text-muted d-block mb-1"),
-                                    html.Div([
-                                        html.Span(result.get("seller_info", {}).get("开户行", "").split()[0] 
-                                                if result.get("seller_info", {}).get("开户行") 
-                                                else "—")
-                                    ])
-                                ])
-                            ], className="py-2 px-3")
-                        ], className="h-100")
-                    ], xs=12, md=6, className="mb-3"),
-                    
-                    # 第二列：账号
-                    dbc.Col([
-                        dbc.Card([
-                            dbc.CardBody([
-                                html.Div([
-                                    html.Small("银行账号", className="text-muted d-block mb-1"),
-                                    html.Div([
-                                        html.Span(result.get("seller_info", {}).get("银行账号", "").split()[-1] 
-                                                if result.get("seller_info", {}).get("银行账号") 
-                                                else "—")
-                                    ])
-                                ])
-                            ], className="py-2 px-3")
-                        ], className="h-100")
-                    ], xs=12, md=6, className="mb-3")
-                ])
-            ])
-            
-            # 图片列
-            img_section = html.Div([
-                html.Img(src=content, 
-                        style={'maxWidth': '100%', 'maxHeight': '200px', 'objectFit': 'contain'},
-                        className="rounded border"),
-                html.Div([
-                    html.Small(f"{filename}", className="text-muted d-block mt-2 text-center")
-                ])
-            ], className="text-center")
-            
-        else:
-            # 识别失败
-            status_badge = dbc.Badge("失败", className="status-badge bg-danger ms-2")
-            
-            details = html.Div([
-                html.Div([
-                    html.I(className="bi bi-exclamation-triangle me-2 text-warning"),
-                    html.Strong("识别失败", className="error-color")
-                ], className="mb-2"),
-                html.P(result.get("error", "未知错误"), className="text-muted small"),
-                html.Div([
-                    html.Small(f"文件: {filename}", className="text-muted")
-                ], className="mt-2")
-            ], className="py-3")
-            
-            img_section = html.Div([
-                html.Img(src=content, 
-                        style={'maxWidth': '100%', 'maxHeight': '200px', 'objectFit': 'contain', 
-                               'filter': 'grayscale(70%)', 'opacity': '0.7'},
-                        className="rounded border"),
-                html.Div([
-                    html.Small("识别失败", className="text-danger d-block mt-2 text-center")
-                ])
-            ], className="text-center")
-
-        # 发票预览项
-        preview_item = dbc.Row([
-            dbc.Col([
-                html.Div([
-                    html.Div([
-                        html.Div([
-                            html.I(className="bi bi-file-earmark-text me-2"),
-                            html.Strong(f"发票 {idx+1}", className="fs-5")
-                        ], className="d-flex align-items-center"),
-                        status_badge
-                    ], className="d-flex justify-content-between align-items-center mb-3"),
-                    dbc.Row([
-                        dbc.Col(img_section, xs=12, md=4, className="mb-3"),
-                        dbc.Col(details, xs=12, md=8)
-                    ])
-                ], className="invoice-item")
-            ], width=12)
-        ])
+    try:
+        # 清理本会话的旧数据
+        remove_temp_files(session_store.get_state(session_id).get("temp_files", []))
+        uploads = []
+        temp_files = []
 
-        preview_cards.append(preview_item)
+        ocr_instance = get_shared_ocr(cache=ocr_cache) if 'SimpleOCR' in globals() else None
 
-        # 表格数据
-        table_rows.append({
-            "序号": idx + 1,
-            "文件名": result.get("file_name", filename),
-             "项目名称": result.get("invoice_details", [{}])[0].get("货物名称", ""),
-            "发票金额": f"¥{result.get('amount_info', {}).get('发票金额', '0.00')}",
-            "发票数量": "1",
-            "销售方": result.get("seller_info", {}).get("名称", ""),
-            "开票日期": result.get("basic_info", {}).get("开票日期", ""),
-            "购买方": result.get("purchaser_info", {}).get("名称", ""),
-            "状态": "✅ 成功" if "error" not in result else "❌ 失败"
-        })
-
-    current_df = pd.DataFrame(table_rows)
-
-    # 数据表格
-    if not current_df.empty:
-        data_table = dash_table.DataTable(
-            data=current_df.to_dict('records'),
-            columns=[{"name": i, "id": i} for i in current_df.columns],
-            style_cell={
-                'textAlign': 'left',
-                'padding': '12px',
-                'border': '1px solid #e0e0e0',
-                'backgroundColor': 'white'
-            },
-            style_cell_conditional=[
-                {"if": {"column_id": "序号"}, "textAlign": "center", "width": "60px"},
-                {"if": {"column_id": "发票金额"}, "textAlign": "right"},
-                {"if": {"column_id": "状态"}, "textAlign": "center", "width": "80px"},
-            ],
-            style_header={
-                'backgroundColor': '#f8f9fa',
-                'fontWeight': '600',
-                'borderBottom': '2px solid #dee2e6',
-                'textAlign': 'left'
-            },
-            style_data_conditional=[
-                {'if': {'row_index': 'odd'}, 'backgroundColor': '#fafafa'},
-                {'if': {'filter_query': '{状态} = "✅ 成功"'}, 'color': '#198754'},
-                {'if': {'filter_query': '{状态} = "❌ 失败"'}, 'color': '#dc3545'},
-            ],
-            page_size=10,
-            style_table={
-                'overflowX': 'auto',
-                'border': '1px solid #e0e0e0',
-                'borderRadius': '8px'
-            }
+        # 图片直接在内存中提交识别（启用OCR_SPOOL_UPLOADS时先写入临时文件），
+        # 由后台线程池并发执行，页面通过任务ID轮询进度；多页PDF/TIFF每个文件一个任务，在任务中拆分
+        tasks = []
+        seen_invoices = {}
+        for content, filename in zip(contents_list, filename_list):
+            image_data = decode_base64_image(content)
+            digest = ThumbnailStore.hash_bytes(image_data)
+            if os.path.splitext(filename)[1].lower() in PAGED_EXTENSIONS:
+                uploads.append([None, filename, digest])
+                ocr_task = partial(process_document, image_data, filename, ocr_instance)
+            elif OCR_SPOOL_UPLOADS:
+                temp_path = save_image_bytes(image_data, filename)
+                temp_files.append(temp_path)
+                uploads.append([temp_path, filename, digest])
+                ocr_task = partial(process_invoice_image, temp_path, ocr_instance)
+            else:
+                uploads.append([None, filename, digest])
+                ocr_task = partial(process_invoice_bytes, image_data, filename, ocr_instance)
+            tasks.append(partial(run_upload_task, ocr_task, image_data, digest, seen_invoices))
+
+        # 先把任务ID记入会话状态，会话存储只接受当前任务的结果；
+        # 每张发票完成时先写入会话存储，再通知进度，页面刷新时即可读到结果
+        job_id = uuid.uuid4().hex
+        session_store.update_state(session_id, job_id=job_id, uploads=uploads, temp_files=temp_files)
+        job_queue.submit(
+            tasks,
+            meta={"session_id": session_id},
+            on_result=partial(session_store.put_result, session_id),
+            job_id=job_id
         )
+        if capture is not None:
+            job = job_queue.get(job_id)
+            capture.stop_when(lambda: job is None or job.done)
+    except Exception:
+        # 提交任务前出错（如上传内容无法解码）时立即停止剖析，否则会一直采样到超时
+        if capture is not None:
+            capture.stop()
+        raise
+
+    # 先为第一页的发票放置占位卡片，识别完成后按位置替换
+    with metrics.STAGE_SECONDS.time(stage="layout"):
+        status_msg = build_job_progress(0, len(tasks))
+        pending_cards = build_preview_page(uploads, [None] * len(uploads), 1, PREVIEW_PAGE_SIZE)
+    return (status_msg, pending_cards, f"{job_id}:0", "", True, True, "", job_id, False,
+            *preview_pager(len(uploads)))
+
+# ==================== 任务进度展示 ====================
+def preview_pager(total):
+    """预览分页控件的总页数、当前页（回到第一页）和显示样式，只有一页时隐藏"""
+    pages = page_count(total, PREVIEW_PAGE_SIZE)
+    return pages, 1, ({'display': 'none'} if pages <= 1 else {})
+
+def get_session_job(session_id, job_id=None):
+    """
+    读取会话当前任务的上传记录和已完成结果
+
+    Args:
+        session_id: 会话ID
+        job_id: 期望的任务ID，与会话当前任务不一致时视为不存在
+
+    Returns:
+        Tuple[uploads, results]: 上传记录列表和按序号排列的结果（未完成的位置为None）；
+        会话没有对应任务时返回None
+    """
+    state = session_store.get_state(session_id) if session_id else {}
+    if not state.get("job_id") or (job_id is not None and state["job_id"] != job_id):
+        return None
+    uploads = state.get("uploads", [])
+    stored = session_store.get_results(session_id, state["job_id"])
+    return uploads, [stored.get(idx) for idx in range(len(uploads))]
+
+def iter_finished(uploads, results):
+    """
+    按上传顺序列出已完成的发票 (序号, 结果, 文件名)
+
+    多页文档的每页各占一项，序号与文档的预览卡片一致
+    """
+    for idx, ((temp_path, filename, digest), result) in enumerate(zip(uploads, results)):
+        if result is None:
+            continue
+        for item in result.get("pages") or [result]:
+            yield idx, item, filename
+
+def build_session_df(session_id):
+    """按上传顺序生成会话已完成发票的汇总表，没有数据时返回None"""
+    session_job = get_session_job(session_id)
+    if session_job is None:
+        return None
+    return pd.DataFrame([build_table_row(*item) for item in iter_finished(*session_job)])
+
+@metrics.STAGE_SECONDS.time(stage="render")
+def render_job_state(session_id, job_id, card_indices=None, page=1):
+    """
+    根据会话存储中的任务结果生成页面各部分内容。预览只包含第page页的卡片：
+    card_indices为None时重建当前页，否则只用Patch替换当前页中这些位置的卡片，
+    都不在当前页时预览不变；任务不存在时返回None
+    """
+    session_job = get_session_job(session_id, job_id)
+    if session_job is None:
+        return None
+    uploads, results = session_job
+    completed = sum(result is not None for result in results)
+    done = completed == len(uploads)
+
+    finished = [result for idx, result, filename in iter_finished(uploads, results)]
+
+    # 按上传顺序展示当前页，未完成的发票显示占位卡片
+    if card_indices is None:
+        preview_cards = build_preview_page(uploads, results, page, PREVIEW_PAGE_SIZE)
     else:
-        data_table = html.Div("暂无数据", className="text-center py-4 text-muted")
+        start, end = page_bounds(page, len(uploads), PREVIEW_PAGE_SIZE)
+        visible = sorted(idx for idx in card_indices if start <= idx < end and results[idx] is not None)
+        preview_cards = Patch() if visible else dash.no_update
+        for idx in visible:
+            # Patch的位置是卡片在当前页中的位置
+            result = results[idx]
+            preview_cards[idx - start] = build_preview_card(idx, result, result.get("thumbnail_url"), uploads[idx][1])
 
-    # 统计信息
-    success_count = sum(1 for r in processed_results if "error" not in r)
-    info_content = html.Div([
-        html.Div([
-            html.I(className="bi bi-info-circle me-2"),
-            f"共处理 {len(processed_results)} 张发票",
-            html.Span(f" • 成功: {success_count}", className="success-color ms-2"),
-            html.Span(f" • 失败: {len(processed_results)-success_count}", className="error-color ms-2")
-        ], className="d-flex align-items-center flex-wrap")
-    ])
+    # 表格只记录版本号，由 update_results_table 按当前页、排序和筛选取数
+    table_version = f"{job_id}:{completed}"
+    info_content = build_data_info(finished)
+
+    if not done:
+        status = build_job_progress(completed, len(uploads))
+        return status, preview_cards, table_version, info_content, True, True, False
 
     # 最终状态消息
     final_status = dbc.Alert([
         html.I(className="bi bi-check-circle me-2"),
         html.Strong(f"处理完成", className="me-2"),
-        f"成功识别 {len(contents_list)} 张发票"
+        f"成功识别 {len(finished)} 张发票"
     ], color="success", className="d-flex align-items-center")
 
-    return final_status, preview_cards, data_table, info_content, False, False, ""
+    return final_status, preview_cards, table_version, info_content, False, False, True
+
+JOB_OUTPUTS = [
+    Output('upload-status', 'children', allow_duplicate=True),
+    Output('image-previews', 'children', allow_duplicate=True),
+    Output('table-version', 'data', allow_duplicate=True),
+    Output('data-info', 'children', allow_duplicate=True),
+    Output('copy-btn', 'disabled', allow_duplicate=True),
+    Output('download-excel-btn', 'disabled', allow_duplicate=True),
+    Output('job-poller', 'disabled', allow_duplicate=True),
+]
+
+# ==================== 轮询任务进度（推送不可用时的后备） ====================
+@app.callback(
+    JOB_OUTPUTS,
+    Input('job-poller', 'n_intervals'),
+    State('job-id', 'data'),
+    State('session-id', 'data'),
+    State('preview-pagination', 'active_page'),
+    prevent_initial_call=True
+)
+def poll_job_progress(n_intervals, job_id, session_id, page):
+    # 从会话存储读取进度，多进程部署时轮询请求落到任意进程都能得到结果
+    outputs = render_job_state(session_id, job_id, page=page) if job_id else None
+    if outputs is None:
+        status = dbc.Alert("任务不存在或已过期，请重新上传", color="warning")
+        return status, dash.no_update, dash.no_update, dash.no_update, True, True, True
+    return outputs
+
+# ==================== 服务器推送：逐张更新发票 ====================
+@app.server.route('/jobs/<job_id>/events')
+def stream_job_events(job_id):
+    # 只有执行任务的进程能推送进度；其他进程返回404，页面改为轮询会话存储
+    job = job_queue.get(job_id)
+    if job is None:
+        return Response("任务不存在或已过期", status=404)
+    # 连接数已满（或 SSE_MAX_STREAMS=0 关闭推送）时返回503，页面改为轮询
+    if SSE_MAX_STREAMS <= 0 or not _sse_slots.acquire(blocking=False):
+        return Response("推送连接数已满", status=503)
+    response = Response(
+        stream_with_context(iter_job_events(job, max_seconds=SSE_MAX_SECONDS)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # 任务结束、超时或客户端断开后服务器关闭响应时释放名额
+    response.call_on_close(_sse_slots.release)
+    return response
+
+@app.callback(
+    JOB_OUTPUTS,
+    Input('job-event', 'data'),
+    State('job-id', 'data'),
+    State('session-id', 'data'),
+    State('preview-pagination', 'active_page'),
+    prevent_initial_call=True
+)
+def apply_job_event(event, job_id, session_id, page):
+    if not event or event.get("job_id") != job_id:
+        return (dash.no_update,) * len(JOB_OUTPUTS)
+    outputs = render_job_state(session_id, job_id, card_indices=set(event["indices"]), page=page)
+    if outputs is None:
+        return (dash.no_update,) * len(JOB_OUTPUTS)
+    # 推送连接正常时保持轮询关闭，任务结束后确保关闭
+    return outputs[:-1] + (True if outputs[-1] else dash.no_update,)
+
+# 任务ID变化时建立EventSource连接，收到进度事件后写入job-event触发上面的回调；
+# 连接建立后关闭轮询，连接中断时重新打开轮询作为后备
+clientside_callback(
+    """
+    function(jobId) {
+        if (window._invoiceJobSource) {
+            window._invoiceJobSource.close();
+            window._invoiceJobSource = null;
+        }
+        if (!jobId || !window.EventSource) {
+            return 'poll';
+        }
+        const source = new EventSource('/jobs/' + jobId + '/events');
+        window._invoiceJobSource = source;
+        source.onopen = function() {
+            window.dash_clientside.set_props('job-poller', {disabled: true});
+        };
+        source.addEventListener('progress', function(e) {
+            const payload = JSON.parse(e.data);
+            window.dash_clientside.set_props('job-event', {data: payload});
+            if (payload.done) {
+                source.close();
+            }
+        });
+        // 服务器达到单个连接的最长时间后结束推送，改为轮询直到任务完成
+        source.addEventListener('timeout', function() {
+            source.close();
+            if (window._invoiceJobSource === source) {
+                window._invoiceJobSource = null;
+                window.dash_clientside.set_props('job-poller', {disabled: false});
+            }
+        });
+        source.onerror = function() {
+            source.close();
+            if (window._invoiceJobSource === source) {
+                window._invoiceJobSource = null;
+                window.dash_clientside.set_props('job-poller', {disabled: false});
+            }
+        };
+        return 'sse';
+    }
+    """,
+    Output('job-stream-status', 'children'),
+    Input('job-id', 'data')
+)
+
+
+# ==================== 结果表格：服务器端分页、排序和筛选 ====================
+# 按 (会话ID, 表格版本) 缓存汇总表，翻页、排序和筛选时不必重新读取会话存储；
+# 版本号随完成数量变化，新结果写入后自动使用新的汇总表
+TABLE_CACHE_SIZE = 64
+_table_cache = OrderedDict()
+_table_cache_lock = threading.Lock()
+
+def get_table_frame(session_id, table_version):
+    """
+    读取会话的汇总表（带缓存）
+
+    Returns:
+        Tuple[df, pending]: 已完成发票的汇总表（没有数据时为空表）和任务是否仍在识别
+    """
+    key = (session_id, table_version)
+    with _table_cache_lock:
+        if key in _table_cache:
+            _table_cache.move_to_end(key)
+            return _table_cache[key]
+
+    session_job = get_session_job(session_id)
+    pending = session_job is not None and any(result is None for result in session_job[1])
+    df = build_session_df(session_id)
+    entry = (df if df is not None else pd.DataFrame(columns=TABLE_COLUMNS), pending)
+
+    with _table_cache_lock:
+        _table_cache[key] = entry
+        while len(_table_cache) > TABLE_CACHE_SIZE:
+            _table_cache.popitem(last=False)
+    return entry
+
+@app.callback(
+    [Output('results-table', 'data'),
+     Output('results-table', 'page_count'),
+     Output('results-table', 'page_current'),
+     Output('data-table', 'style'),
+     Output('table-placeholder', 'children')],
+    [Input('results-table', 'page_current'),
+     Input('results-table', 'page_size'),
+     Input('results-table', 'sort_by'),
+     Input('results-table', 'filter_query'),
+     Input('table-version', 'data')],
+    State('session-id', 'data')
+)
+def update_results_table(page_current, page_size, sort_by, filter_query, table_version, session_id):
+    df, pending = get_table_frame(session_id, table_version) if session_id else (pd.DataFrame(), False)
+    if df.empty:
+        placeholder = html.Div("正在识别...", className="loading-text") if pending else "暂无数据"
+        return [], 1, 0, {'display': 'none'}, placeholder
+    page, page_count, page_current = query_table(df, page_current, page_size, sort_by, filter_query)
+    # 无法解析的筛选条件不生效，提示用户而不是静默忽略
+    skipped = unparsed_filters(filter_query)
+    notice = html.Small(f"以下筛选条件无法识别，未生效：{'；'.join(skipped)}",
+                        className="text-warning") if skipped else None
+    return page.to_dict('records'), page_count, page_current, {}, notice
 
 # ==================== 复制到剪贴板 ====================
 @app.callback(
     [Output('action-status', 'children', allow_duplicate=True),
      Output('clipboard-text', 'value')],
     Input('copy-btn', 'n_clicks'),
+    State('session-id', 'data'),
     prevent_initial_call=True
 )
-def copy_to_clipboard(n_clicks):
-    global current_df
-    if current_df is None or current_df.empty:
+def copy_to_clipboard(n_clicks, session_id):
+    df = build_session_df(session_id)
+    if df is None or df.empty:
         return dbc.Alert("无数据可复制", color="warning", className="mt-2"), ""
-    text = current_df.to_csv(sep='\t', index=False, encoding='utf-8')
+    text = df.to_csv(sep='\t', index=False, encoding='utf-8')
     msg = dbc.Alert([
         html.I(className="bi bi-check-circle me-2"),
         "表格数据已复制到剪贴板，可直接粘贴到Excel"
@@ -792,21 +1083,85 @@ def copy_to_clipboard(n_clicks):
     return msg, text
 
 # ==================== 下载Excel ====================
+# 下载按钮和数据格式链接直接指向下面的地址，文件由服务器流式生成，不经过回调
 @app.callback(
-    Output("download-excel", "data"),
-    Input('download-excel-btn', 'n_clicks'),
-    prevent_initial_call=True
+    [Output('download-excel-btn', 'href'),
+     Output('export-csv-link', 'href'),
+     Output('export-parquet-link', 'href'),
+     Output('export-arrow-link', 'href')],
+    Input('session-id', 'data')
 )
-def download_excel(n_clicks):
-    global current_df
-    if current_df is None or current_df.empty:
-        return no_update
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        current_df.to_excel(writer, index=False, sheet_name='发票汇总')
-    output.seek(0)
+def set_download_link(session_id):
+    if not session_id:
+        return None, None, None, None
+    return tuple(f"/export/{session_id}/invoices.{fmt}" for fmt in ('xlsx', 'csv', 'parquet', 'arrow'))
+
+def get_finished_results(session_id):
+    """会话当前任务中已完成的 (序号, 结果, 文件名)，会话不存在或没有结果时返回空列表"""
+    session_job = get_session_job(session_id)
+    if session_job is None:
+        return []
+    return list(iter_finished(*session_job))
+
+@app.server.route('/export/<session_id>/invoices.xlsx')
+def export_excel(session_id):
+    finished = get_finished_results(session_id)
+    if not finished:
+        abort(404)
+
+    # 只写模式逐行写入临时文件，汇总表和明细表都按需生成，不在内存中构建整个工作簿
+    path = new_export_path()
+    try:
+        with metrics.STAGE_SECONDS.time(stage="export"):
+            write_workbook(path, [
+                ('发票汇总', TABLE_COLUMNS, (build_table_row(*item) for item in finished)),
+                ('发票明细', DETAIL_COLUMNS, (row for item in finished for row in build_detail_rows(*item))),
+            ])
+    except Exception:
+        os.remove(path)
+        raise
+
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    return dcc.send_bytes(output.getvalue(), f"发票识别结果_{timestamp}.xlsx")
+    disposition = (f"attachment; filename=invoice_{timestamp}.xlsx; "
+                   f"filename*=UTF-8''{quote(f'发票识别结果_{timestamp}.xlsx')}")
+    # 不设置Content-Length，按块发送（分块传输），发送完成后删除临时文件
+    return Response(iter_file_chunks(path), mimetype=XLSX_MIMETYPE,
+                    headers={'Content-Disposition': disposition, 'Cache-Control': 'no-store'})
+
+# ==================== 带类型的数据导出 ====================
+def typed_export_response(fmt, records, basename):
+    # 参数 amounts=float 时Parquet/Arrow的金额为float64，默认为decimal
+    if EXPORT_FORMATS[fmt][2] and not PYARROW_AVAILABLE:
+        return Response(f"导出 {fmt} 需要在服务器上安装 pyarrow", status=501)
+    decimal_amounts = request.args.get('amounts') != 'float'
+    mimetype, headers = export_headers(fmt, basename)
+    return Response(iter_export(fmt, records, decimal_amounts=decimal_amounts),
+                    mimetype=mimetype, headers=headers)
+
+@app.server.route('/export/<session_id>/invoices.<any(csv, parquet, arrow):fmt>')
+def export_typed(session_id, fmt):
+    finished = get_finished_results(session_id)
+    if not finished:
+        abort(404)
+    records = (typed_record(idx + 1, result, filename) for idx, result, filename in finished)
+    return typed_export_response(fmt, records, f"invoices_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+
+# ==================== 预览翻页 ====================
+@app.callback(
+    Output('image-previews', 'children', allow_duplicate=True),
+    Input('preview-pagination', 'active_page'),
+    State('job-id', 'data'),
+    State('session-id', 'data'),
+    prevent_initial_call=True
+)
+def change_preview_page(page, job_id, session_id):
+    # 翻页时才生成该页的卡片，已完成的发票显示结果，其余显示占位卡片
+    session_job = get_session_job(session_id, job_id) if job_id else None
+    if session_job is None:
+        return dash.no_update
+    uploads, results = session_job
+    with metrics.STAGE_SECONDS.time(stage="layout"):
+        return build_preview_page(uploads, results, page, PREVIEW_PAGE_SIZE)
 
 # ==================== 清空所有 ====================
 @app.callback(
@@ -814,31 +1169,144 @@ def download_excel(n_clicks):
      Output('upload-images', 'filename'),
      Output('upload-status', 'children', allow_duplicate=True),
      Output('image-previews', 'children', allow_duplicate=True),
-     Output('data-table', 'children', allow_duplicate=True),
+     Output('table-version', 'data', allow_duplicate=True),
      Output('data-info', 'children', allow_duplicate=True),
      Output('copy-btn', 'disabled', allow_duplicate=True),
      Output('download-excel-btn', 'disabled', allow_duplicate=True),
-     Output('action-status', 'children', allow_duplicate=True)],
+     Output('action-status', 'children', allow_duplicate=True),
+     Output('job-id', 'data', allow_duplicate=True),
+     Output('job-poller', 'disabled', allow_duplicate=True),
+     Output('preview-pagination', 'max_value', allow_duplicate=True),
+     Output('preview-pagination', 'active_page', allow_duplicate=True),
+     Output('preview-pager', 'style', allow_duplicate=True)],
     Input('clear-btn', 'n_clicks'),
+    State('session-id', 'data'),
     prevent_initial_call=True
 )
-def clear_all(n_clicks):
-    global processed_results, current_df, uploaded_images_data, temp_files
-    for f in temp_files:
-        try:
-            if os.path.exists(f): 
-                os.remove(f)
-        except: 
-            pass
-    processed_results = []
-    current_df = None
-    uploaded_images_data = []
-    temp_files = []
+def clear_all(n_clicks, session_id):
+    if session_id:
+        remove_temp_files(session_store.get_state(session_id).get("temp_files", []))
+        session_store.clear(session_id)
     
-    return None, None, "", [], dash.no_update, "", True, True, dbc.Alert([
+    return None, None, "", [], f"cleared:{uuid.uuid4().hex}", "", True, True, dbc.Alert([
         html.I(className="bi bi-check-circle me-2"),
         "已清空所有数据"
-    ], color="info", className="mt-2")
+    ], color="info", className="mt-2"), None, True, *preview_pager(0)
+
+# ==================== 历史记录 ====================
+def parse_history_filters(params):
+    """把查询参数（页面输入框或 /api/history 的参数）转为 InvoiceHistory.query 的条件"""
+    def amount(value):
+        try:
+            return float(value) if value not in (None, "") else None
+        except (TypeError, ValueError):
+            return None
+    return {
+        "invoice_code": params.get("invoice_code") or None,
+        "invoice_number": params.get("invoice_number") or None,
+        "seller_tax_no": params.get("seller_tax_no") or None,
+        "purchaser_tax_no": params.get("purchaser_tax_no") or None,
+        "date_from": params.get("date_from") or None,
+        "date_to": params.get("date_to") or None,
+        "amount_min": amount(params.get("amount_min")),
+        "amount_max": amount(params.get("amount_max")),
+    }
+
+@app.callback(
+    [Output('history-table', 'data'),
+     Output('history-table', 'page_count'),
+     Output('history-table', 'page_current'),
+     Output('history-info', 'children')],
+    [Input('history-search-btn', 'n_clicks'),
+     Input('history-table', 'page_current')],
+    [State('history-invoice-number', 'value'),
+     State('history-seller-tax', 'value'),
+     State('history-purchaser-tax', 'value'),
+     State('history-date-from', 'value'),
+     State('history-date-to', 'value'),
+     State('history-amount-min', 'value'),
+     State('history-amount-max', 'value')]
+)
+def search_history(n_clicks, page_current, invoice_number, seller_tax_no, purchaser_tax_no,
+                   date_from, date_to, amount_min, amount_max):
+    if invoice_history is None:
+        return [], 1, 0, "历史记录未启用（HISTORY_ENABLED=0）"
+    # 点击查询时回到第一页
+    if dash.ctx.triggered_id == 'history-search-btn':
+        page_current = 0
+    page_current = max(0, page_current or 0)
+    filters = parse_history_filters({
+        "invoice_number": invoice_number, "seller_tax_no": seller_tax_no, "purchaser_tax_no": purchaser_tax_no,
+        "date_from": date_from, "date_to": date_to, "amount_min": amount_min, "amount_max": amount_max,
+    })
+    start = time.perf_counter()
+    rows, total = invoice_history.query(**filters, limit=HISTORY_PAGE_SIZE, offset=page_current * HISTORY_PAGE_SIZE)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    for row in rows:
+        row["amount"] = f"¥{row['amount']:,.2f}" if row["amount"] is not None else ""
+        row["recognized_at"] = datetime.fromtimestamp(row["recognized_at"]).strftime("%Y-%m-%d %H:%M")
+    page_count = max(1, -(-total // HISTORY_PAGE_SIZE))
+    return rows, page_count, page_current, f"共 {total} 条记录，查询耗时 {elapsed_ms:.1f} 毫秒"
+
+if invoice_history is not None:
+    @app.server.route('/api/history')
+    def api_history():
+        # 参数同 InvoiceHistory.query，另有 limit（最多1000）和 offset
+        filters = parse_history_filters(request.args)
+        limit = min(max(1, request.args.get('limit', 100, type=int)), 1000)
+        offset = max(0, request.args.get('offset', 0, type=int))
+        items, total = invoice_history.query(**filters, limit=limit, offset=offset)
+        return jsonify({"total": total, "items": items})
+
+    @app.server.route('/api/history/export.<any(csv, parquet, arrow):fmt>')
+    def api_history_export(fmt):
+        # 导出符合条件的全部历史记录，按记录ID分批读取，index列为记录ID
+        filters = parse_history_filters(request.args)
+        records = (typed_record(record_id, result) for record_id, result in invoice_history.iter_results(**filters))
+        return typed_export_response(fmt, records, f"invoice_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+
+    @app.server.route('/api/history/<int:record_id>')
+    def api_history_record(record_id):
+        # raw=1 时同时返回阿里云原始数据
+        record = invoice_history.get(record_id, include_raw=request.args.get('raw') == '1')
+        if record is None:
+            abort(404)
+        return jsonify(record)
+
+# ==================== 性能指标 ====================
+if METRICS_ENABLED:
+    @app.server.route('/metrics')
+    def serve_metrics():
+        # Prometheus文本格式，指标为本进程的累计值
+        return Response(metrics.render(), content_type=metrics.CONTENT_TYPE,
+                        headers={'Cache-Control': 'no-cache'})
+
+# ==================== 性能剖析（管理员） ====================
+if profiler.token:
+    def check_profile_token():
+        # 令牌错误时返回404，不暴露管理地址
+        token = request.headers.get('X-Profile-Token') or request.args.get('token')
+        if not profiler.check_token(token):
+            abort(404)
+
+    @app.server.route('/admin/profile', methods=['GET', 'POST'])
+    def admin_profile():
+        # GET查看状态；POST uploads=N 剖析接下来的N次上传，uploads=0 取消
+        check_profile_token()
+        if request.method == 'POST':
+            try:
+                profiler.arm(int(request.values.get('uploads', '1')))
+            except ValueError:
+                abort(400)
+        return jsonify(profiler.status())
+
+    @app.server.route('/admin/profile/files/<name>')
+    def admin_profile_file(name):
+        check_profile_token()
+        if name not in profiler.status()["files"]:
+            abort(404)
+        return send_file(os.path.join(profiler.output_dir, name), mimetype='text/plain',
+                         as_attachment=True, download_name=name)
 
 # ==================== 客户端复制提示 ====================
 clientside_callback(
@@ -860,6 +1328,12 @@ clientside_callback(
 )
 
 if __name__ == '__main__':
+    # 启动时创建共享OCR客户端，避免首批上传承担初始化开销
+    if 'SimpleOCR' in globals():
+        try:
+            get_shared_ocr(cache=ocr_cache)
+        except ValueError as e:
+            print(f"OCR客户端初始化失败: {e}")
     print("="*50)
     print("发票OCR识别工具启动成功！")
     print("访问地址：http://localhost:8050")
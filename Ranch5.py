@@ -6,9 +6,16 @@ Author: Your Name
 Version: 2.0.1 - 修复错误处理
 """
 
+import asyncio
+import glob
+import io
+import json
 import os
 import sys
-from typing import Dict, Optional, Tuple, Any
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Any, AsyncIterator, Iterable, TextIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from alibabacloud_ocr_api20210707.client import Client as OcrClient
 from alibabacloud_tea_openapi import models as open_api_models
@@ -16,23 +23,82 @@ from alibabacloud_darabonba_stream.client import Client as StreamClient
 from alibabacloud_ocr_api20210707 import models as ocr_api_20210707_models
 from alibabacloud_tea_util import models as util_models
 
+from document_pages import MAX_REQUEST_MB, PAGED_EXTENSIONS, DocumentTooLarge, mmap_file, plan_pages
+from metrics import API_BYTES_SENT, API_ERRORS, CACHE_LOOKUPS, RECOGNITIONS, STAGE_SECONDS
+from ocr_cache import OCRCache, cache_from_env
+from rate_limit import DeadlineExceeded, OCRRateLimiter, get_shared_rate_limiter, is_throttling_error
+from resilience import (CircuitBreaker, RetryPolicy, get_shared_circuit_breaker, is_retryable,
+                        retry_policy_from_env)
+
+
+# 支持的文件格式
+VALID_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.pdf']
+
+# 常见文件格式的文件头，用于文件名缺少扩展名时识别格式
+_MAGIC_EXTENSIONS = [
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'BM', '.bmp'),
+    (b'II*\x00', '.tif'),
+    (b'MM\x00*', '.tif'),
+    (b'%PDF', '.pdf'),
+]
+
+
+def _env_int(name: str, default: int) -> int:
+    """读取整数类型的环境变量"""
+    value = os.environ.get(name)
+    return int(value) if value else default
+
 
 class SimpleOCR:
     """阿里云OCR简化类 - 只返回原始数据"""
     
     def __init__(self, access_key_id: str = None, access_key_secret: str = None, 
-                 endpoint: str = 'ocr-api.cn-hangzhou.aliyuncs.com'):
+                 endpoint: str = None, protocol: str = None,
+                 cache: Optional[OCRCache] = None,
+                 connect_timeout: int = None, read_timeout: int = None,
+                 max_idle_conns: int = None, keep_alive: bool = None,
+                 rate_limiter: Optional[OCRRateLimiter] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 page_workers: int = None, max_document_mb: int = None):
         """
         初始化OCR客户端
         
         Args:
             access_key_id: AccessKey ID，如果为None则从环境变量获取
             access_key_secret: AccessKey Secret，如果为None则从环境变量获取
-            endpoint: API端点，默认为发票OCR服务端点
+            endpoint: API端点，默认取环境变量OCR_ENDPOINT或发票OCR服务端点
+            protocol: 请求协议（HTTPS或HTTP），默认取环境变量OCR_PROTOCOL或HTTPS；
+                连接本地模拟服务（见benchmarks/mock_ocr_server.py）时设为HTTP
+            cache: OCR结果缓存，命中时不再调用API
+            connect_timeout: 连接超时(毫秒)，默认取环境变量OCR_CONNECT_TIMEOUT_MS或5000
+            read_timeout: 读取超时(毫秒)，默认取环境变量OCR_READ_TIMEOUT_MS或15000
+            max_idle_conns: 连接池保留的空闲连接数，默认取环境变量OCR_MAX_IDLE_CONNS或32
+            keep_alive: 是否复用HTTP连接，默认取环境变量OCR_KEEP_ALIVE或启用
+            rate_limiter: 接口限流器，默认使用进程内共享的限流器（见rate_limit.py）
+            retry_policy: 可重试失败的重试策略，默认按环境变量创建（见resilience.py）
+            circuit_breaker: 熔断器，默认使用进程内共享的熔断器
+            page_workers: 识别多页文档时同时在途的页数，默认取环境变量OCR_PAGE_WORKERS或8
+            max_document_mb: 多页文档整体的大小上限(MB)，默认取环境变量OCR_MAX_DOCUMENT_MB或100
         """
         self.access_key_id = access_key_id
         self.access_key_secret = access_key_secret
-        self.endpoint = endpoint
+        self.endpoint = endpoint or os.environ.get('OCR_ENDPOINT') or 'ocr-api.cn-hangzhou.aliyuncs.com'
+        self.protocol = protocol or os.environ.get('OCR_PROTOCOL') or None
+        self.cache = cache
+        self.connect_timeout = connect_timeout or _env_int('OCR_CONNECT_TIMEOUT_MS', 5000)
+        self.read_timeout = read_timeout or _env_int('OCR_READ_TIMEOUT_MS', 15000)
+        self.max_idle_conns = max_idle_conns or _env_int('OCR_MAX_IDLE_CONNS', 32)
+        if keep_alive is None:
+            keep_alive = os.environ.get('OCR_KEEP_ALIVE', '1') != '0'
+        self.keep_alive = keep_alive
+        self.rate_limiter = rate_limiter or get_shared_rate_limiter()
+        self.retry_policy = retry_policy or retry_policy_from_env()
+        self.circuit_breaker = circuit_breaker or get_shared_circuit_breaker()
+        self.page_workers = page_workers or _env_int('OCR_PAGE_WORKERS', 8)
+        self.max_document_mb = max_document_mb or _env_int('OCR_MAX_DOCUMENT_MB', 100)
         self.client = None
         self._init_client()
     
@@ -47,13 +113,124 @@ class SimpleOCR:
         # 创建配置
         config = open_api_models.Config(
             access_key_id=ak_id,
-            access_key_secret=ak_secret
+            access_key_secret=ak_secret,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+            max_idle_conns=self.max_idle_conns
         )
         config.endpoint = self.endpoint
+        if self.protocol:
+            config.protocol = self.protocol
         
         # 创建客户端
         self.client = OcrClient(config)
     
+    def _build_runtime(self, deadline: Optional[float] = None) -> util_models.RuntimeOptions:
+        """
+        创建单次调用的运行时参数
+        
+        Args:
+            deadline: 调用截止时间(time.monotonic()时间戳)，超时时间不会超过剩余时间
+            
+        Returns:
+            RuntimeOptions: 运行时参数
+        """
+        connect_timeout = self.connect_timeout
+        read_timeout = self.read_timeout
+        
+        if deadline is not None:
+            remaining_ms = int((deadline - time.monotonic()) * 1000)
+            if remaining_ms <= 0:
+                raise DeadlineExceeded("已超过调用截止时间，未发送请求")
+            connect_timeout = min(connect_timeout, remaining_ms)
+            read_timeout = min(read_timeout, remaining_ms)
+        
+        return util_models.RuntimeOptions(
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            max_idle_conns=self.max_idle_conns,
+            keep_alive=self.keep_alive
+        )
+    
+    def _call_api(self, recognize_invoice_request, deadline: Optional[float] = None,
+                  result: Optional[Dict[str, Any]] = None):
+        """
+        调用识别接口，可重试的失败按重试策略退避后重试
+        
+        Args:
+            recognize_invoice_request: 识别请求
+            deadline: 调用方的截止时间，与重试时间预算取较早者
+            result: 识别结果，多次尝试时写入 attempts
+        """
+        deadline = self.retry_policy.deadline(deadline)
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return self._call_api_once(recognize_invoice_request, deadline)
+            except Exception as e:
+                delay = self.retry_policy.next_delay(attempt, e, deadline)
+                if delay is None:
+                    raise
+            finally:
+                if result is not None and attempt > 1:
+                    result["attempts"] = attempt
+            time.sleep(delay)
+            self._rewind_body(recognize_invoice_request)
+    
+    @staticmethod
+    def _rewind_body(recognize_invoice_request):
+        """重试前把请求体移回开头，否则重试发送的是已读到末尾的空内容"""
+        body = recognize_invoice_request.body
+        if body is not None and hasattr(body, 'seek'):
+            body.seek(0)
+    
+    @staticmethod
+    def _body_size(body) -> int:
+        """请求体的字节数（内存数据或文件流），无法获取时为0"""
+        if isinstance(body, io.BytesIO):
+            return body.getbuffer().nbytes
+        try:
+            return os.fstat(body.fileno()).st_size
+        except (AttributeError, OSError, ValueError):
+            return 0
+    
+    def _call_api_once(self, recognize_invoice_request, deadline: Optional[float]):
+        """经过熔断器和限流器调用一次识别接口"""
+        self.circuit_breaker.before_call()
+        try:
+            started_at = self.rate_limiter.acquire(deadline)
+            try:
+                runtime = self._build_runtime(deadline)
+            except BaseException:
+                self.rate_limiter.cancel()
+                raise
+        except BaseException:
+            self.circuit_breaker.cancel()
+            raise
+        API_BYTES_SENT.inc(self._body_size(recognize_invoice_request.body))
+        try:
+            response = self.client.recognize_invoice_with_options(
+                recognize_invoice_request, runtime
+            )
+        except BaseException as e:
+            self._finish_call(started_at, e)
+            raise
+        self._finish_call(started_at)
+        return response
+    
+    def _finish_call(self, started_at: float, error: Optional[BaseException] = None):
+        """请求结束后更新限流器、熔断器和性能指标"""
+        STAGE_SECONDS.observe(time.monotonic() - started_at, stage="api_call")
+        if error is not None:
+            API_ERRORS.inc(code=getattr(error, 'code', None) or type(error).__name__)
+        self.rate_limiter.release(started_at, error)
+        if error is None or isinstance(error, Exception):
+            self.circuit_breaker.record(error)
+        else:
+            # 被取消或中断的请求不能说明接口是否可用
+            self.circuit_breaker.cancel()
+    
     def _get_credentials(self) -> Tuple[str, str]:
         """
         获取AccessKey凭证
@@ -75,7 +252,8 @@ class SimpleOCR:
         # 返回空值
         return None, None
     
-    def validate_file(self, file_path: str, max_size_mb: int = 10) -> Dict[str, Any]:
+    @STAGE_SECONDS.time(stage="validate")
+    def validate_file(self, file_path: str, max_size_mb: int = MAX_REQUEST_MB) -> Dict[str, Any]:
         """
         验证文件是否有效，返回验证结果
         
@@ -115,7 +293,7 @@ class SimpleOCR:
                 return result
             
             # 检查文件扩展名
-            valid_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.pdf']
+            valid_extensions = VALID_EXTENSIONS
             file_ext = os.path.splitext(file_path)[1].lower()
             result["file_extension"] = file_ext
             
@@ -132,90 +310,378 @@ class SimpleOCR:
             result["message"] = f"文件验证过程中发生错误: {str(e)}"
             return result
     
-    def recognize_invoice_raw(self, file_path: str, validate: bool = True) -> Dict[str, Any]:
+    @STAGE_SECONDS.time(stage="validate")
+    def validate_bytes(self, data: bytes, filename: str, max_size_mb: int = MAX_REQUEST_MB) -> Dict[str, Any]:
+        """
+        验证内存中的文件内容是否有效，返回验证结果
+        
+        Args:
+            data: 文件内容
+            filename: 文件名，用于判断格式；缺少扩展名时按文件头识别
+            max_size_mb: 最大文件大小(MB)
+            
+        Returns:
+            Dict: 验证结果，结构与 validate_file 相同
+        """
+        result = {
+            "valid": False,
+            "message": "",
+            "file_size_mb": 0,
+            "file_extension": ""
+        }
+        
+        if not data:
+            result["message"] = f"文件内容为空: {filename}"
+            return result
+        
+        # 检查文件大小
+        result["file_size_mb"] = len(data) / 1024 / 1024
+        if len(data) > max_size_mb * 1024 * 1024:
+            result["message"] = f"文件过大 ({result['file_size_mb']:.2f}MB)，请使用小于{max_size_mb}MB的文件"
+            return result
+        
+        # 检查文件扩展名，文件名没有扩展名时按文件头识别
+        file_ext = os.path.splitext(filename or "")[1].lower()
+        if not file_ext:
+            file_ext = next((ext for magic, ext in _MAGIC_EXTENSIONS if data.startswith(magic)), "")
+        result["file_extension"] = file_ext
+        
+        if file_ext not in VALID_EXTENSIONS:
+            result["message"] = f"不支持的文件格式: {file_ext}，支持的格式: {', '.join(VALID_EXTENSIONS)}"
+            return result
+        
+        # 验证通过
+        result["valid"] = True
+        result["message"] = "文件验证通过"
+        return result
+    
+    def recognize_invoice_raw(self, file_path: str, validate: bool = True,
+                              deadline: Optional[float] = None) -> Dict[str, Any]:
         """
         识别发票图片，返回原始数据
         
         Args:
             file_path: 图片文件路径
             validate: 是否验证文件
+            deadline: 调用截止时间(time.monotonic()时间戳)，None表示只受超时配置限制
             
         Returns:
             Dict: 包含识别结果或错误信息
                 - 成功: {"success": True, "data": raw_data, "file_info": {...}}
                 - 失败: {"success": False, "error": error_message, "file_info": {...}}
+                - 命中缓存时额外包含 "cache_hit": True
         """
-        result = {
-            "success": False,
-            "file_info": {
-                "path": file_path,
-                "exists": os.path.exists(file_path) if os.path.exists(file_path) else False
-            }
-        }
+        result = self._new_result(file_path)
         
         try:
-            # 文件验证
-            if validate:
-                validation = self.validate_file(file_path)
-                result["validation"] = validation
-                
-                if not validation["valid"]:
-                    result["error"] = validation["message"]
-                    return result
-            
-            # 读取文件
-            body_stream = StreamClient.read_from_file_path(file_path)
+            recognize_invoice_request, digest = self._prepare_request(file_path, validate, result)
+            if recognize_invoice_request is None:
+                return result
             
-            # 创建请求
-            recognize_invoice_request = ocr_api_20210707_models.RecognizeInvoiceRequest(
-                body=body_stream
-            )
+            # 调用API
+            response = self._call_api(recognize_invoice_request, deadline, result)
             
-            runtime = util_models.RuntimeOptions()
+            self._handle_response(result, response, digest, file_path)
+            return result
             
-            # 调用API
-            response = self.client.recognize_invoice_with_options(
-                recognize_invoice_request, runtime
-            )
+        except Exception as e:
+            result["error"] = self._build_error_info(e)
+            return result
+        finally:
+            self._record_outcome(result)
+    
+    def recognize_invoice_bytes(self, data: bytes, filename: str = "invoice.jpg", validate: bool = True,
+                                deadline: Optional[float] = None, page_no: Optional[int] = None) -> Dict[str, Any]:
+        """
+        识别内存中的发票图片，不经过临时文件
+        
+        Args:
+            data: 图片文件内容
+            filename: 文件名，用于格式验证和结果展示
+            validate: 是否验证文件
+            deadline: 调用截止时间(time.monotonic()时间戳)
+            page_no: PDF/TIFF中要识别的页码，None表示由接口识别第一页
             
-            # 转换为字典
-            raw_data = response.body.to_map()
+        Returns:
+            Dict: 与 recognize_invoice_raw 的返回结构相同，file_info 中 path 为 None
+        """
+        result = self._new_bytes_result(data, filename)
+        
+        try:
+            recognize_invoice_request, digest = self._prepare_bytes_input(data, filename, validate, result,
+                                                                         page_no)
+            if recognize_invoice_request is None:
+                return result
             
-            # 成功返回
-            result["success"] = True
-            result["data"] = raw_data
+            # 调用API
+            response = self._call_api(recognize_invoice_request, deadline, result)
             
-            # 添加文件信息
-            if os.path.exists(file_path):
-                result["file_info"]["size_bytes"] = os.path.getsize(file_path)
-                result["file_info"]["size_mb"] = os.path.getsize(file_path) / 1024 / 1024
-                result["file_info"]["extension"] = os.path.splitext(file_path)[1].lower()
+            self._handle_response(result, response, digest, None)
+            return result
             
+        except Exception as e:
+            result["error"] = self._build_error_info(e)
             return result
+        finally:
+            self._record_outcome(result)
+    
+    def recognize_document(self, file_path: str, validate: bool = True, deadline: Optional[float] = None,
+                           max_workers: int = None) -> Dict[str, Any]:
+        """
+        识别可能包含多张发票的多页PDF/TIFF，各页并发识别后按页码合并
+        
+        文件以内存映射方式读取；安装pypdf/Pillow时在本地拆分为单页后分别发送，
+        否则每页发送整个文件并指定页码（此时文件需小于单次请求的大小上限）。
+        单页文档和图片按 recognize_invoice_raw 识别，返回结构不变。
+        
+        Args:
+            file_path: 文件路径
+            validate: 是否验证文件
+            deadline: 调用截止时间(time.monotonic()时间戳)，所有页共用
+            max_workers: 同时在途的页数，默认为 self.page_workers
             
+        Returns:
+            Dict: 多页文档返回
+                {"success": 任一页成功, "page_count": 页数, "split": "local"或"page_no",
+                 "pages": [{"page_no": 页码, "success": ..., "data"或"error": ...}, ...],
+                 "failed_pages": [失败的页码], "file_info": {...}}
+        """
+        if os.path.splitext(file_path)[1].lower() not in PAGED_EXTENSIONS:
+            return self.recognize_invoice_raw(file_path, validate, deadline)
+        
+        result = self._new_result(file_path)
+        if validate:
+            validation = self.validate_file(file_path, max_size_mb=self.max_document_mb)
+            result["validation"] = validation
+            if not validation["valid"]:
+                result["error"] = validation["message"]
+                return result
+        
+        try:
+            with mmap_file(file_path) as buf:
+                mode, pages = plan_pages(buf, file_path)
+                if mode == "page_no":
+                    # 各页共用映射内容的视图，关闭映射前识别完并释放视图
+                    with pages[0].data:
+                        self._recognize_pages(result, mode, pages, validate, deadline, max_workers)
+        except DocumentTooLarge as e:
+            result["error"] = str(e)
+            return result
         except Exception as e:
-            # 错误处理 - 确保error字段是字典
-            error_info = {
-                "type": type(e).__name__,
-                "message": str(e)
+            result["error"] = self._build_error_info(e)
+            return result
+        
+        if mode == "single":
+            single = self.recognize_invoice_raw(file_path, validate, deadline)
+            single["page_count"] = 1
+            return single
+        
+        if mode == "local":
+            self._recognize_pages(result, mode, pages, validate, deadline, max_workers)
+        self._add_file_info(result, file_path)
+        return result
+    
+    def _recognize_pages(self, result: Dict[str, Any], mode: str, pages: List[Any], validate: bool,
+                         deadline: Optional[float], max_workers: Optional[int]):
+        """并发识别各页（见 document_pages.plan_pages），按页码顺序合并到result"""
+        def recognize_page(page):
+            page_result = self.recognize_invoice_bytes(page.data, page.filename, validate, deadline,
+                                                       page_no=page.request_page_no)
+            merged = {"page_no": page.page_no, "success": page_result["success"]}
+            if page_result["success"]:
+                merged["data"] = page_result["data"]
+                if page_result.get("cache_hit"):
+                    merged["cache_hit"] = True
+            else:
+                merged["error"] = page_result.get("error")
+            return merged
+        
+        workers = max(1, min(len(pages), max_workers or self.page_workers))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr-page") as executor:
+            page_results = list(executor.map(recognize_page, pages))
+        
+        failed_pages = [page["page_no"] for page in page_results if not page["success"]]
+        result.update({
+            "success": len(failed_pages) < len(page_results),
+            "page_count": len(page_results),
+            "split": mode,
+            "pages": page_results,
+            "failed_pages": failed_pages,
+        })
+        if all(page.get("cache_hit") for page in page_results):
+            result["cache_hit"] = True
+        if not result["success"]:
+            result["error"] = page_results[0]["error"]
+    
+    @staticmethod
+    def _record_outcome(result: Dict[str, Any]):
+        """按识别结果累计完成数"""
+        if result.get("cache_hit"):
+            status = "cache_hit"
+        else:
+            status = "success" if result.get("success") else "failed"
+        RECOGNITIONS.inc(status=status)
+    
+    @staticmethod
+    def _new_result(file_path: str) -> Dict[str, Any]:
+        """创建识别结果的初始结构"""
+        return {
+            "success": False,
+            "file_info": {
+                "path": file_path,
+                "exists": os.path.exists(file_path) if os.path.exists(file_path) else False
             }
+        }
+    
+    @staticmethod
+    def _new_bytes_result(data: bytes, filename: str) -> Dict[str, Any]:
+        """创建内存识别结果的初始结构"""
+        return {
+            "success": False,
+            "file_info": {
+                "path": None,
+                "name": filename,
+                "size_bytes": len(data),
+                "size_mb": len(data) / 1024 / 1024,
+                "extension": os.path.splitext(filename or "")[1].lower()
+            }
+        }
+    
+    def _prepare_request(self, file_path: str, validate: bool, result: Dict[str, Any]):
+        """
+        验证文件、查询缓存并创建识别请求
+        
+        Args:
+            file_path: 图片文件路径
+            validate: 是否验证文件
+            result: 识别结果，验证失败或命中缓存时直接写入
             
-            # 添加阿里云API特定的错误信息
-            try:
-                if hasattr(e, 'message'):
-                    error_info["api_message"] = str(e.message)
-                
-                if hasattr(e, 'code'):
-                    error_info["api_code"] = str(e.code)
-                
-                if hasattr(e, 'data') and isinstance(e.data, dict):
-                    error_info["api_data"] = e.data
-            except:
-                # 忽略提取错误信息的异常
-                pass
+        Returns:
+            Tuple[request, digest]: 无需调用API时request为None
+        """
+        # 文件验证
+        if validate:
+            validation = self.validate_file(file_path)
+            result["validation"] = validation
             
-            result["error"] = error_info
-            return result
+            if not validation["valid"]:
+                result["error"] = validation["message"]
+                return None, None
+        
+        # 启用缓存时需要文件内容计算摘要，读入内存后按字节处理
+        if self.cache is not None:
+            with open(file_path, 'rb') as f:
+                file_bytes = f.read()
+            recognize_invoice_request, digest = self._prepare_bytes_request(file_bytes, result)
+            if recognize_invoice_request is None:
+                self._add_file_info(result, file_path)
+            return recognize_invoice_request, digest
+        
+        # 读取文件
+        body_stream = StreamClient.read_from_file_path(file_path)
+        
+        # 创建请求
+        recognize_invoice_request = ocr_api_20210707_models.RecognizeInvoiceRequest(
+            body=body_stream
+        )
+        return recognize_invoice_request, None
+    
+    def _prepare_bytes_input(self, data: bytes, filename: str, validate: bool, result: Dict[str, Any],
+                             page_no: Optional[int] = None):
+        """验证内存数据、查询缓存并创建识别请求，返回值同 _prepare_request"""
+        if validate:
+            validation = self.validate_bytes(data, filename)
+            result["validation"] = validation
+            
+            if not validation["valid"]:
+                result["error"] = validation["message"]
+                return None, None
+        
+        return self._prepare_bytes_request(data, result, page_no)
+    
+    def _prepare_bytes_request(self, data: bytes, result: Dict[str, Any], page_no: Optional[int] = None):
+        """
+        按内容摘要查询缓存，未命中时用内存数据创建识别请求
+        
+        Args:
+            data: 文件内容
+            result: 识别结果，命中缓存时直接写入
+            page_no: 请求中指定的页码，同一文件不同页分别缓存
+            
+        Returns:
+            Tuple[request, digest]: 命中缓存时request为None；未启用缓存时digest为None
+        """
+        digest = None
+        if self.cache is not None:
+            digest = OCRCache.hash_bytes(data)
+            if page_no is not None:
+                digest = f"{digest}:p{page_no}"
+            cached_data = self.cache.get(digest)
+            CACHE_LOOKUPS.inc(result="miss" if cached_data is None else "hit")
+            if cached_data is not None:
+                result["success"] = True
+                result["data"] = cached_data
+                result["cache_hit"] = True
+                return None, digest
+        
+        recognize_invoice_request = ocr_api_20210707_models.RecognizeInvoiceRequest(
+            body=io.BytesIO(data),
+            page_no=page_no
+        )
+        return recognize_invoice_request, digest
+    
+    def _handle_response(self, result: Dict[str, Any], response, digest: Optional[str],
+                         file_path: Optional[str]):
+        """将API响应写入识别结果，并更新缓存"""
+        # 转换为字典
+        raw_data = response.body.to_map()
+        if digest is not None:
+            self.cache.set(digest, raw_data)
+        
+        # 成功返回
+        result["success"] = True
+        result["data"] = raw_data
+        
+        # 添加文件信息
+        if file_path is not None:
+            self._add_file_info(result, file_path)
+    
+    @staticmethod
+    def _build_error_info(e: Exception) -> Dict[str, Any]:
+        """错误处理 - 确保error字段是字典"""
+        error_info = {
+            "type": type(e).__name__,
+            "message": str(e)
+        }
+        
+        # 添加阿里云API特定的错误信息
+        try:
+            if hasattr(e, 'message'):
+                error_info["api_message"] = str(e.message)
+            
+            if hasattr(e, 'code'):
+                error_info["api_code"] = str(e.code)
+            
+            if hasattr(e, 'data') and isinstance(e.data, dict):
+                error_info["api_data"] = e.data
+            
+            if is_throttling_error(e):
+                error_info["throttled"] = True
+            
+            error_info["retryable"] = is_retryable(e)
+        except:
+            # 忽略提取错误信息的异常
+            pass
+        
+        return error_info
+    
+    @staticmethod
+    def _add_file_info(result: Dict[str, Any], file_path: str):
+        """向识别结果中添加文件大小和扩展名"""
+        if os.path.exists(file_path):
+            result["file_info"]["size_bytes"] = os.path.getsize(file_path)
+            result["file_info"]["size_mb"] = os.path.getsize(file_path) / 1024 / 1024
+            result["file_info"]["extension"] = os.path.splitext(file_path)[1].lower()
     
     def check_credentials(self) -> Dict[str, Any]:
         """
@@ -275,7 +741,7 @@ class SimpleOCR:
         print("=" * 60)
         
         if result.get("success", False):
-            print("✓ 识别成功")
+            print("✓ 识别成功" + ("（缓存结果，未调用接口）" if result.get("cache_hit") else ""))
             
             if verbose:
                 print(f"\n文件信息:")
@@ -351,6 +817,347 @@ class SimpleOCR:
         print("\n" + "=" * 60)
 
 
+class AsyncSimpleOCR(SimpleOCR):
+    """基于asyncio的OCR类 - 使用SDK的异步接口，单进程内可保持大量请求在途"""
+    
+    async def _call_api_async(self, recognize_invoice_request, deadline: Optional[float] = None,
+                              result: Optional[Dict[str, Any]] = None):
+        """_call_api 的异步版本，等待限流和退避时不阻塞事件循环"""
+        deadline = self.retry_policy.deadline(deadline)
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await self._call_api_once_async(recognize_invoice_request, deadline)
+            except Exception as e:
+                delay = self.retry_policy.next_delay(attempt, e, deadline)
+                if delay is None:
+                    raise
+            finally:
+                if result is not None and attempt > 1:
+                    result["attempts"] = attempt
+            await asyncio.sleep(delay)
+            self._rewind_body(recognize_invoice_request)
+    
+    async def _call_api_once_async(self, recognize_invoice_request, deadline: Optional[float]):
+        """_call_api_once 的异步版本"""
+        self.circuit_breaker.before_call()
+        try:
+            started_at = await self.rate_limiter.acquire_async(deadline)
+            try:
+                runtime = self._build_runtime(deadline)
+            except BaseException:
+                self.rate_limiter.cancel()
+                raise
+        except BaseException:
+            self.circuit_breaker.cancel()
+            raise
+        API_BYTES_SENT.inc(self._body_size(recognize_invoice_request.body))
+        try:
+            response = await self.client.recognize_invoice_with_options_async(
+                recognize_invoice_request, runtime
+            )
+        except BaseException as e:
+            self._finish_call(started_at, e)
+            raise
+        self._finish_call(started_at)
+        return response
+    
+    async def recognize_invoice_raw_async(self, file_path: str, validate: bool = True,
+                                          deadline: Optional[float] = None) -> Dict[str, Any]:
+        """
+        异步识别发票图片，返回原始数据
+        
+        Args:
+            file_path: 图片文件路径
+            validate: 是否验证文件
+            deadline: 调用截止时间(time.monotonic()时间戳)
+            
+        Returns:
+            Dict: 与 recognize_invoice_raw 的返回结构相同
+        """
+        result = self._new_result(file_path)
+        
+        try:
+            recognize_invoice_request, digest = self._prepare_request(file_path, validate, result)
+            if recognize_invoice_request is None:
+                return result
+            
+            # 调用异步API
+            response = await self._call_api_async(recognize_invoice_request, deadline, result)
+            
+            self._handle_response(result, response, digest, file_path)
+            return result
+            
+        except Exception as e:
+            result["error"] = self._build_error_info(e)
+            return result
+        finally:
+            self._record_outcome(result)
+    
+    async def recognize_invoice_bytes_async(self, data: bytes, filename: str = "invoice.jpg",
+                                            validate: bool = True,
+                                            deadline: Optional[float] = None) -> Dict[str, Any]:
+        """
+        异步识别内存中的发票图片
+        
+        Args:
+            data: 图片文件内容
+            filename: 文件名，用于格式验证和结果展示
+            validate: 是否验证文件
+            deadline: 调用截止时间(time.monotonic()时间戳)
+            
+        Returns:
+            Dict: 与 recognize_invoice_bytes 的返回结构相同
+        """
+        result = self._new_bytes_result(data, filename)
+        
+        try:
+            recognize_invoice_request, digest = self._prepare_bytes_input(data, filename, validate, result)
+            if recognize_invoice_request is None:
+                return result
+            
+            # 调用异步API
+            response = await self._call_api_async(recognize_invoice_request, deadline, result)
+            
+            self._handle_response(result, response, digest, None)
+            return result
+            
+        except Exception as e:
+            result["error"] = self._build_error_info(e)
+            return result
+        finally:
+            self._record_outcome(result)
+    
+    async def recognize_many(self, file_paths: Iterable[str], concurrency: int = 8,
+                             validate: bool = True,
+                             deadline: Optional[float] = None) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """
+        并发识别多个文件，按完成顺序逐个返回结果
+        
+        Args:
+            file_paths: 图片文件路径列表
+            concurrency: 同时在途的请求数上限
+            validate: 是否验证文件
+            deadline: 整批调用的截止时间(time.monotonic()时间戳)
+            
+        Yields:
+            Tuple[index, result]: 文件在输入中的序号和识别结果
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        
+        async def recognize_one(index: int, file_path: str):
+            async with semaphore:
+                return index, await self.recognize_invoice_raw_async(
+                    file_path, validate=validate, deadline=deadline
+                )
+        
+        tasks = [asyncio.ensure_future(recognize_one(index, file_path))
+                 for index, file_path in enumerate(file_paths)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # 调用方提前退出时取消尚未完成的请求
+            for task in tasks:
+                task.cancel()
+
+
+_shared_ocr = None
+_shared_ocr_lock = threading.Lock()
+
+
+def get_shared_ocr(**kwargs) -> SimpleOCR:
+    """
+    获取进程内共享的OCR实例，首次调用时创建，之后复用同一客户端和HTTP连接池
+    
+    Args:
+        **kwargs: 首次创建时传给SimpleOCR的参数，之后的调用会忽略
+        
+    Returns:
+        SimpleOCR: 共享实例
+    """
+    global _shared_ocr
+    if _shared_ocr is None:
+        with _shared_ocr_lock:
+            if _shared_ocr is None:
+                _shared_ocr = SimpleOCR(**kwargs)
+    return _shared_ocr
+
+
+def expand_input_paths(patterns: Iterable[str], recursive: bool = False) -> List[str]:
+    """
+    把命令行中的文件、目录和通配符展开为待识别的文件列表
+
+    Args:
+        patterns: 文件路径、目录或通配符（如 "scans/*.pdf"、"archive/**/*.jpg"）
+        recursive: 目录是否包含子目录
+
+    Returns:
+        List[str]: 去重后的文件路径，只保留支持的格式，同一目录内按文件名排序
+    """
+    files = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            candidates = []
+            if recursive:
+                for root, dirs, names in os.walk(pattern):
+                    dirs.sort()
+                    candidates.extend(os.path.join(root, name) for name in sorted(names))
+            else:
+                candidates = [os.path.join(pattern, name) for name in sorted(os.listdir(pattern))]
+        elif glob.has_magic(pattern):
+            candidates = sorted(glob.glob(pattern, recursive=True))
+        else:
+            candidates = [pattern]
+
+        for path in candidates:
+            if os.path.isdir(path) or os.path.splitext(path)[1].lower() not in VALID_EXTENSIONS:
+                continue
+            key = os.path.abspath(path)
+            if key not in seen:
+                seen.add(key)
+                files.append(path)
+    return files
+
+
+def _load_checkpoint(checkpoint_path: Optional[str]) -> set:
+    """读取检查点文件中已成功识别的文件（绝对路径）"""
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return set()
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        return {line.rstrip('\n') for line in f if line.strip()}
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    """最近秩法计算百分位数，输入需已排序"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(-(-percent * len(sorted_values) // 100)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def run_batch(ocr: SimpleOCR, file_paths: List[str], output: TextIO, workers: int = 4,
+              checkpoint_path: Optional[str] = None, validate: bool = True,
+              progress: Optional[TextIO] = None) -> Dict[str, Any]:
+    """
+    并发识别一批文件，每完成一张即向output写入一行JSON
+
+    成功识别的文件追加到检查点文件；重新运行时跳过检查点中的文件，
+    失败的文件不记录，会在下次运行时重试。
+
+    Args:
+        ocr: OCR实例
+        file_paths: 待识别的文件路径
+        output: JSON Lines输出流
+        workers: 同时在途的请求数
+        checkpoint_path: 检查点文件路径，None表示不记录
+        validate: 是否验证文件
+        progress: 每完成一个文件向其写入一行进度，None表示不输出
+
+    Returns:
+        Dict: 统计信息（总数、成功、失败、跳过、耗时、吞吐量和单张耗时百分位数）；
+        按Ctrl+C中断时停止提交并返回已完成部分的统计，interrupted为True
+    """
+    finished = _load_checkpoint(checkpoint_path)
+    pending = [path for path in file_paths if os.path.abspath(path) not in finished]
+    stats = {
+        "total": len(file_paths),
+        "skipped": len(file_paths) - len(pending),
+        "success": 0,
+        "failed": 0,
+        "cache_hits": 0,
+    }
+    latencies = []
+
+    def recognize(path: str):
+        start = time.perf_counter()
+        result = ocr.recognize_document(path, validate=validate)
+        return result, time.perf_counter() - start
+
+    checkpoint = open(checkpoint_path, 'a', encoding='utf-8') if checkpoint_path else None
+    executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ocr-batch")
+    batch_start = time.perf_counter()
+    interrupted = False
+    futures = {}
+    try:
+        for path in pending:
+            futures[executor.submit(recognize, path)] = path
+        for future in as_completed(futures):
+            path = futures[future]
+            result, elapsed = future.result()
+            record = {
+                "file": path,
+                "success": result.get("success", False),
+                "elapsed_ms": round(elapsed * 1000, 1),
+            }
+            if "pages" in result:
+                # 多页文档按页输出，任一页成功即视为成功，失败的页码记录在failed_pages
+                record.update(page_count=result["page_count"], pages=result["pages"],
+                              failed_pages=result["failed_pages"])
+            if record["success"]:
+                if "pages" not in result:
+                    record["data"] = result.get("data")
+                if result.get("cache_hit"):
+                    record["cache_hit"] = True
+                    stats["cache_hits"] += 1
+                else:
+                    latencies.append(elapsed)
+                stats["success"] += 1
+            else:
+                record["error"] = result.get("error")
+                stats["failed"] += 1
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            if progress is not None:
+                print(f"[{stats['success'] + stats['failed']}/{len(pending)}] "
+                      f"{'成功' if record['success'] else '失败'} {path} "
+                      f"{record['elapsed_ms']:.0f} ms{'（缓存）' if record.get('cache_hit') else ''}",
+                      file=progress, flush=True)
+
+            # 先写结果再记检查点：中断时最多重复输出一条，不会丢失；
+            # 有失败页的文档不记检查点，下次运行时整份重试（已成功的页命中缓存）
+            if checkpoint is not None and record["success"] and not record.get("failed_pages"):
+                checkpoint.write(os.path.abspath(path) + "\n")
+                checkpoint.flush()
+    except KeyboardInterrupt:
+        interrupted = True
+    finally:
+        # 中断时取消尚未开始的请求，等待在途请求结束（其结果不记录，下次重试）；
+        # 逐个取消而不用 shutdown(cancel_futures=True)，后者需要Python 3.9
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+        if checkpoint is not None:
+            checkpoint.close()
+
+    elapsed_total = time.perf_counter() - batch_start
+    latencies.sort()
+    processed = stats["success"] + stats["failed"]
+    stats.update({
+        "interrupted": interrupted,
+        "elapsed_seconds": elapsed_total,
+        "files_per_second": processed / elapsed_total if elapsed_total > 0 else 0.0,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+    })
+    return stats
+
+
+def print_batch_summary(stats: Dict[str, Any], file=sys.stderr):
+    """打印批量识别的吞吐量和耗时统计"""
+    print("=" * 60, file=file)
+    print("批量识别完成", file=file)
+    print(f"文件总数: {stats['total']}  成功: {stats['success']}  失败: {stats['failed']}  "
+          f"跳过(已完成): {stats['skipped']}  缓存命中: {stats['cache_hits']}", file=file)
+    print(f"总耗时: {stats['elapsed_seconds']:.1f} 秒  吞吐量: {stats['files_per_second']:.2f} 张/秒", file=file)
+    print(f"接口耗时: p50 {stats['p50_ms']:.0f} ms  p95 {stats['p95_ms']:.0f} ms  "
+          f"p99 {stats['p99_ms']:.0f} ms", file=file)
+    print("=" * 60, file=file)
+
+
 # 命令行接口 - 修复错误处理
 def main():
     """命令行入口函数"""
@@ -365,13 +1172,19 @@ def main():
   %(prog)s invoice.jpg --verbose  # 显示详细信息
   %(prog)s invoice.jpg --no-validate  # 跳过文件验证
   %(prog)s --check-cred           # 检查凭证
+
+批量识别（每张发票输出一行JSON）:
+  %(prog)s scans/ -o results.jsonl --workers 8            # 识别目录中的所有发票
+  %(prog)s "archive/**/*.pdf" -o results.jsonl            # 使用通配符
+  %(prog)s scans/ -r -o results.jsonl --checkpoint run.ckpt  # 中断后重新运行会跳过已完成的文件
+  %(prog)s bundle.pdf -o results.jsonl                    # 多页PDF/TIFF按页并发识别，各页结果在pages中
         """
     )
     
     parser.add_argument(
         'file_path',
-        nargs='?',
-        help='发票图片文件路径'
+        nargs='*',
+        help='发票图片文件路径；指定多个文件、目录或通配符时进入批量模式'
     )
     
     parser.add_argument(
@@ -393,11 +1206,38 @@ def main():
         help='检查凭证配置'
     )
     
+    parser.add_argument(
+        '--workers',
+        '-w',
+        type=int,
+        default=_env_int('OCR_MAX_WORKERS', 4),
+        help='批量模式下同时在途的请求数（默认读取OCR_MAX_WORKERS，否则为4）'
+    )
+    
+    parser.add_argument(
+        '--output',
+        '-o',
+        help='批量模式的JSON Lines输出文件，默认输出到标准输出'
+    )
+    
+    parser.add_argument(
+        '--checkpoint',
+        help='批量模式的检查点文件，默认为输出文件名加 .checkpoint'
+    )
+    
+    parser.add_argument(
+        '--recursive',
+        '-r',
+        action='store_true',
+        help='批量模式下包含子目录'
+    )
+    
     args = parser.parse_args()
     
     try:
-        # 创建OCR实例
-        ocr = SimpleOCR()
+        # 创建OCR实例，与网页版使用同一缓存（OCR_CACHE_* 环境变量），重复识别同一文件时不再调用接口
+        from invoice_parser import PARSER_VERSION
+        ocr = SimpleOCR(cache=cache_from_env(PARSER_VERSION))
         
         # 检查凭证
         if args.check_cred:
@@ -423,12 +1263,18 @@ def main():
             print(f"\n错误: 必须指定文件路径")
             return
         
+        batch_mode = (len(args.file_path) > 1 or args.output or args.checkpoint
+                      or any(os.path.isdir(path) or glob.has_magic(path) for path in args.file_path))
+        if batch_mode:
+            return _main_batch(ocr, args)
+        
+        file_path = args.file_path[0]
         print(f"阿里云OCR发票识别工具 - 简化版 v2.0.1")
-        print(f"文件: {args.file_path}")
+        print(f"文件: {file_path}")
         
         # 识别发票
         result = ocr.recognize_invoice_raw(
-            args.file_path, 
+            file_path, 
             validate=not args.no_validate
         )
         
@@ -450,5 +1296,33 @@ def main():
         return None
 
 
+def _main_batch(ocr: SimpleOCR, args) -> Dict[str, Any]:
+    """批量模式：结果以JSON Lines输出，进度和统计信息输出到标准错误"""
+    file_paths = expand_input_paths(args.file_path, recursive=args.recursive)
+    if not file_paths:
+        print("错误: 没有找到支持格式的文件", file=sys.stderr)
+        return None
+    
+    checkpoint_path = args.checkpoint or (f"{args.output}.checkpoint" if args.output else None)
+    resuming = bool(_load_checkpoint(checkpoint_path))
+    print(f"批量识别 {len(file_paths)} 个文件，并发数 {args.workers}"
+          + ("，从检查点继续" if resuming else ""), file=sys.stderr)
+    
+    # 从检查点继续时追加到已有的输出文件
+    output = open(args.output, 'a' if resuming else 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        stats = run_batch(ocr, file_paths, output, workers=args.workers,
+                          checkpoint_path=checkpoint_path, validate=not args.no_validate,
+                          progress=sys.stderr)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    
+    if stats["interrupted"]:
+        print("\n已中断" + ("，重新运行相同命令可从检查点继续" if checkpoint_path else ""), file=sys.stderr)
+    print_batch_summary(stats)
+    return stats
+
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,76 @@
+// 上传前在浏览器中缩小并重新压缩发票图片（可选功能，由服务器配置开启）
+// 图片按最长边缩放到 maxEdge 像素以内，再以 quality 质量编码为JPEG；
+// PDF、TIFF等浏览器无法解码的文件，以及压缩后反而更大的图片保持原样上传。
+(function() {
+    var RESIZABLE_TYPES = ['image/jpeg', 'image/png', 'image/bmp', 'image/webp', 'image/gif'];
+
+    function mimeOf(dataUrl) {
+        var match = /^data:([^;,]+)/.exec(dataUrl || '');
+        return match ? match[1].toLowerCase() : '';
+    }
+
+    function jpegName(filename) {
+        var dot = filename.lastIndexOf('.');
+        return (dot > 0 ? filename.slice(0, dot) : filename) + '.jpg';
+    }
+
+    function loadImage(dataUrl) {
+        return new Promise(function(resolve, reject) {
+            var img = new Image();
+            img.onload = function() { resolve(img); };
+            img.onerror = reject;
+            img.src = dataUrl;
+        });
+    }
+
+    function resizeOne(content, filename, config) {
+        var mime = mimeOf(content);
+        if (RESIZABLE_TYPES.indexOf(mime) < 0) {
+            return Promise.resolve({content: content, filename: filename});
+        }
+        return loadImage(content).then(function(img) {
+            var longEdge = Math.max(img.naturalWidth, img.naturalHeight);
+            var scale = Math.min(1, config.maxEdge / longEdge);
+            var width = Math.max(1, Math.round(img.naturalWidth * scale));
+            var height = Math.max(1, Math.round(img.naturalHeight * scale));
+
+            var canvas = document.createElement('canvas');
+            canvas.width = width;
+            canvas.height = height;
+            var ctx = canvas.getContext('2d');
+            // PNG透明背景转JPEG时填充为白色，避免变黑影响识别
+            ctx.fillStyle = '#ffffff';
+            ctx.fillRect(0, 0, width, height);
+            ctx.drawImage(img, 0, 0, width, height);
+
+            var resized = canvas.toDataURL('image/jpeg', config.quality);
+            if (resized.length >= content.length) {
+                return {content: content, filename: filename};
+            }
+            return {content: resized, filename: jpegName(filename)};
+        }).catch(function() {
+            return {content: content, filename: filename};
+        });
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        invoice_upload: {
+            prepareUploads: function(contents, filenames, config) {
+                if (!contents || contents.length === 0) {
+                    return window.dash_clientside.no_update;
+                }
+                if (!config || !config.enabled) {
+                    return {contents: contents, filenames: filenames};
+                }
+                return Promise.all(contents.map(function(content, i) {
+                    return resizeOne(content, filenames[i], config);
+                })).then(function(items) {
+                    return {
+                        contents: items.map(function(item) { return item.content; }),
+                        filenames: items.map(function(item) { return item.filename; })
+                    };
+                });
+            }
+        }
+    });
+})();
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+发票备注银行信息提取模块
+从备注文本中提取销售方开户行和银行账号。正则在导入时编译一次，
+规则按优先级保存在注册表中，可通过 register_rule 扩展新的备注格式
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Sequence
+
+
+# 通用搜索使用的银行关键词，靠前的关键词优先
+DEFAULT_BANK_KEYWORDS = ('银行', '农行', '工行', '建行', '中行', '招行', '交行', '邮储',
+                         '农商行', '浦发', '兴业', '中信', '光大', '华夏', '民生', '平安')
+
+# 开户行文本中出现这些分隔符时只保留分隔符之前的部分
+_BANK_SEPARATORS = (';', '；', '，', ',', '。', '、')
+
+
+class BankRule:
+    """一条正则提取规则：匹配后把指定分组写入尚未提取到的开户行/银行账号"""
+
+    def __init__(self, name: str, pattern: str, bank_group: int = 0, account_group: int = 0,
+                 anchors: Sequence[str] = ()):
+        """
+        Args:
+            name: 规则名称
+            pattern: 正则表达式
+            bank_group: 开户行所在的分组序号，0表示该规则不提取开户行
+            account_group: 银行账号所在的分组序号，0表示该规则不提取账号
+            anchors: 备注中至少包含其中一个子串时才执行正则，为空表示总是执行
+        """
+        self.name = name
+        self.regex = re.compile(pattern)
+        self.bank_group = bank_group
+        self.account_group = account_group
+        self.anchors = tuple(anchors)
+
+    def __repr__(self):
+        return f"BankRule({self.name!r})"
+
+
+class BankInfoExtractor:
+    """
+    按优先级依次应用规则：每条规则只填写前面规则未提取到的字段，
+    全部规则都未提取到开户行时，取包含银行关键词（且不含"账号"）的行
+    """
+
+    def __init__(self, rules: Iterable[BankRule] = (), keywords: Sequence[str] = DEFAULT_BANK_KEYWORDS):
+        """
+        Args:
+            rules: 初始规则，按优先级从高到低排列
+            keywords: 通用搜索使用的银行关键词，靠前的优先
+        """
+        self.rules: List[BankRule] = list(rules)
+        self.keywords = tuple(keywords)
+        self._compile()
+
+    def register_rule(self, rule: BankRule, before: Optional[str] = None):
+        """
+        注册规则
+
+        Args:
+            rule: 新规则
+            before: 插入到该名称的规则之前，为None时追加到末尾（优先级最低）
+        """
+        if before is None:
+            self.rules.append(rule)
+        else:
+            names = [existing.name for existing in self.rules]
+            if before not in names:
+                raise KeyError(f"规则不存在: {before}")
+            self.rules.insert(names.index(before), rule)
+        self._compile()
+
+    def _compile(self):
+        """把规则展开为元组表，并生成预筛选正则：备注中不含任何锚点和关键词时直接返回空结果"""
+        self._table = [(rule.regex.search, rule.bank_group, rule.account_group, rule.anchors)
+                       for rule in self.rules]
+        self._keyword_regex = re.compile('|'.join(map(re.escape, self.keywords))) if self.keywords else None
+        if any(not rule.anchors for rule in self.rules):
+            self._prefilter = None
+        else:
+            needles = set(self.keywords)
+            for rule in self.rules:
+                needles.update(rule.anchors)
+            self._prefilter = re.compile('|'.join(map(re.escape, sorted(needles))))
+
+    def extract(self, remarks: str) -> Dict[str, str]:
+        """
+        从备注中提取银行信息和账号
+        支持多种格式：
+        1. "销方开户银行:中国农业银行股份有限公司三明徐碧支行;银行账号:13800101040002394;"
+        2. "开户行：中国工商银行深圳分行\\n账号：6222024000001234567"
+        3. "中国银行北京分行 6225888888888888"
+
+        Args:
+            remarks: 发票备注
+
+        Returns:
+            Dict: {"开户行": ..., "银行账号": ...}，未提取到的字段为空字符串
+        """
+        bank = account = ""
+        if not remarks or (self._prefilter is not None and not self._prefilter.search(remarks)):
+            return {"开户行": bank, "银行账号": account}
+
+        remarks = remarks.replace('\r\n', '\n').replace('\r', '\n')
+
+        for search, bank_group, account_group, anchors in self._table:
+            if not ((bank_group and not bank) or (account_group and not account)):
+                continue
+            if anchors:
+                for anchor in anchors:
+                    if anchor in remarks:
+                        break
+                else:
+                    continue
+            match = search(remarks)
+            if match is None:
+                continue
+            if bank_group and not bank:
+                bank = (match.group(bank_group) or "").strip()
+            if account_group and not account:
+                account = (match.group(account_group) or "").strip()
+            if bank and account:
+                break
+
+        if not bank:
+            bank = self._search_keyword_line(remarks)
+
+        if bank:
+            for sep in _BANK_SEPARATORS:
+                if sep in bank:
+                    bank = bank.split(sep)[0]
+            bank = bank.strip().rstrip(':：;；')
+
+        return {"开户行": bank, "银行账号": account}
+
+    def _search_keyword_line(self, remarks: str) -> str:
+        """一次遍历各行，返回包含优先级最高的关键词的第一行"""
+        if self._keyword_regex is None or not self._keyword_regex.search(remarks):
+            return ""
+        keywords = self.keywords
+        best_rank = len(keywords)
+        best_line = ""
+        for line in remarks.split('\n'):
+            if '账号' in line:
+                continue
+            for rank in range(best_rank):
+                if keywords[rank] in line:
+                    best_rank = rank
+                    best_line = line
+                    break
+            if best_rank == 0:
+                break
+        return best_line.strip().replace(':', '').replace('：', '').strip()
+
+
+# 默认规则，顺序即优先级
+DEFAULT_RULES = (
+    # 分号分隔："销方开户银行:xxx;银行账号:xxx;"
+    BankRule('semicolon_bank', r'(?:销方开户银行|开户行)[:：]\s*([^;]+?)(?:;|银行账号)',
+             bank_group=1, anchors=('开户银行', '开户行')),
+    BankRule('semicolon_account', r'银行账号[:：]\s*(\d{16,19})',
+             account_group=1, anchors=('银行账号',)),
+    # 一行内包含银行和账号："中国银行北京分行 6225888888888888"
+    BankRule('inline', r'([\u4e00-\u9fff]+银行[^;]*?)(\d{16,19})',
+             bank_group=1, account_group=2, anchors=('银行',)),
+    # 分行显示："开户行：xxx\n账号：xxx"
+    BankRule('line_bank', r'开户行[:：]\s*([^\n]+)', bank_group=1, anchors=('开户行',)),
+    BankRule('line_account', r'账号[:：]\s*(\d{16,19})', account_group=1, anchors=('账号',)),
+)
+
+default_extractor = BankInfoExtractor(DEFAULT_RULES)
+
+
+def register_rule(rule: BankRule, before: Optional[str] = None):
+    """向默认提取器注册规则，参数同 BankInfoExtractor.register_rule"""
+    default_extractor.register_rule(rule, before=before)
+
+
+def extract_bank_info(remarks: str) -> Dict[str, str]:
+    """使用默认提取器从备注中提取开户行和银行账号"""
+    return default_extractor.extract(remarks)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+备注银行信息提取的微基准测试
+
+用法:
+    python benchmarks/bench_bank_info.py [--repeat 2000]
+
+对 bank_remarks_corpus.jsonl 中的每条备注：
+1. 校验 bank_info.extract_bank_info 的结果与语料中的期望值一致；
+2. 分别统计新提取器和旧实现（每次调用都重新编译正则的嵌套函数）的单条平均耗时
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from bank_info import extract_bank_info
+
+CORPUS_PATH = os.path.join(BENCH_DIR, 'bank_remarks_corpus.jsonl')
+
+
+def legacy_extract_bank_info_from_remarks(remarks):
+    """GUI-4.py 中原有的实现，作为性能对比基线"""
+    bank_info = {"开户行": "", "银行账号": ""}
+
+    if not remarks:
+        return bank_info
+
+    import re
+
+    remarks = remarks.replace('\r\n', '\n').replace('\r', '\n')
+
+    pattern1 = r'(?:销方开户银行|开户行)[:：]\s*([^;]+?)(?:;|银行账号)'
+    pattern1_account = r'银行账号[:：]\s*(\d{16,19})'
+    pattern2 = r'([\u4e00-\u9fff]+银行[^;]*?)(\d{16,19})'
+    pattern3_bank = r'开户行[:：]\s*([^\n]+)'
+    pattern3_account = r'账号[:：]\s*(\d{16,19})'
+
+    bank_match = re.search(pattern1, remarks)
+    account_match = re.search(pattern1_account, remarks)
+
+    if bank_match:
+        bank_info["开户行"] = bank_match.group(1).strip()
+    if account_match:
+        bank_info["银行账号"] = account_match.group(1)
+
+    if not bank_info["开户行"] or not bank_info["银行账号"]:
+        match2 = re.search(pattern2, remarks)
+        if match2:
+            if not bank_info["开户行"]:
+                bank_info["开户行"] = match2.group(1).strip()
+            if not bank_info["银行账号"]:
+                bank_info["银行账号"] = match2.group(2)
+
+    if not bank_info["开户行"]:
+        match3_bank = re.search(pattern3_bank, remarks)
+        if match3_bank:
+            bank_info["开户行"] = match3_bank.group(1).strip()
+
+    if not bank_info["银行账号"]:
+        match3_account = re.search(pattern3_account, remarks)
+        if match3_account:
+            bank_info["银行账号"] = match3_account.group(1)
+
+    if not bank_info["开户行"]:
+        bank_keywords = ['银行', '农行', '工行', '建行', '中行', '招行', '交行', '邮储',
+                         '农商行', '浦发', '兴业', '中信', '光大', '华夏', '民生', '平安']
+        for keyword in bank_keywords:
+            if keyword in remarks:
+                lines = remarks.split('\n')
+                for line in lines:
+                    if keyword in line and '账号' not in line:
+                        bank_info["开户行"] = line.strip().replace(':', '').replace('：', '').strip()
+                        break
+                if bank_info["开户行"]:
+                    break
+
+    if bank_info["开户行"]:
+        for sep in [';', '；', '，', ',', '。', '、']:
+            if sep in bank_info["开户行"]:
+                bank_info["开户行"] = bank_info["开户行"].split(sep)[0]
+        bank_info["开户行"] = bank_info["开户行"].strip().rstrip(':：;；')
+
+    return bank_info
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check_corpus(corpus):
+    """校验提取结果，返回不一致的条目数"""
+    failures = 0
+    for case in corpus:
+        actual = extract_bank_info(case["remarks"])
+        if actual != case["expected"]:
+            failures += 1
+            print(f"不一致: {case['remarks']!r}\n  期望: {case['expected']}\n  实际: {actual}")
+    return failures
+
+
+def time_per_call(func, corpus, repeat):
+    """返回单条备注的平均耗时(微秒)"""
+    remarks_list = [case["remarks"] for case in corpus]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for remarks in remarks_list:
+            func(remarks)
+    elapsed = time.perf_counter() - start
+    return elapsed / (repeat * len(remarks_list)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='备注银行信息提取微基准')
+    parser.add_argument('--repeat', type=int, default=2000, help='语料重复次数')
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    failures = check_corpus(corpus)
+    print(f"语料: {len(corpus)} 条，不一致: {failures} 条")
+
+    legacy_us = time_per_call(legacy_extract_bank_info_from_remarks, corpus, args.repeat)
+    current_us = time_per_call(extract_bank_info, corpus, args.repeat)
+    print(f"旧实现:   {legacy_us:8.2f} µs/条")
+    print(f"新提取器: {current_us:8.2f} µs/条  ({legacy_us / current_us:.1f}x)")
+    print(f"按新提取器估算，100万条备注约需 {current_us:.0f} 秒")
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
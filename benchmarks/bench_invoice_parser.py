@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+发票识别结果解析的基准测试
+
+用法:
+    python benchmarks/bench_invoice_parser.py [--count 20000]
+
+生成与阿里云 RecognizeInvoice 返回结构相同的原始数据（Data为JSON字符串），
+分别使用各个可用的JSON解码器批量解析，校验结果一致并输出单张平均耗时
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from invoice_parser import InvoiceParser, get_json_loads
+
+REMARKS_SAMPLES = [
+    "销方开户银行:中国农业银行股份有限公司三明徐碧支行;银行账号:13800101040002394;",
+    "开户行：中国工商银行深圳分行\n账号：6222024000001234567",
+    "中国银行北京分行 6225888888888888",
+    "收款人：张三 复核：李四 开票人：王五",
+    "",
+]
+
+
+def make_payload(rng):
+    """生成一条模拟的原始返回数据"""
+    details = [
+        {"itemName": f"*服务*技术服务费{i}", "quantity": str(rng.randint(1, 5)),
+         "amount": f"{rng.uniform(10, 5000):.2f}", "taxRate": "6%"}
+        for i in range(rng.randint(1, 8))
+    ]
+    invoice = {
+        "invoiceCode": f"0{rng.randint(10**10, 10**11 - 1)}",
+        "invoiceNumber": f"{rng.randint(10**7, 10**8 - 1)}",
+        "invoiceDate": "2025年03月15日",
+        "drawer": "管理员",
+        "remarks": rng.choice(REMARKS_SAMPLES),
+        "sellerName": "深圳测试科技有限公司",
+        "sellerTaxNumber": "91440300MA5XXXXXXX",
+        "purchaserName": "北京测试有限公司",
+        "purchaserTaxNumber": "91110000MA0XXXXXXX",
+        "totalAmount": f"{rng.uniform(10, 50000):.2f}",
+        "invoiceAmountPreTax": f"{rng.uniform(10, 45000):.2f}",
+        "invoiceTax": f"{rng.uniform(0, 5000):.2f}",
+        "invoiceDetails": details,
+        "title": "增值税电子普通发票",
+    }
+    data = {"data": invoice, "ftype": 0, "height": 1200, "width": 1800, "orgHeight": 1200, "orgWidth": 1800}
+    return {"Data": json.dumps(data, ensure_ascii=False), "RequestId": "BENCH"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='发票识别结果解析基准')
+    parser.add_argument('--count', type=int, default=20000, help='模拟原始数据条数')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    payloads = [make_payload(rng) for _ in range(args.count)]
+
+    baseline = None
+    for name in ('json', 'ujson', 'orjson'):
+        if name != 'json' and importlib.util.find_spec(name) is None:
+            print(f"{name:7s} 未安装，跳过")
+            continue
+        loads = get_json_loads(name)
+        invoice_parser = InvoiceParser(loads=loads)
+        start = time.perf_counter()
+        results = invoice_parser.parse_many(payloads)
+        elapsed = time.perf_counter() - start
+
+        errors = sum(1 for result in results if "error" in result)
+        if baseline is None:
+            baseline = results
+        consistent = results == baseline
+        print(f"{name:7s} {elapsed / len(payloads) * 1e6:8.2f} µs/张  "
+              f"失败 {errors} 张  与json结果{'一致' if consistent else '不一致'}")
+        if not consistent:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+OCR识别链路的端到端基准测试（使用本地模拟服务，不消耗阿里云额度）
+
+用法:
+    python benchmarks/bench_ocr_pipeline.py [--targets raw,gui,dash] [--batch-sizes 16,64]
+        [--concurrency 1,4,16] [--latency-ms 300 --latency-dist lognormal] [--error-rate 0.01]
+
+在进程内启动 mock_ocr_server，分别测量以下三层在不同批量和并发数下的吞吐量和单张耗时百分位数:
+    raw   SimpleOCR.recognize_invoice_raw
+    gui   GUI-4.py 中的 process_invoice_image（识别 + 结果解析）
+    dash  GUI-4.py 的上传回调 handle_upload_and_process，从提交到所有结果写入会话存储
+每次运行都新建OCR实例、限流器和熔断器，限流相关的环境变量（OCR_QPS、OCR_ADAPTIVE_CONCURRENCY等）照常生效；
+服务端的请求数包含重试，限流数为模拟服务返回的429次数
+"""
+
+import argparse
+import base64
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from mock_ocr_server import add_server_arguments, server_from_args
+
+# 模拟服务不校验签名，未配置AccessKey时使用占位值
+os.environ.setdefault('ALIBABA_CLOUD_ACCESS_KEY_ID', 'mock-access-key-id')
+os.environ.setdefault('ALIBABA_CLOUD_ACCESS_KEY_SECRET', 'mock-access-key-secret')
+
+import Ranch5
+from Ranch5 import SimpleOCR, _percentile
+from rate_limit import rate_limiter_from_env
+from resilience import circuit_breaker_from_env
+
+TARGETS = ('raw', 'gui', 'dash')
+
+
+def make_images(directory, count):
+    """生成count张测试图片，安装Pillow时为噪点JPEG，否则为带JPEG文件头的随机字节"""
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"invoice_{i:04d}.jpg")
+        if Image is not None:
+            Image.effect_noise((1200, 800), 32 + i % 64).convert('RGB').save(path, format='JPEG', quality=85)
+        else:
+            with open(path, 'wb') as f:
+                f.write(b'\xff\xd8\xff\xe0' + os.urandom(200 * 1024))
+        paths.append(path)
+    return paths
+
+
+def load_gui(work_dir):
+    """导入 GUI-4.py（文件名含连字符，需按路径导入）；缺少Dash等依赖时返回None"""
+    # 禁用结果缓存，否则重复运行会直接命中缓存；缩略图和会话数据写入临时目录
+    os.environ['OCR_CACHE_ENABLED'] = '0'
+    os.environ['THUMBNAIL_DIR'] = os.path.join(work_dir, 'thumbnails')
+    os.environ['SESSION_STORE'] = 'memory'
+    try:
+        spec = importlib.util.spec_from_file_location('gui4', os.path.join(ROOT_DIR, 'GUI-4.py'))
+        gui = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(gui)
+    except ImportError as e:
+        print(f"无法导入GUI-4.py（{e}），跳过gui和dash")
+        return None
+    return gui
+
+
+def new_ocr(endpoint):
+    """每次运行使用全新的OCR实例、限流器和熔断器，避免上一轮的自适应并发和熔断状态影响结果"""
+    return SimpleOCR(endpoint=endpoint, protocol='HTTP', rate_limiter=rate_limiter_from_env(),
+                     circuit_breaker=circuit_breaker_from_env())
+
+
+def run_threaded(func, paths, concurrency):
+    """用concurrency个线程对每个文件调用func，返回 (各文件耗时, 成功数)"""
+    def timed(path):
+        start = time.perf_counter()
+        result = func(path)
+        ok = result.get("success", "error" not in result)
+        return time.perf_counter() - start, ok
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(timed, paths))
+    return [elapsed for elapsed, ok in outcomes], sum(ok for elapsed, ok in outcomes)
+
+
+def run_dash(gui, ocr, paths, concurrency):
+    """调用上传回调并等待任务完成，返回 (各发票从提交到结果可见的耗时, 成功数)"""
+    from job_queue import JobQueue
+
+    contents = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            contents.append("data:image/jpeg;base64," + base64.b64encode(f.read()).decode('ascii'))
+    payload = {"contents": contents, "filenames": [os.path.basename(path) for path in paths]}
+
+    # 回调通过模块全局变量访问任务队列和共享OCR实例，按本轮的并发数替换
+    gui.job_queue = JobQueue(max_workers=concurrency)
+    Ranch5._shared_ocr = ocr
+    session_id = uuid.uuid4().hex
+
+    start = time.perf_counter()
+    outputs = gui.handle_upload_and_process(payload, session_id)
+    job = gui.job_queue.get(outputs[7])
+    latencies = []
+    seen = 0
+    while seen < job.total:
+        job.wait_for_update(seen, timeout=1.0)
+        completed = job.completed
+        latencies.extend([time.perf_counter() - start] * (completed - seen))
+        seen = completed
+    gui.job_queue.shutdown()
+
+    _, results = gui.get_session_job(session_id)
+    return latencies, sum(1 for result in results if result is not None and "error" not in result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OCR识别链路的端到端基准（本地模拟服务）')
+    parser.add_argument('--targets', default=','.join(TARGETS), help='测试的层级，逗号分隔: raw,gui,dash')
+    parser.add_argument('--batch-sizes', default='16,64', help='每轮的发票数量，逗号分隔')
+    parser.add_argument('--concurrency', default='1,4,16', help='并发数，逗号分隔')
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    targets = [t for t in args.targets.split(',') if t]
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"未知的层级: {', '.join(sorted(unknown))}")
+    batch_sizes = [int(n) for n in args.batch_sizes.split(',')]
+    concurrency_levels = [int(n) for n in args.concurrency.split(',')]
+
+    work_dir = tempfile.mkdtemp(prefix='ocr_bench_')
+    paths = make_images(work_dir, max(batch_sizes))
+    gui = load_gui(work_dir) if {'gui', 'dash'} & set(targets) else None
+
+    server = server_from_args(args).start()
+    print(f"模拟服务 {server.endpoint}  延迟 {args.latency_dist} {args.latency_ms:g}ms  "
+          f"错误率 {args.error_rate:g}  限流率 {args.throttle_rate:g}  QPS上限 {args.qps:g}")
+    print(f"{'层级':6s}{'批量':>6s}{'并发':>6s}{'张/秒':>9s}{'p50 ms':>9s}{'p95 ms':>9s}{'p99 ms':>9s}"
+          f"{'失败':>6s}{'请求数':>8s}{'429':>6s}")
+    try:
+        for target in targets:
+            if target != 'raw' and gui is None:
+                continue
+            for batch_size in batch_sizes:
+                for concurrency in concurrency_levels:
+                    batch = paths[:batch_size]
+                    ocr = new_ocr(server.endpoint)
+                    server.reset_stats()
+                    start = time.perf_counter()
+                    if target == 'raw':
+                        latencies, ok = run_threaded(ocr.recognize_invoice_raw, batch, concurrency)
+                    elif target == 'gui':
+                        latencies, ok = run_threaded(lambda path: gui.process_invoice_image(path, ocr),
+                                                     batch, concurrency)
+                    else:
+                        latencies, ok = run_dash(gui, ocr, batch, concurrency)
+                    elapsed = time.perf_counter() - start
+                    latencies.sort()
+                    stats = server.stats()
+                    print(f"{target:6s}{batch_size:6d}{concurrency:6d}{len(batch) / elapsed:9.2f}"
+                          f"{_percentile(latencies, 50) * 1000:9.0f}{_percentile(latencies, 95) * 1000:9.0f}"
+                          f"{_percentile(latencies, 99) * 1000:9.0f}{len(batch) - ok:6d}"
+                          f"{stats['requests']:8d}{stats['throttled']:6d}")
+    finally:
+        server.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+阿里云发票识别接口（RecognizeInvoice）的本地模拟服务
+
+用法:
+    python benchmarks/mock_ocr_server.py --port 8765 --latency-ms 300 --latency-dist lognormal \
+        --error-rate 0.01 --qps 20
+
+然后让OCR客户端指向该服务（不校验签名，AccessKey可任意填写）:
+    set OCR_ENDPOINT=127.0.0.1:8765
+    set OCR_PROTOCOL=HTTP
+
+接受与阿里云相同的RPC请求（POST /，请求体为图片内容，x-acs-action为RecognizeInvoice），
+按配置的延迟分布返回与真实接口结构相同的识别结果；可按比例注入5xx错误和限流错误，
+或按QPS/并发上限返回限流错误。GET /stats 返回累计的请求统计
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_invoice_parser import make_payload
+
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'normal', 'lognormal')
+
+
+class LatencyModel:
+    """模拟接口耗时的分布"""
+
+    def __init__(self, dist: str = 'lognormal', ms: float = 300.0, spread: float = 0.3,
+                 rng: Optional[random.Random] = None):
+        """
+        Args:
+            dist: fixed、uniform、normal 或 lognormal
+            ms: 耗时的中心值(毫秒)：uniform/normal为均值，lognormal为中位数
+            spread: 离散程度：uniform为半宽(毫秒)，normal为标准差(毫秒)，lognormal为对数标准差
+            rng: 随机数生成器，默认使用所属模拟服务的生成器
+        """
+        if dist not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"不支持的延迟分布: {dist}，支持: {', '.join(LATENCY_DISTRIBUTIONS)}")
+        self.dist = dist
+        self.ms = ms
+        self.spread = spread
+        self.rng = rng
+
+    def sample(self) -> float:
+        """抽取一次耗时(秒)"""
+        if self.dist == 'fixed':
+            ms = self.ms
+        elif self.dist == 'uniform':
+            ms = self.rng.uniform(self.ms - self.spread, self.ms + self.spread)
+        elif self.dist == 'normal':
+            ms = self.rng.gauss(self.ms, self.spread)
+        else:
+            ms = self.ms * math.exp(self.rng.gauss(0, self.spread))
+        return max(0.0, ms) / 1000
+
+
+class MockOCRServer:
+    """在后台线程中运行的模拟服务"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: Optional[LatencyModel] = None,
+                 error_rate: float = 0.0, throttle_rate: float = 0.0, qps: float = 0,
+                 max_concurrency: int = 0, seed: Optional[int] = None):
+        """
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示自动分配
+            latency: 接口耗时分布，默认中位数300ms的对数正态分布
+            error_rate: 返回503 ServiceUnavailable的比例
+            throttle_rate: 随机返回429 Throttling.User的比例
+            qps: 每秒请求数上限，超出时返回限流错误，0表示不限制
+            max_concurrency: 同时处理的请求数上限，超出时返回限流错误，0表示不限制
+            seed: 随机数种子
+        """
+        self.rng = random.Random(seed)
+        self.latency = latency or LatencyModel()
+        self.latency.rng = self.latency.rng or self.rng
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.qps = qps
+        self.max_concurrency = max_concurrency
+        self._tokens = float(qps)
+        self._updated_at = time.monotonic()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self._thread = None
+
+    @property
+    def endpoint(self) -> str:
+        """供 SimpleOCR(endpoint=..., protocol='HTTP') 使用的地址"""
+        host, port = self.httpd.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self) -> 'MockOCRServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-ocr", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {"requests": 0, "success": 0, "errors": 0, "throttled": 0,
+                           "bad_requests": 0, "max_in_flight": 0}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def admit(self) -> Optional[str]:
+        """
+        按QPS、并发上限和注入比例决定本次请求的结果
+
+        Returns:
+            str: None表示正常处理，否则为 "throttled" 或 "error"
+        """
+        with self._lock:
+            self._stats["requests"] += 1
+            if self.qps > 0:
+                now = time.monotonic()
+                self._tokens = min(float(self.qps), self._tokens + (now - self._updated_at) * self.qps)
+                self._updated_at = now
+                if self._tokens < 1:
+                    return "throttled"
+                self._tokens -= 1
+            if self.max_concurrency and self._in_flight >= self.max_concurrency:
+                return "throttled"
+            self._in_flight += 1
+            self._stats["max_in_flight"] = max(self._stats["max_in_flight"], self._in_flight)
+
+        roll = self.rng.random()
+        if roll < self.throttle_rate:
+            self.finish()
+            return "throttled"
+        if roll < self.throttle_rate + self.error_rate:
+            return "error"
+        return None
+
+    def finish(self):
+        with self._lock:
+            self._in_flight -= 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: Dict[str, Any]):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, code: str, message: str):
+        self._send_json(status, {"RequestId": self._request_id(), "Code": code, "Message": message,
+                                 "Recommend": "mock_ocr_server"})
+
+    def _request_id(self) -> str:
+        return self.headers.get('x-acs-signature-nonce') or "MOCK"
+
+    def do_GET(self):
+        if self.path.split('?')[0] == '/stats':
+            self._send_json(200, self.server.mock.stats())
+        else:
+            self._send_error(404, "InvalidAction.NotFound", "仅支持 POST / 和 GET /stats")
+
+    def do_POST(self):
+        mock = self.server.mock
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b""
+
+        if self.headers.get('x-acs-action') != 'RecognizeInvoice':
+            mock._count("bad_requests")
+            self._send_error(404, "InvalidAction.NotFound", "仅模拟 RecognizeInvoice 接口")
+            return
+        if not body:
+            mock._count("bad_requests")
+            self._send_error(400, "InvalidInput", "请求体为空")
+            return
+
+        outcome = mock.admit()
+        if outcome == "throttled":
+            mock._count("throttled")
+            self._send_error(429, "Throttling.User", "Request was denied due to user flow control.")
+            return
+        try:
+            time.sleep(mock.latency.sample())
+        finally:
+            mock.finish()
+        if outcome == "error":
+            mock._count("errors")
+            self._send_error(503, "ServiceUnavailable", "The request has failed due to a temporary failure.")
+            return
+
+        mock._count("success")
+        payload = make_payload(mock.rng)
+        payload["RequestId"] = self._request_id()
+        self._send_json(200, payload)
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    """向命令行参数中添加模拟服务的配置项，供基准脚本复用"""
+    parser.add_argument('--latency-dist', choices=LATENCY_DISTRIBUTIONS, default='lognormal',
+                        help='接口耗时分布，默认lognormal')
+    parser.add_argument('--latency-ms', type=float, default=300, help='耗时中心值(毫秒)，默认300')
+    parser.add_argument('--latency-spread', type=float, default=0.3,
+                        help='耗时离散程度：uniform为半宽/normal为标准差(毫秒)，lognormal为对数标准差，默认0.3')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回503的比例')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='随机返回429限流的比例')
+    parser.add_argument('--qps', type=float, default=0, help='每秒请求数上限，0表示不限制')
+    parser.add_argument('--max-concurrency', type=int, default=0, help='同时处理的请求数上限，0表示不限制')
+    parser.add_argument('--seed', type=int, default=None, help='随机数种子')
+
+
+def server_from_args(args, host: str = '127.0.0.1', port: int = 0) -> MockOCRServer:
+    """根据 add_server_arguments 添加的参数创建模拟服务"""
+    return MockOCRServer(
+        host=host,
+        port=port,
+        latency=LatencyModel(args.latency_dist, args.latency_ms, args.latency_spread),
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        qps=args.qps,
+        max_concurrency=args.max_concurrency,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='阿里云发票识别接口的本地模拟服务')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址，默认127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口，默认8765')
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = server_from_args(args, args.host, args.port)
+    print(f"模拟服务已启动: http://{server.endpoint}  （OCR_ENDPOINT={server.endpoint} OCR_PROTOCOL=HTTP）")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(json.dumps(server.stats(), ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
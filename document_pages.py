@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+多页PDF/TIFF发票拆分模块
+统计页数时以内存映射方式读取文件，不把大文件整体读入内存；
+安装pypdf（PDF）或Pillow（TIFF）时在本地拆分为单页文件，
+否则由调用方对整个文件按页码（page_no）分别发起识别请求
+"""
+
+import io
+import mmap
+import os
+import re
+import struct
+from contextlib import contextmanager
+from typing import Iterator, List, NamedTuple, Optional, Tuple, Union
+
+try:
+    from pypdf import PdfReader, PdfWriter
+    PYPDF_AVAILABLE = True
+except ImportError:
+    PYPDF_AVAILABLE = False
+
+try:
+    from PIL import Image, ImageSequence
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+
+# 可能包含多页的文件格式
+PAGED_EXTENSIONS = ('.pdf', '.tif', '.tiff')
+
+# 识别接口单次请求的文件大小上限(MB)
+MAX_REQUEST_MB = 10
+
+# 统计TIFF页数时最多遍历的IFD数，防止损坏文件中的循环链表
+_MAX_TIFF_PAGES = 10000
+
+_PDF_PAGE_PATTERN = re.compile(rb'/Type\s*/Page\b')
+_PDF_COUNT_PATTERN = re.compile(rb'/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|/Count\s+(\d+)[^>]*?/Type\s*/Pages\b')
+
+Buffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+
+class DocumentTooLarge(ValueError):
+    """无法在本地拆分，且整个文件超过单次请求的大小上限（按页码识别时每页都要发送整个文件）"""
+
+
+class DocumentPage(NamedTuple):
+    """多页文档中的一页"""
+    page_no: int                    # 页码，从1开始
+    data: Buffer                    # 发送给OCR接口的文件内容；按页码识别时为各页共用的整个文件的视图
+    filename: str                   # 用于格式验证的文件名
+    request_page_no: Optional[int]  # 未能本地拆分时请求中指定的页码，否则为None
+
+
+@contextmanager
+def mmap_file(file_path: str) -> Iterator[Buffer]:
+    """
+    以只读内存映射方式打开文件
+
+    Args:
+        file_path: 文件路径
+
+    Yields:
+        mmap: 可像bytes一样切片和正则搜索的文件内容；空文件时为b""
+    """
+    with open(file_path, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # 空文件无法映射
+            yield b""
+            return
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+
+
+def document_kind(buf: Buffer) -> Optional[str]:
+    """
+    按文件头判断文档类型
+
+    Returns:
+        str: "pdf"、"tiff"，其他格式返回None
+    """
+    head = bytes(buf[:4])
+    if head == b'%PDF':
+        return "pdf"
+    if head in (b'II*\x00', b'MM\x00*'):
+        return "tiff"
+    return None
+
+
+def count_pages(buf: Buffer, kind: Optional[str] = None) -> int:
+    """
+    统计PDF/TIFF的页数，其他格式返回1
+
+    PDF在安装pypdf时读取页面树得到准确页数；否则按页面对象估算，
+    页面对象被压缩在对象流中无法直接搜索时，取页面树根节点的/Count
+
+    Args:
+        buf: 文件内容（bytes或mmap）
+        kind: 文档类型，为None时按文件头判断
+
+    Returns:
+        int: 页数，至少为1
+    """
+    kind = kind or document_kind(buf)
+    if kind == "tiff":
+        return _count_tiff_pages(buf)
+    if kind != "pdf":
+        return 1
+
+    if PYPDF_AVAILABLE:
+        try:
+            return max(1, len(PdfReader(_as_stream(buf)).pages))
+        except Exception:
+            pass
+    pages = sum(1 for _ in _PDF_PAGE_PATTERN.finditer(buf))
+    if pages:
+        return pages
+    counts = [int(a or b) for a, b in _PDF_COUNT_PATTERN.findall(buf)]
+    return max(counts) if counts else 1
+
+
+def _count_tiff_pages(buf: Buffer) -> int:
+    """沿IFD链表统计TIFF的页数，只读取每个IFD的头尾几个字节"""
+    endian = '<' if bytes(buf[:2]) == b'II' else '>'
+    size = len(buf)
+    try:
+        offset = struct.unpack_from(endian + 'I', buf, 4)[0]
+        pages = 0
+        seen = set()
+        while offset and offset + 2 <= size and offset not in seen and pages < _MAX_TIFF_PAGES:
+            seen.add(offset)
+            pages += 1
+            entries = struct.unpack_from(endian + 'H', buf, offset)[0]
+            next_pos = offset + 2 + entries * 12
+            if next_pos + 4 > size:
+                break
+            offset = struct.unpack_from(endian + 'I', buf, next_pos)[0]
+        return max(1, pages)
+    except struct.error:
+        return 1
+
+
+def _as_stream(buf: Buffer):
+    """mmap本身支持read/seek，可直接交给pypdf/Pillow；bytes包装为BytesIO"""
+    if isinstance(buf, mmap.mmap):
+        buf.seek(0)
+        return buf
+    return io.BytesIO(buf)
+
+
+def can_split(kind: Optional[str]) -> bool:
+    """当前环境能否在本地拆分该类型的文档"""
+    return (kind == "pdf" and PYPDF_AVAILABLE) or (kind == "tiff" and PIL_AVAILABLE)
+
+
+def split_pages(buf: Buffer, kind: Optional[str] = None) -> Optional[List[bytes]]:
+    """
+    把多页文档拆分为单页文件
+
+    Args:
+        buf: 文件内容（bytes或mmap）
+        kind: 文档类型，为None时按文件头判断
+
+    Returns:
+        List[bytes]: 每页一个文件（PDF拆为单页PDF，TIFF每帧转为PNG）；
+        未安装所需的库或无法解析时返回None，由调用方按页码发起请求
+    """
+    kind = kind or document_kind(buf)
+    if not can_split(kind):
+        return None
+    try:
+        if kind == "pdf":
+            return _split_pdf(buf)
+        return _split_tiff(buf)
+    except Exception:
+        return None
+
+
+def _split_pdf(buf: Buffer) -> List[bytes]:
+    reader = PdfReader(_as_stream(buf))
+    pages = []
+    for page in reader.pages:
+        writer = PdfWriter()
+        writer.add_page(page)
+        output = io.BytesIO()
+        writer.write(output)
+        pages.append(output.getvalue())
+    return pages
+
+
+def _split_tiff(buf: Buffer) -> List[bytes]:
+    pages = []
+    with Image.open(_as_stream(buf)) as img:
+        for frame in ImageSequence.Iterator(img):
+            output = io.BytesIO()
+            frame.convert('RGB').save(output, format='PNG')
+            pages.append(output.getvalue())
+    return pages
+
+
+def plan_pages(buf: Buffer, filename: str,
+               max_request_mb: float = MAX_REQUEST_MB) -> Tuple[str, List[DocumentPage]]:
+    """
+    确定多页文档的识别方式
+
+    Args:
+        buf: 文件内容（bytes或mmap）
+        filename: 原始文件名
+        max_request_mb: 单次请求的文件大小上限(MB)，按页码识别时检查整个文件
+
+    Returns:
+        Tuple[mode, pages]: mode为 "single"（不是多页文档，pages为空，按原方式识别整个文件）、
+        "local"（已在本地拆分，每页单独发送）或 "page_no"（无法本地拆分，
+        每页都发送整个文件并在请求中指定页码；各页的data是同一个memoryview，不复制文件，
+        buf为mmap时需在关闭映射前用完并调用 release()）
+
+    Raises:
+        DocumentTooLarge: 按页码识别且整个文件超过max_request_mb
+    """
+    kind = document_kind(buf)
+    if kind is None:
+        return "single", []
+    page_count = count_pages(buf, kind)
+    if page_count <= 1:
+        return "single", []
+
+    stem, ext = os.path.splitext(os.path.basename(filename or "document"))
+    split = split_pages(buf, kind)
+    if split:
+        page_ext = ".pdf" if kind == "pdf" else ".png"
+        return "local", [
+            DocumentPage(page_no, data, f"{stem}_p{page_no}{page_ext}", None)
+            for page_no, data in enumerate(split, 1)
+        ]
+
+    # 每次请求都发送整个文件，只需检查一次大小
+    if len(buf) > max_request_mb * 1024 * 1024:
+        raise DocumentTooLarge(
+            f"文件无法在本地拆分（需要安装{'pypdf' if kind == 'pdf' else 'Pillow'}），"
+            f"按页码识别时每页都要发送整个文件，文件大小 ({len(buf) / 1024 / 1024:.2f}MB) "
+            f"超过单次请求的{max_request_mb}MB上限"
+        )
+    # 所有页共用同一份文件内容的视图，不复制文件
+    data = memoryview(buf)
+    ext = ext or (".pdf" if kind == "pdf" else ".tif")
+    return "page_no", [
+        DocumentPage(page_no, data, f"{stem}{ext}", page_no)
+        for page_no in range(1, page_count + 1)
+    ]
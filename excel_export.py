@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Excel导出模块
+使用openpyxl的只写模式逐行写入工作表（行数据先写入临时XML文件，不在内存中保留整个工作簿），
+生成的文件按块读出，由网页服务以分块传输的方式下载，内存占用与发票数量无关
+"""
+
+import os
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill
+from openpyxl.utils import get_column_letter
+
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+_HEADER_FONT = Font(bold=True)
+_HEADER_FILL = PatternFill('solid', fgColor='F8F9FA')
+
+
+def _header_cells(sheet, columns: Sequence[str]) -> List[WriteOnlyCell]:
+    cells = []
+    for column in columns:
+        cell = WriteOnlyCell(sheet, value=column)
+        cell.font = _HEADER_FONT
+        cell.fill = _HEADER_FILL
+        cells.append(cell)
+    return cells
+
+
+def write_workbook(path: str, sheets: Iterable[Tuple[str, Sequence[str], Iterable[Dict[str, Any]]]],
+                   column_width: int = 18) -> str:
+    """
+    以只写模式生成Excel文件
+
+    Args:
+        path: 输出文件路径
+        sheets: (工作表名, 列名列表, 行字典的可迭代对象) 序列，行可以是生成器，逐行写入
+        column_width: 列宽（字符数）
+
+    Returns:
+        str: 输出文件路径
+    """
+    workbook = Workbook(write_only=True)
+    for title, columns, rows in sheets:
+        sheet = workbook.create_sheet(title)
+        # 只写模式下列宽和冻结窗格需在写入第一行之前设置
+        for i in range(1, len(columns) + 1):
+            sheet.column_dimensions[get_column_letter(i)].width = column_width
+        sheet.freeze_panes = 'A2'
+        sheet.append(_header_cells(sheet, columns))
+        for row in rows:
+            sheet.append([row.get(column, "") for column in columns])
+    workbook.save(path)
+    return path
+
+
+def new_export_path(suffix: str = '.xlsx') -> str:
+    """在临时目录中创建一个空的导出文件，返回路径"""
+    fd, path = tempfile.mkstemp(prefix='invoice_export_', suffix=suffix)
+    os.close(fd)
+    return path
+
+
+def iter_file_chunks(path: str, chunk_size: int = 64 * 1024, remove: bool = True) -> Iterator[bytes]:
+    """
+    按块读出文件，用作流式响应的内容
+
+    Args:
+        path: 文件路径
+        chunk_size: 每块字节数
+        remove: 读完（或客户端中断下载）后删除文件
+    """
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        if remove:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
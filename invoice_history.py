@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+发票历史记录模块
+把每次识别成功的解析结果和阿里云原始返回数据长期保存在SQLite中，
+不随新的上传或"清空"而删除；按发票代码+号码、开票日期、销售方/购买方税号和金额建立索引，
+数十万张发票中查询也只需毫秒级，且不调用OCR接口
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from table_query import normalize_date
+
+
+DEFAULT_HISTORY_PATH = os.path.join(os.path.expanduser('~'), '.invoice_ocr', 'history.sqlite3')
+
+# 列表查询返回的字段（不含解析结果和原始数据）
+SUMMARY_COLUMNS = ('id', 'invoice_code', 'invoice_number', 'invoice_date', 'seller_name', 'seller_tax_no',
+                   'purchaser_name', 'purchaser_tax_no', 'amount', 'file_name', 'recognized_at')
+
+
+def _to_amount(value: Any) -> Optional[float]:
+    """把 "¥1,234.56" 等金额文本转为数值，无法转换时返回None"""
+    text = "".join(c for c in str(value or "") if c.isdigit() or c in '.-')
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def invoice_key(result: Dict[str, Any]) -> Optional[str]:
+    """
+    发票的唯一键 "发票代码:发票号码"
+
+    Args:
+        result: parse_aliyun_ocr_result 的解析结果
+
+    Returns:
+        str: 唯一键；识别失败或没有发票号码时返回None
+    """
+    if not result or "error" in result:
+        return None
+    basic = result.get("basic_info") or {}
+    code = str(basic.get("发票代码") or "").strip()
+    number = str(basic.get("发票号码") or "").strip()
+    return f"{code}:{number}" if number else None
+
+
+class InvoiceHistory:
+    """基于SQLite的发票历史记录（线程安全，每个线程使用独立连接，可供多个服务进程共享）"""
+
+    def __init__(self, db_path: str = None):
+        """
+        Args:
+            db_path: 数据库文件路径，默认 ~/.invoice_ocr/history.sqlite3
+        """
+        self.db_path = db_path or DEFAULT_HISTORY_PATH
+        self._local = threading.local()
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_db()
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程使用独立连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._conn()
+        # invoice_key 为 "发票代码:发票号码"，同一张发票重复识别时更新原记录；
+        # 缺少号码的结果按原始数据的摘要去重，两者都没有时为NULL，每次识别单独保存
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS invoices (
+                id INTEGER PRIMARY KEY,
+                invoice_key TEXT UNIQUE,
+                invoice_code TEXT NOT NULL DEFAULT '',
+                invoice_number TEXT NOT NULL DEFAULT '',
+                invoice_date TEXT NOT NULL DEFAULT '',
+                seller_name TEXT NOT NULL DEFAULT '',
+                seller_tax_no TEXT NOT NULL DEFAULT '',
+                purchaser_name TEXT NOT NULL DEFAULT '',
+                purchaser_tax_no TEXT NOT NULL DEFAULT '',
+                amount REAL,
+                file_name TEXT NOT NULL DEFAULT '',
+                recognized_at REAL NOT NULL,
+                result TEXT NOT NULL,
+                raw_payload BLOB
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_invoices_number ON invoices (invoice_number, invoice_code)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices (invoice_date)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_invoices_seller ON invoices (seller_tax_no, invoice_date)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_invoices_purchaser ON invoices (purchaser_tax_no, invoice_date)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_invoices_amount ON invoices (amount)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_invoices_recognized ON invoices (recognized_at)")
+        conn.commit()
+
+    def record(self, result: Dict[str, Any], raw_data: Any = None) -> Optional[int]:
+        """
+        保存一张发票的识别结果
+
+        Args:
+            result: parse_aliyun_ocr_result 的解析结果（可含file_name），含error时不保存
+            raw_data: 阿里云返回的原始数据，压缩后保存
+
+        Returns:
+            int: 记录ID；未保存时返回None
+        """
+        if not result or "error" in result:
+            return None
+        basic = result.get("basic_info") or {}
+        seller = result.get("seller_info") or {}
+        purchaser = result.get("purchaser_info") or {}
+        code = str(basic.get("发票代码") or "").strip()
+        number = str(basic.get("发票号码") or "").strip()
+
+        raw_payload = None
+        key = invoice_key(result)
+        if raw_data is not None:
+            text = raw_data if isinstance(raw_data, str) else json.dumps(raw_data, ensure_ascii=False, default=str)
+            raw_payload = zlib.compress(text.encode('utf-8'))
+            if key is None:
+                key = "sha256:" + hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                """
+                INSERT INTO invoices (invoice_key, invoice_code, invoice_number, invoice_date,
+                    seller_name, seller_tax_no, purchaser_name, purchaser_tax_no, amount,
+                    file_name, recognized_at, result, raw_payload)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (invoice_key) DO UPDATE SET
+                    invoice_date = excluded.invoice_date, seller_name = excluded.seller_name,
+                    seller_tax_no = excluded.seller_tax_no, purchaser_name = excluded.purchaser_name,
+                    purchaser_tax_no = excluded.purchaser_tax_no, amount = excluded.amount,
+                    file_name = excluded.file_name, recognized_at = excluded.recognized_at,
+                    result = excluded.result, raw_payload = COALESCE(excluded.raw_payload, raw_payload)
+                """,
+                (key, code, number,
+                 normalize_date(basic.get("开票日期")),
+                 seller.get("名称", ""), str(seller.get("税号") or "").strip().upper(),
+                 purchaser.get("名称", ""), str(purchaser.get("税号") or "").strip().upper(),
+                 _to_amount((result.get("amount_info") or {}).get("发票金额")),
+                 result.get("file_name", ""), time.time(),
+                 json.dumps(result, ensure_ascii=False, default=str), raw_payload)
+            )
+            if key is None:
+                return cursor.lastrowid
+            # 更新已有记录时lastrowid不可靠，按invoice_key取ID
+            return conn.execute("SELECT id FROM invoices WHERE invoice_key = ?", (key,)).fetchone()[0]
+
+    def query(self, invoice_code: str = None, invoice_number: str = None,
+              date_from: str = None, date_to: str = None,
+              seller_tax_no: str = None, purchaser_tax_no: str = None,
+              amount_min: float = None, amount_max: float = None,
+              limit: int = 100, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        按条件查询历史记录，各条件之间为"且"，为空的条件忽略；结果按开票日期倒序
+
+        Args:
+            invoice_code: 发票代码（精确匹配）
+            invoice_number: 发票号码（精确匹配）
+            date_from: 开票日期下限（含），如 "2025-03-01"，也可只写到月 "2025-03"
+            date_to: 开票日期上限（含），只写到月时包含整月
+            seller_tax_no: 销售方税号（精确匹配，不区分大小写）
+            purchaser_tax_no: 购买方税号（精确匹配，不区分大小写）
+            amount_min: 发票金额下限（含）
+            amount_max: 发票金额上限（含）
+            limit: 最多返回的条数
+            offset: 跳过的条数，用于分页
+
+        Returns:
+            Tuple[记录列表, 符合条件的总数]: 记录为 SUMMARY_COLUMNS 字段的字典
+        """
+        where, params = self._where(invoice_code, invoice_number, date_from, date_to,
+                                    seller_tax_no, purchaser_tax_no, amount_min, amount_max)
+        conn = self._conn()
+        total = conn.execute(f"SELECT COUNT(*) FROM invoices {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM invoices {where} "
+            "ORDER BY invoice_date DESC, id DESC LIMIT ? OFFSET ?",
+            params + [max(0, int(limit)), max(0, int(offset))]
+        ).fetchall()
+        return [dict(zip(SUMMARY_COLUMNS, row)) for row in rows], total
+
+    def iter_results(self, batch_size: int = 1000, **filters) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        按记录ID顺序逐批读取符合条件的完整解析结果，用于导出，内存中只保留一批
+
+        Args:
+            batch_size: 每次从数据库读取的条数
+            **filters: 与 query 相同的查询条件
+
+        Yields:
+            Tuple[记录ID, 解析结果]
+        """
+        where, params = self._where(**filters)
+        where = f"{where} AND id > ?" if where else "WHERE id > ?"
+        last_id = 0
+        while True:
+            rows = self._conn().execute(
+                f"SELECT id, result FROM invoices {where} ORDER BY id LIMIT ?",
+                params + [last_id, batch_size]
+            ).fetchall()
+            for record_id, result in rows:
+                yield record_id, json.loads(result)
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+    @staticmethod
+    def _where(invoice_code: str = None, invoice_number: str = None,
+               date_from: str = None, date_to: str = None,
+               seller_tax_no: str = None, purchaser_tax_no: str = None,
+               amount_min: float = None, amount_max: float = None) -> Tuple[str, list]:
+        """按 query 的查询条件生成WHERE子句和参数"""
+        conditions, params = [], []
+        for column, value in (("invoice_code", invoice_code), ("invoice_number", invoice_number),
+                              ("seller_tax_no", seller_tax_no), ("purchaser_tax_no", purchaser_tax_no)):
+            if value:
+                conditions.append(f"{column} = ?")
+                params.append(str(value).strip().upper() if column.endswith("tax_no") else str(value).strip())
+        if date_from:
+            conditions.append("invoice_date >= ?")
+            params.append(normalize_date(date_from))
+        if date_to:
+            # "2025-03" 作为上限时包含 "2025-03-31"
+            conditions.append("invoice_date <= ?")
+            params.append(normalize_date(date_to) + "\uffff")
+        if amount_min is not None:
+            conditions.append("amount >= ?")
+            params.append(float(amount_min))
+        if amount_max is not None:
+            conditions.append("amount <= ?")
+            params.append(float(amount_max))
+        return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+    def find(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        按发票代码和号码查找已保存的发票
+
+        Args:
+            key: invoice_key 的返回值
+
+        Returns:
+            Dict: 记录摘要（SUMMARY_COLUMNS）；没有记录时返回None
+        """
+        row = self._conn().execute(
+            f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM invoices WHERE invoice_key = ?", (key,)
+        ).fetchone()
+        return dict(zip(SUMMARY_COLUMNS, row)) if row else None
+
+    def get(self, record_id: int, include_raw: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        读取一条记录的完整解析结果
+
+        Args:
+            record_id: 记录ID
+            include_raw: 是否同时返回阿里云原始数据（raw_data字段）
+
+        Returns:
+            Dict: 解析结果，附带 history_id 和 recognized_at；不存在时返回None
+        """
+        row = self._conn().execute(
+            "SELECT result, recognized_at, raw_payload FROM invoices WHERE id = ?", (record_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        result = json.loads(row[0])
+        result.update(history_id=record_id, recognized_at=row[1])
+        if include_raw:
+            result["raw_data"] = json.loads(zlib.decompress(row[2]).decode('utf-8')) if row[2] else None
+        return result
+
+    def count(self) -> int:
+        """历史记录总数"""
+        return self._conn().execute("SELECT COUNT(*) FROM invoices").fetchone()[0]
+
+
+def history_from_env() -> Optional[InvoiceHistory]:
+    """
+    根据环境变量创建历史记录
+
+    环境变量:
+        HISTORY_ENABLED: 设为0时不保存历史记录，默认保存
+        HISTORY_DB_PATH: 数据库文件路径，默认 ~/.invoice_ocr/history.sqlite3
+
+    Returns:
+        InvoiceHistory: 历史记录实例；禁用或创建失败时返回None
+    """
+    if os.environ.get('HISTORY_ENABLED', '1') == '0':
+        return None
+    try:
+        return InvoiceHistory(os.environ.get('HISTORY_DB_PATH') or None)
+    except (OSError, sqlite3.Error) as e:
+        print(f"发票历史记录初始化失败，已禁用: {e}")
+        return None
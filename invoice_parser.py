@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+阿里云发票识别结果解析模块
+阿里云字段到页面展示字段的映射以声明式表格定义，导入时编译为扁平的查找表，
+单张解析只需一次遍历；JSON解码器可替换（优先使用orjson/ujson），
+并支持批量解析缓存或归档中的原始返回数据
+"""
+
+import json
+import os
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from bank_info import extract_bank_info
+from metrics import STAGE_SECONDS
+
+
+# 解析器版本，修改解析逻辑时递增，使旧的缓存条目失效
+PARSER_VERSION = "1"
+
+# 各展示分区对应的阿里云字段，字段值为空时不输出
+INVOICE_SCHEMA = {
+    "basic_info": {
+        'invoiceCode': '发票代码', 'invoiceNumber': '发票号码', 'invoiceDate': '开票日期',
+        'drawer': '开票人', 'remarks': '备注',
+    },
+    "seller_info": {'sellerName': '名称', 'sellerTaxNumber': '税号'},
+    "purchaser_info": {'purchaserName': '名称', 'purchaserTaxNumber': '税号'},
+    "amount_info": {
+        'totalAmount': '发票金额',
+        'invoiceAmountPreTax': '不含税金额',
+        'invoiceTax': '发票税额'
+    },
+}
+
+# 发票明细(invoiceDetails)中每一项的字段映射
+DETAIL_SCHEMA = {'itemName': '货物名称', 'quantity': '数量', 'amount': '金额'}
+
+# 结果中固定包含的分区，顺序与页面展示一致
+RESULT_SECTIONS = ("basic_info", "seller_info", "purchaser_info", "amount_info", "invoice_details", "image_info")
+
+
+def get_json_loads(name: str = None) -> Callable[[Any], Any]:
+    """
+    获取JSON解码函数
+
+    Args:
+        name: orjson、ujson、json 或 auto；为None时读取环境变量 OCR_JSON_DECODER，默认auto
+            （依次尝试orjson、ujson，都未安装时使用标准库json）
+
+    Returns:
+        Callable: 接受str/bytes并返回Python对象的函数，解码失败时抛出ValueError
+    """
+    name = (name or os.environ.get('OCR_JSON_DECODER', 'auto')).lower()
+    candidates = ('orjson', 'ujson') if name == 'auto' else (name,)
+    for candidate in candidates:
+        if candidate == 'json':
+            break
+        try:
+            module = __import__(candidate)
+        except ImportError:
+            if name != 'auto':
+                print(f"未安装{candidate}，使用标准库json解码")
+            continue
+        return module.loads
+    return json.loads
+
+
+class InvoiceParser:
+    """把阿里云 RecognizeInvoice 返回的原始数据解析为页面使用的结构"""
+
+    def __init__(self, schema: Dict[str, Dict[str, str]] = None, detail_schema: Dict[str, str] = None,
+                 loads: Callable[[Any], Any] = None):
+        """
+        Args:
+            schema: 分区 -> {阿里云字段: 展示名称}，默认 INVOICE_SCHEMA
+            detail_schema: 明细项字段映射，默认 DETAIL_SCHEMA
+            loads: JSON解码函数，默认由 get_json_loads() 选择
+        """
+        self.schema = schema or INVOICE_SCHEMA
+        self.detail_schema = detail_schema or DETAIL_SCHEMA
+        self.loads = loads or get_json_loads()
+        # 编译为 (阿里云字段, 分区, 展示名称) 的扁平元组，解析时顺序遍历一次
+        self._fields: Tuple[Tuple[str, str, str], ...] = tuple(
+            (api_field, section, display_name)
+            for section, mapping in self.schema.items()
+            for api_field, display_name in mapping.items()
+        )
+        self._detail_fields: Tuple[Tuple[str, str], ...] = tuple(self.detail_schema.items())
+
+    def parse(self, raw_data: Any) -> Dict[str, Any]:
+        """
+        解析一条原始返回数据
+
+        Args:
+            raw_data: response.body.to_map() 的返回值，也可以是其JSON文本
+
+        Returns:
+            Dict: 按分区组织的识别结果；失败时包含error和raw_data
+        """
+        try:
+            if isinstance(raw_data, (str, bytes)):
+                try:
+                    raw_data = self.loads(raw_data)
+                except ValueError:
+                    return {"error": "解析原始数据失败", "raw_data": raw_data}
+            if 'Data' not in raw_data:
+                return {"error": "返回数据中没有'Data'字段", "raw_data": raw_data}
+            data_dict = raw_data['Data']
+            if isinstance(data_dict, (str, bytes)):
+                try:
+                    data_dict = self.loads(data_dict)
+                except ValueError:
+                    return {"error": "解析Data字符串失败", "raw_data": data_dict}
+
+            if 'data' not in data_dict:
+                return {"error": "没有找到嵌套的data字段", "raw_data": data_dict}
+            invoice_data = data_dict['data']
+            if isinstance(invoice_data, (str, bytes)):
+                try:
+                    invoice_data = self.loads(invoice_data)
+                except ValueError:
+                    invoice_data = {}
+            if not isinstance(invoice_data, dict):
+                invoice_data = {}
+
+            return self._extract(invoice_data)
+        except Exception as e:
+            return {"error": f"解析过程中出错: {str(e)}", "raw_data": raw_data}
+
+    def _extract(self, invoice_data: Dict[str, Any]) -> Dict[str, Any]:
+        result = {section: {} for section in RESULT_SECTIONS}
+        result["invoice_details"] = []
+        get = invoice_data.get
+        for api_field, section, display_name in self._fields:
+            value = get(api_field)
+            if value:
+                result[section][display_name] = value
+
+        details = get('invoiceDetails')
+        if details:
+            if isinstance(details, (str, bytes)):
+                try:
+                    details = self.loads(details)
+                except ValueError:
+                    details = []
+            if isinstance(details, list):
+                append = result["invoice_details"].append
+                for detail in details:
+                    if isinstance(detail, dict):
+                        parsed_detail = {}
+                        for api_field, display_name in self._detail_fields:
+                            value = detail.get(api_field)
+                            if value:
+                                parsed_detail[display_name] = value
+                        if parsed_detail:
+                            append(parsed_detail)
+
+        remarks = get('remarks')
+        if remarks:
+            # 尝试从备注中提取银行信息
+            bank_info = extract_bank_info(remarks)
+            result["seller_info"]["开户行"] = bank_info["开户行"]
+            result["seller_info"]["银行账号"] = bank_info["银行账号"]
+
+        return result
+
+    def parse_many(self, raw_items: Iterable[Any]) -> List[Dict[str, Any]]:
+        """
+        批量解析原始返回数据
+
+        Args:
+            raw_items: 原始返回数据（dict或JSON文本）的可迭代对象，如从OCR缓存中导出的payload
+
+        Returns:
+            List[Dict]: 与输入顺序一致的解析结果
+        """
+        parse = self.parse
+        return [parse(raw_data) for raw_data in raw_items]
+
+
+default_parser = InvoiceParser()
+
+
+@STAGE_SECONDS.time(stage="parse")
+def parse_aliyun_ocr_result(raw_data: Any) -> Dict[str, Any]:
+    """使用默认解析器解析一条原始返回数据"""
+    return default_parser.parse(raw_data)
+
+
+def parse_many(raw_items: Iterable[Any]) -> List[Dict[str, Any]]:
+    """使用默认解析器批量解析原始返回数据"""
+    return default_parser.parse_many(raw_items)
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+后台识别任务队列
+上传后立即返回任务ID，识别在服务器进程内的线程池中执行，
+页面通过任务ID轮询进度和已完成的结果
+"""
+
+import json
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+class Job:
+    """一次批量识别任务，结果按提交顺序保存"""
+
+    def __init__(self, job_id: str, total: int, meta: Dict[str, Any] = None):
+        self.job_id = job_id
+        self.total = total
+        self.meta = meta or {}
+        self.results: List[Optional[Dict[str, Any]]] = [None] * total
+        self.completed = 0
+        self.status = "queued" if total else "done"
+        self.created_at = time.time()
+        self.finished_at = None if total else self.created_at
+        self._lock = threading.Lock()
+        self._updated = threading.Condition(self._lock)
+
+    @property
+    def done(self) -> bool:
+        return self.status == "done"
+
+    def _set_result(self, index: int, result: Dict[str, Any]):
+        with self._lock:
+            self.results[index] = result
+            self.completed += 1
+            self.status = "running"
+            if self.completed >= self.total:
+                self.status = "done"
+                self.finished_at = time.time()
+            self._updated.notify_all()
+
+    def wait_for_update(self, seen_completed: int, timeout: float) -> bool:
+        """
+        等待任务进度更新
+
+        Args:
+            seen_completed: 调用方已知的完成数
+            timeout: 最长等待时间(秒)
+
+        Returns:
+            bool: 完成数超过seen_completed或任务已结束时返回True，超时返回False
+        """
+        with self._updated:
+            return self._updated.wait_for(
+                lambda: self.completed > seen_completed or self.status == "done", timeout
+            )
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        获取任务当前状态的副本
+
+        Returns:
+            Dict: 包含状态、进度和结果列表（未完成的位置为None）
+        """
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "total": self.total,
+                "completed": self.completed,
+                "results": list(self.results),
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+            }
+
+
+class JobQueue:
+    """在共享线程池中执行识别任务，所有任务共用同一个并发上限"""
+
+    def __init__(self, max_workers: int = 4, max_jobs: int = 100):
+        """
+        初始化任务队列
+
+        Args:
+            max_workers: 同时执行的子任务数上限（即同时在途的OCR请求数）
+            max_jobs: 内存中保留的任务数，超出后丢弃最早完成的任务
+        """
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ocr-job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, tasks: List[Callable[[], Dict[str, Any]]], meta: Dict[str, Any] = None,
+               on_result: Callable[[str, int, Dict[str, Any]], None] = None,
+               job_id: str = None) -> str:
+        """
+        提交一批子任务
+
+        Args:
+            tasks: 无参可调用对象列表，每个返回一张发票的处理结果
+            meta: 随任务保存的附加信息（如文件名）
+            on_result: 每个子任务完成时以 (任务ID, 序号, 结果) 调用，在通知进度之前执行，
+                可用于把结果写入共享存储
+            job_id: 任务ID，默认自动生成；调用方需要在子任务开始前记录ID时传入
+
+        Returns:
+            str: 任务ID
+        """
+        job = Job(job_id or uuid.uuid4().hex, len(tasks), meta)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._prune()
+
+        for index, task in enumerate(tasks):
+            self._executor.submit(self._run_task, job, index, task, on_result)
+        return job.job_id
+
+    @staticmethod
+    def _run_task(job: Job, index: int, task: Callable[[], Dict[str, Any]],
+                  on_result: Optional[Callable[[str, int, Dict[str, Any]], None]]):
+        try:
+            result = task()
+        except Exception as e:
+            traceback.print_exc()
+            result = {"error": f"处理失败: {str(e)}"}
+        if on_result is not None:
+            try:
+                on_result(job.job_id, index, result)
+            except Exception:
+                traceback.print_exc()
+        job._set_result(index, result)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """按ID获取任务，不存在或已被清理时返回None"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        """丢弃超出保留数量的已完成任务（调用方需持有锁）"""
+        excess = len(self._jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done][:excess]:
+            del self._jobs[job_id]
+
+    def shutdown(self, wait: bool = False):
+        """关闭线程池"""
+        self._executor.shutdown(wait=wait)
+
+
+def iter_job_events(job: Job, keepalive_seconds: float = 15,
+                    max_seconds: Optional[float] = None) -> Iterator[str]:
+    """
+    以Server-Sent Events格式逐条输出任务进度，任务结束或超过最长时间后停止
+
+    每条progress事件包含本次新完成的发票序号，客户端据此只更新对应的发票；
+    长时间无进度时输出注释行保持连接，客户端断开后下一次写入即失败，流随之结束。
+    超过max_seconds时输出timeout事件后结束，客户端改为轮询，不长期占用服务线程。
+
+    Args:
+        job: 识别任务
+        keepalive_seconds: 保活注释的间隔(秒)
+        max_seconds: 单个连接的最长时间(秒)，None表示直到任务结束
+
+    Yields:
+        str: SSE格式的文本块
+    """
+    sent = set()
+    seen_completed = -1
+    deadline = None if max_seconds is None else time.monotonic() + max_seconds
+    while True:
+        wait = keepalive_seconds
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                yield f"event: timeout\ndata: {json.dumps({'job_id': job.job_id})}\n\n"
+                return
+            wait = min(wait, remaining)
+        if not job.wait_for_update(seen_completed, wait):
+            yield ": keepalive\n\n"
+            continue
+
+        snapshot = job.snapshot()
+        seen_completed = snapshot["completed"]
+        indices = [index for index, result in enumerate(snapshot["results"])
+                   if result is not None and index not in sent]
+        sent.update(indices)
+        if not indices and snapshot["status"] != "done":
+            continue
+
+        payload = {
+            "job_id": job.job_id,
+            "completed": snapshot["completed"],
+            "total": snapshot["total"],
+            "done": snapshot["status"] == "done",
+            "indices": indices,
+        }
+        yield f"event: progress\ndata: {json.dumps(payload)}\n\n"
+
+        if payload["done"]:
+            return
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+性能指标模块
+记录识别流程各阶段的耗时直方图和计数器，按Prometheus文本格式输出，
+由网页服务的 /metrics 地址提供给监控系统抓取；不依赖prometheus_client
+"""
+
+import bisect
+import functools
+import threading
+import time
+from typing import Dict, List, Sequence, Tuple
+
+
+# Prometheus文本格式的Content-Type
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 默认耗时分桶(秒)：覆盖解码/解析的亚毫秒级到接口调用的数十秒
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Registry:
+    """指标注册表，render() 输出所有已注册指标"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if any(existing.name == metric.name for existing in self._metrics):
+                raise ValueError(f"指标已注册: {metric.name}")
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        """
+        按Prometheus文本格式输出所有指标
+
+        Returns:
+            str: 以换行结尾的文本
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Registry = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}，收到 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    """只增不减的计数器（线程安全）"""
+
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 无标签的计数器从0开始输出，便于监控计算速率
+        self._values: Dict[Tuple[str, ...], float] = {} if self.labelnames else {(): 0.0}
+
+    def inc(self, amount: float = 1.0, **labels):
+        """
+        增加计数
+
+        Args:
+            amount: 增量，不能为负
+            **labels: 标签值，需与labelnames一致
+        """
+        if amount < 0:
+            raise ValueError("计数器只能增加")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in items]
+
+
+class _Timer:
+    """Histogram.time() 的返回值，可用作上下文管理器或装饰器"""
+
+    def __init__(self, histogram: 'Histogram', labels: Dict[str, str]):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._start, **self._labels)
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(self._histogram, self._labels):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+class Histogram(_Metric):
+    """分桶直方图（线程安全），用于耗时和大小的分布"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Registry = REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        # 每组标签对应 [各桶计数(不累计，最后一个为+Inf), 总和]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        """
+        记录一次观测值
+
+        Args:
+            value: 观测值（耗时为秒）
+            **labels: 标签值，需与labelnames一致
+        """
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def time(self, **labels) -> _Timer:
+        """
+        计时器，退出时记录经过的秒数
+
+        用法:
+            with STAGE_SECONDS.time(stage="parse"): ...
+            @STAGE_SECONDS.time(stage="validate")
+        """
+        self._key(labels)
+        return _Timer(self, labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+# ==================== 识别流程指标 ====================
+STAGE_SECONDS = Histogram(
+    'invoice_ocr_stage_seconds',
+    '各处理阶段耗时(秒)：decode=上传内容解码，validate=文件验证，api_call=单次接口调用，'
+    'parse=识别结果解析，layout=上传回调生成页面，render=结果页面更新，export=生成Excel文件',
+    ('stage',)
+)
+API_BYTES_SENT = Counter(
+    'invoice_ocr_api_bytes_sent_total',
+    '发送给OCR接口的文件字节数（含重试）'
+)
+API_ERRORS = Counter(
+    'invoice_ocr_api_errors_total',
+    'OCR接口调用失败次数，按阿里云错误码（无错误码时为异常类型）统计',
+    ('code',)
+)
+CACHE_LOOKUPS = Counter(
+    'invoice_ocr_cache_lookups_total',
+    '识别结果缓存查询次数，result为hit或miss',
+    ('result',)
+)
+RECOGNITIONS = Counter(
+    'invoice_ocr_recognitions_total',
+    '识别完成的文件数，status为success、cache_hit或failed',
+    ('status',)
+)
+
+
+def render() -> str:
+    """输出默认注册表中的所有指标"""
+    return REGISTRY.render()
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+OCR结果持久化缓存模块
+以图片字节的SHA-256为键，在SQLite中保存阿里云接口返回的原始数据，
+重复上传同一张发票时直接返回缓存结果，不再调用OCR接口
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.invoice_ocr', 'cache')
+
+
+class OCRCache:
+    """基于SQLite的OCR原始结果缓存（线程安全）"""
+
+    def __init__(self, cache_dir: str = None, max_entries: int = 10000,
+                 max_size_mb: float = 200, ttl_seconds: Optional[float] = 30 * 24 * 3600,
+                 parser_version: str = "1"):
+        """
+        初始化缓存
+
+        Args:
+            cache_dir: 缓存目录，数据库文件为其中的ocr_cache.sqlite3
+            max_entries: 最多保留的条目数，超出后按最近访问时间淘汰
+            max_size_mb: 缓存数据总大小上限(MB)
+            ttl_seconds: 条目有效期(秒)，None表示永不过期
+            parser_version: 解析器版本，版本不一致的条目视为未命中
+        """
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_entries = max_entries
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.ttl_seconds = ttl_seconds
+        self.parser_version = parser_version
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.db_path = os.path.join(self.cache_dir, 'ocr_cache.sqlite3')
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._init_db()
+
+    def _init_db(self):
+        """创建缓存表和索引"""
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS ocr_results (
+                    digest TEXT PRIMARY KEY,
+                    parser_version TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_ocr_results_accessed ON ocr_results (accessed_at)"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def hash_bytes(data: bytes) -> str:
+        """计算图片字节的SHA-256摘要"""
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        """
+        按摘要读取缓存的原始数据
+
+        Args:
+            digest: 图片字节的SHA-256摘要
+
+        Returns:
+            Dict: 原始数据；未命中、已过期或解析器版本不一致时返回None
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT parser_version, payload, created_at FROM ocr_results WHERE digest = ?",
+                (digest,)
+            ).fetchone()
+
+            if row is None or row[0] != self.parser_version or self._is_expired(row[2], now):
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE ocr_results SET accessed_at = ? WHERE digest = ?", (now, digest)
+            )
+            self._conn.commit()
+            self.hits += 1
+
+        return json.loads(row[1])
+
+    def set(self, digest: str, raw_data: Dict[str, Any]):
+        """
+        写入原始数据，并在超出容量时淘汰旧条目
+
+        Args:
+            digest: 图片字节的SHA-256摘要
+            raw_data: response.body.to_map() 的返回值
+        """
+        payload = json.dumps(raw_data, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ocr_results "
+                "(digest, parser_version, payload, size_bytes, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, self.parser_version, payload, len(payload.encode('utf-8')), now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def _evict(self, now: float):
+        """淘汰过期条目，再按最近访问时间淘汰超出容量的条目（调用方需持有锁）"""
+        if self.ttl_seconds is not None:
+            self._conn.execute(
+                "DELETE FROM ocr_results WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+
+        count, total_size = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM ocr_results"
+        ).fetchone()
+        if count <= self.max_entries and total_size <= self.max_size_bytes:
+            return
+
+        # 一次淘汰到容量的90%，避免每次写入都触发淘汰
+        target_count = int(self.max_entries * 0.9)
+        target_size = int(self.max_size_bytes * 0.9)
+        rows = self._conn.execute(
+            "SELECT digest, size_bytes FROM ocr_results ORDER BY accessed_at"
+        )
+        to_delete = []
+        for digest, size_bytes in rows:
+            if count <= target_count and total_size <= target_size:
+                break
+            to_delete.append((digest,))
+            count -= 1
+            total_size -= size_bytes
+        self._conn.executemany("DELETE FROM ocr_results WHERE digest = ?", to_delete)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计信息
+
+        Returns:
+            Dict: 命中/未命中次数、条目数和占用大小
+        """
+        with self._lock:
+            count, total_size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM ocr_results"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": count,
+            "size_mb": total_size / 1024 / 1024,
+        }
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM ocr_results")
+            self._conn.commit()
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+def cache_from_env(parser_version: str = "1") -> Optional[OCRCache]:
+    """
+    根据环境变量创建缓存
+
+    环境变量:
+        OCR_CACHE_ENABLED: 设为0时禁用缓存，默认启用
+        OCR_CACHE_DIR: 缓存目录
+        OCR_CACHE_MAX_ENTRIES: 最大条目数，默认10000
+        OCR_CACHE_MAX_MB: 最大占用(MB)，默认200
+        OCR_CACHE_TTL_DAYS: 有效期(天)，默认30，设为0表示永不过期
+
+    Returns:
+        OCRCache: 缓存实例；禁用或创建失败时返回None
+    """
+    if os.environ.get('OCR_CACHE_ENABLED', '1') == '0':
+        return None
+
+    ttl_days = float(os.environ.get('OCR_CACHE_TTL_DAYS', '30'))
+    try:
+        return OCRCache(
+            cache_dir=os.environ.get('OCR_CACHE_DIR') or None,
+            max_entries=int(os.environ.get('OCR_CACHE_MAX_ENTRIES', '10000')),
+            max_size_mb=float(os.environ.get('OCR_CACHE_MAX_MB', '200')),
+            ttl_seconds=ttl_days * 24 * 3600 if ttl_days > 0 else None,
+            parser_version=parser_version,
+        )
+    except (OSError, sqlite3.Error) as e:
+        print(f"OCR缓存初始化失败，已禁用缓存: {e}")
+        return None
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+发票预览卡片
+按页生成预览卡片，页面只构建和发送当前页的卡片（以及它们引用的缩略图），
+上传数百张发票时浏览器中的组件数量和回调响应大小与发票总数无关
+"""
+
+import math
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import dash_bootstrap_components as dbc
+from dash import html
+
+
+def build_preview_image(image_src, style):
+    if not image_src:
+        # PDF等无法生成缩略图的文件显示图标
+        return html.Div(html.I(className="bi bi-file-earmark-image display-4 text-muted"),
+                        className="rounded border py-5")
+    return html.Img(src=image_src, style=style, className="rounded border")
+
+
+def duplicate_title(duplicate_of):
+    """疑似重复标记的提示文字：与哪个文件（或哪次识别）的发票代码和号码相同"""
+    recognized_at = duplicate_of.get("recognized_at")
+    source = duplicate_of.get("file_name") or "之前的上传"
+    if recognized_at:
+        source += f"（{time.strftime('%Y-%m-%d %H:%M', time.localtime(recognized_at))} 识别）"
+    return f"发票代码和号码与 {source} 相同，可能是重复上传"
+
+
+def build_preview_card(idx, result, image_src, filename):
+    # 创建发票预览项
+    if "error" not in result:
+        # 成功识别
+        status_badge = dbc.Badge("成功", className="status-badge bg-success ms-2")
+        if result.get("duplicate_of"):
+            status_badge = html.Span([
+                dbc.Badge("疑似重复", className="status-badge bg-warning text-dark ms-2",
+                          title=duplicate_title(result["duplicate_of"])),
+                status_badge
+            ])
+        details = dbc.Row([                
+            # 第一行：开票日期（普通样式，无框包裹）
+            dbc.Row([
+                dbc.Col([
+                    html.Div([
+                        html.Strong("开票日期: ", className="me-2"),
+                        html.Span(result["basic_info"].get("开票日期", "—"))
+                    ], className="py-2")
+                ], xs=12, className="mb-3")
+            ]),
+            # 第而行：第一列发票识别详情（卡片框），第二列销售方和金额（相同格式框）
+            dbc.Row([
+                # 第一列：发票识别详情（使用卡片框）
+                dbc.Col([
+                    dbc.Card([
+                        dbc.CardBody([
+                            html.Div([
+                                html.Small("销售方", className="text-muted d-block mb-2"),
+                                html.Div([
+                                    html.Span(result["seller_info"].get("名称", "—"), className="fw-bold")
+                                ], className="mb-1"),
+                            ])
+                        ], className="py-2 px-3")
+                    ], className="h-100")
+                ], xs=12, md=6, className="mb-3"),
+                
+                # 第二列：销售方和金额（相同格式框）
+                dbc.Col([
+                    dbc.Card([
+                        dbc.CardBody([
+                            html.Div([
+                                html.Small("发票金额", className="text-muted d-block mb-2"),
+                                html.Div([
+                                    html.Span("¥", className="me-1"),
+                                    html.Span(result["amount_info"].get("发票金额", "0.00"), 
+                                            className="fw-bold fs-4 success-color")
+                                ])
+                            ])
+                        ], className="py-2 px-3")
+                    ], className="h-100")
+                ], xs=12, md=6, className="mb-3")
+            ], className="mb-3"),
+               
+            # 第三行：备注信息（开户行和账号）
+            dbc.Row([
+                # 第一列：开户行
+                dbc.Col([
+                    dbc.Card([
+                        dbc.CardBody([
+                            html.Div([
+                                html.Small("开户行信息", className="text-muted d-block mb-1"),
+                                html.Div([
+                                    html.Span(result.get("seller_info", {}).get("开户行", "").split()[0] 
+                                            if result.get("seller_info", {}).get("开户行") 
+                                            else "—")
+                                ])
+                            ])
+                        ], className="py-2 px-3")
+                    ], className="h-100")
+                ], xs=12, md=6, className="mb-3"),
+                
+                # 第二列：账号
+                dbc.Col([
+                    dbc.Card([
+                        dbc.CardBody([
+                            html.Div([
+                                html.Small("银行账号", className="text-muted d-block mb-1"),
+                                html.Div([
+                                    html.Span(result.get("seller_info", {}).get("银行账号", "").split()[-1] 
+                                            if result.get("seller_info", {}).get("银行账号") 
+                                            else "—")
+                                ])
+                            ])
+                        ], className="py-2 px-3")
+                    ], className="h-100")
+                ], xs=12, md=6, className="mb-3")
+            ])
+        ])
+        
+        # 图片列
+        img_section = html.Div([
+            build_preview_image(image_src,
+                                style={'maxWidth': '100%', 'maxHeight': '200px', 'objectFit': 'contain'}),
+            html.Div([
+                html.Small(f"{filename}", className="text-muted d-block mt-2 text-center")
+            ])
+        ], className="text-center")
+        
+    else:
+        # 识别失败
+        status_badge = dbc.Badge("失败", className="status-badge bg-danger ms-2")
+        
+        details = html.Div([
+            html.Div([
+                html.I(className="bi bi-exclamation-triangle me-2 text-warning"),
+                html.Strong("识别失败", className="error-color")
+            ], className="mb-2"),
+            html.P(result.get("error", "未知错误"), className="text-muted small"),
+            html.Div([
+                html.Small(f"文件: {filename}", className="text-muted")
+            ], className="mt-2")
+        ], className="py-3")
+        
+        img_section = html.Div([
+            build_preview_image(image_src,
+                                style={'maxWidth': '100%', 'maxHeight': '200px', 'objectFit': 'contain', 
+                                       'filter': 'grayscale(70%)', 'opacity': '0.7'}),
+            html.Div([
+                html.Small("识别失败", className="text-danger d-block mt-2 text-center")
+            ])
+        ], className="text-center")
+
+    if result.get("pages"):
+        # 多页文档：卡片展示第一张识别成功的发票，各页结果见结果表格
+        status_badge = html.Span([
+            dbc.Badge(f"共{len(result['pages'])}页", className="status-badge bg-info ms-2",
+                      title="多页文档，每页的识别结果见结果表格"),
+            status_badge
+        ])
+
+    # 发票预览项
+    preview_item = dbc.Row([
+        dbc.Col([
+            html.Div([
+                html.Div([
+                    html.Div([
+                        html.I(className="bi bi-file-earmark-text me-2"),
+                        html.Strong(f"发票 {idx+1}", className="fs-5")
+                    ], className="d-flex align-items-center"),
+                    status_badge
+                ], className="d-flex justify-content-between align-items-center mb-3"),
+                dbc.Row([
+                    dbc.Col(img_section, xs=12, md=4, className="mb-3"),
+                    dbc.Col(details, xs=12, md=8)
+                ])
+            ], className="invoice-item")
+        ], width=12)
+    ])
+
+    return preview_item
+
+
+def build_pending_card(idx, filename):
+    return dbc.Row([
+        dbc.Col([
+            html.Div([
+                html.Div([
+                    html.Div([
+                        html.I(className="bi bi-file-earmark-text me-2"),
+                        html.Strong(f"发票 {idx+1}", className="fs-5")
+                    ], className="d-flex align-items-center"),
+                    dbc.Badge("识别中", className="status-badge bg-secondary ms-2")
+                ], className="d-flex justify-content-between align-items-center mb-3"),
+                html.Small(filename, className="loading-text")
+            ], className="invoice-item")
+        ], width=12)
+    ])
+
+
+def page_count(total: int, page_size: int) -> int:
+    """预览卡片的总页数，至少为1"""
+    return max(1, math.ceil(total / max(1, page_size)))
+
+
+def page_bounds(page: Optional[int], total: int, page_size: int) -> Tuple[int, int]:
+    """
+    某一页卡片的序号范围
+
+    Args:
+        page: 页码，从1开始，超出范围时取第一页或最后一页
+        total: 发票总数
+        page_size: 每页卡片数
+
+    Returns:
+        Tuple[起始序号, 结束序号]: 左闭右开
+    """
+    page_size = max(1, page_size)
+    page = min(max(1, int(page or 1)), page_count(total, page_size))
+    start = (page - 1) * page_size
+    return start, min(start + page_size, total)
+
+
+def build_preview_page(uploads: Sequence[Sequence[Any]], results: Sequence[Optional[Dict[str, Any]]],
+                       page: Optional[int], page_size: int) -> List[Any]:
+    """
+    生成一页预览卡片
+
+    Args:
+        uploads: 会话的上传记录 [临时文件路径, 文件名, 内容摘要]
+        results: 按序号排列的识别结果，未完成的位置为None（显示占位卡片）
+        page: 页码，从1开始
+        page_size: 每页卡片数
+
+    Returns:
+        List: 当前页的卡片
+    """
+    start, end = page_bounds(page, len(uploads), page_size)
+    cards = []
+    for idx in range(start, end):
+        filename = uploads[idx][1]
+        result = results[idx]
+        if result is None:
+            cards.append(build_pending_card(idx, filename))
+        else:
+            cards.append(build_preview_card(idx, result, result.get("thumbnail_url"), filename))
+    return cards
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+运行中服务的性能剖析模块
+按需对接下来的N次上传做采样式CPU剖析，输出火焰图工具可直接读取的折叠栈（folded stacks）文件，
+并在批次开始和结束时各取一次tracemalloc快照，输出内存增长最多的分配位置；
+无需重启服务，也不依赖第三方剖析工具
+"""
+
+import hmac
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+
+DEFAULT_PROFILE_DIR = os.path.join(os.path.expanduser('~'), '.invoice_ocr', 'profiles')
+
+
+def _frame_label(code) -> str:
+    # 按函数定义所在行聚合，同一函数的不同执行位置合并为一帧
+    filename = os.path.basename(code.co_filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(';', ':')
+
+
+class SamplingProfiler:
+    """
+    按固定间隔采集所有线程调用栈的采样剖析器（墙钟时间）
+
+    上传回调在请求线程中执行，识别和解析在任务队列的线程池中执行，因此采集全部线程；
+    每个栈以线程名为根，等待中的空闲线程也会出现在结果中
+    """
+
+    def __init__(self, interval: float = 0.005):
+        """
+        Args:
+            interval: 采样间隔(秒)
+        """
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+
+    def sample(self, skip_thread: Optional[int] = None):
+        """采集一次所有线程的调用栈，skip_thread 为不采集的线程ID（通常是采样线程自身）"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == skip_thread:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(thread_id, f"thread-{thread_id}").replace(';', ':'))
+            stack.reverse()
+            self.stacks[";".join(stack)] += 1
+        self.samples += 1
+
+    def folded(self) -> str:
+        """
+        输出折叠栈文本，每行为 "根;调用者;...;被调用者 采样数"，
+        可直接交给 flamegraph.pl、speedscope 或 inferno 生成火焰图
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfileCapture:
+    """一次上传批次的剖析，由 ProfileController.begin 创建"""
+
+    def __init__(self, controller: 'ProfileController', label: str):
+        self.controller = controller
+        self.label = label
+        self.capture_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.profiler = SamplingProfiler(controller.interval)
+        self.started_at = time.monotonic()
+        self._done: Optional[Callable[[], bool]] = None
+        self._stop = threading.Event()
+
+        # 未在追踪时临时开启tracemalloc，批次结束后关闭，避免常驻的内存和性能开销
+        self._owns_tracemalloc = not tracemalloc.is_tracing()
+        if self._owns_tracemalloc:
+            tracemalloc.start(controller.traceback_frames)
+        self._before = tracemalloc.take_snapshot()
+
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop_when(self, done: Callable[[], bool]):
+        """
+        设置结束条件，满足后停止采样并写出结果
+
+        Args:
+            done: 返回批次是否已完成的函数，如 lambda: job.done
+        """
+        self._done = done
+
+    def stop(self):
+        """立即停止采样并写出结果"""
+        self._stop.set()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        deadline = self.started_at + self.controller.max_seconds
+        try:
+            while not self._stop.is_set() and time.monotonic() < deadline:
+                self.profiler.sample(skip_thread=own_id)
+                if self._done is not None and self._done():
+                    break
+                self._stop.wait(self.profiler.interval)
+        finally:
+            self.controller._finish(self)
+
+    def write(self) -> List[str]:
+        """写出折叠栈和内存报告，返回文件路径"""
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+
+        os.makedirs(self.controller.output_dir, exist_ok=True)
+        base = os.path.join(self.controller.output_dir, f"{self.label}-{self.capture_id}")
+        cpu_path = base + ".folded"
+        with open(cpu_path, 'w', encoding='utf-8') as f:
+            f.write(self.profiler.folded())
+
+        elapsed = time.monotonic() - self.started_at
+        memory_path = base + ".memory.txt"
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        diff = after.filter_traces(filters).compare_to(self._before.filter_traces(filters), 'lineno')
+        with open(memory_path, 'w', encoding='utf-8') as f:
+            f.write(f"批次: {self.label}  耗时: {elapsed:.2f} 秒  CPU采样数: {self.profiler.samples}\n")
+            f.write(f"tracemalloc 当前: {current / 1024 / 1024:.2f} MB  峰值: {peak / 1024 / 1024:.2f} MB\n\n")
+            f.write(f"批次期间内存增长最多的 {self.controller.top} 个分配位置:\n")
+            for stat in diff[:self.controller.top]:
+                f.write(f"{stat}\n")
+        return [cpu_path, memory_path]
+
+
+class ProfileController:
+    """剖析开关：记录还需剖析的上传次数，同一时间只进行一次剖析（线程安全）"""
+
+    def __init__(self, output_dir: str = None, interval: float = 0.005, max_seconds: float = 600,
+                 top: int = 25, traceback_frames: int = 10, token: str = None):
+        """
+        Args:
+            output_dir: 结果文件目录
+            interval: CPU采样间隔(秒)
+            max_seconds: 单次剖析的最长时间(秒)，批次未完成也会停止
+            top: 内存报告列出的分配位置数
+            traceback_frames: tracemalloc记录的调用栈深度
+            token: 管理地址的访问令牌，为空时不提供管理地址
+        """
+        self.output_dir = output_dir or DEFAULT_PROFILE_DIR
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.top = top
+        self.traceback_frames = traceback_frames
+        self.token = token
+        self.remaining = 0
+        self.active: Optional[ProfileCapture] = None
+        self.files: List[str] = []
+        self._lock = threading.Lock()
+
+    def arm(self, count: int):
+        """剖析接下来的count次上传，0表示取消"""
+        with self._lock:
+            self.remaining = max(0, count)
+
+    def check_token(self, token: Optional[str]) -> bool:
+        """校验管理地址的访问令牌（常量时间比较）"""
+        return bool(self.token) and token is not None and hmac.compare_digest(token, self.token)
+
+    def begin(self, label: str = "upload") -> Optional[ProfileCapture]:
+        """
+        上传开始时调用
+
+        Returns:
+            ProfileCapture: 需要剖析本次上传时返回，调用方需用 stop_when 设置结束条件；否则为None
+        """
+        if not self.remaining:
+            return None
+        with self._lock:
+            if not self.remaining or self.active is not None:
+                return None
+            self.remaining -= 1
+            self.active = ProfileCapture(self, label)
+            return self.active
+
+    def _finish(self, capture: ProfileCapture):
+        try:
+            paths = capture.write()
+            print(f"性能剖析已完成: {', '.join(paths)}")
+        except Exception as e:
+            paths = []
+            print(f"写出性能剖析结果失败: {e}")
+        with self._lock:
+            self.files.extend(paths)
+            del self.files[:-20]
+            if self.active is capture:
+                self.active = None
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict: 剩余剖析次数、是否正在剖析、输出目录和最近的结果文件名
+        """
+        with self._lock:
+            return {
+                "remaining": self.remaining,
+                "active": self.active is not None,
+                "output_dir": self.output_dir,
+                "files": [os.path.basename(path) for path in self.files],
+            }
+
+
+def profile_controller_from_env() -> ProfileController:
+    """
+    根据环境变量创建剖析开关
+
+    环境变量:
+        PROFILE_UPLOADS: 启动后剖析的上传次数，默认0
+        PROFILE_DIR: 结果文件目录，默认 ~/.invoice_ocr/profiles
+        PROFILE_INTERVAL_MS: CPU采样间隔(毫秒)，默认5
+        PROFILE_MAX_SECONDS: 单次剖析的最长时间(秒)，默认600
+        PROFILE_TOKEN: 管理地址 /admin/profile 的访问令牌，未设置时不提供管理地址
+
+    Returns:
+        ProfileController: 剖析开关
+    """
+    controller = ProfileController(
+        output_dir=os.environ.get('PROFILE_DIR') or None,
+        interval=int(os.environ.get('PROFILE_INTERVAL_MS', '5')) / 1000,
+        max_seconds=float(os.environ.get('PROFILE_MAX_SECONDS', '600')),
+        token=os.environ.get('PROFILE_TOKEN') or None,
+    )
+    controller.arm(int(os.environ.get('PROFILE_UPLOADS', '0')))
+    return controller
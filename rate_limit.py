@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""
+OCR接口限流模块
+令牌桶限制每秒请求数，AIMD自适应并发控制根据接口延迟和限流错误调整同时在途的请求数：
+延迟正常时逐步增加并发，收到限流错误时按比例降低，使调用方无需手动调参即可接近账号的实际吞吐上限
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class DeadlineExceeded(TimeoutError):
+    """等待期间已到调用截止时间，请求未发出"""
+
+
+def unwrap_error(e: BaseException) -> BaseException:
+    """
+    取出SDK包装的原始异常
+
+    SDK把网络错误和超时包装为 UnretryableException（code和data为None），
+    原因在 inner_exception 中，通常是 RetryError（消息为底层的连接或超时错误）
+
+    Args:
+        e: 调用接口时抛出的异常
+
+    Returns:
+        BaseException: 最内层的异常，未包装时为e本身
+    """
+    seen = set()
+    while getattr(e, 'inner_exception', None) is not None and id(e) not in seen:
+        seen.add(id(e))
+        e = e.inner_exception
+    return e
+
+
+def is_timeout_error(e: BaseException) -> bool:
+    """
+    判断异常是否为请求超时（连接超时或读取超时）
+
+    Args:
+        e: 调用接口时抛出的异常，可以是SDK包装后的异常
+
+    Returns:
+        bool: 超时返回True；等待限流期间到达截止时间（DeadlineExceeded，请求未发出）返回False
+    """
+    e = unwrap_error(e)
+    if isinstance(e, DeadlineExceeded):
+        return False
+    if isinstance(e, TimeoutError) or 'timeout' in type(e).__name__.lower():
+        return True
+    # RetryError 只保留了底层异常的消息，如 "Read timed out. (read timeout=15)"
+    message = str(getattr(e, 'message', None) or e).lower()
+    return type(e).__name__ == 'RetryError' and ('timed out' in message or 'timeout' in message)
+
+
+def is_throttling_error(e: BaseException) -> bool:
+    """
+    判断异常是否为阿里云限流错误
+
+    Args:
+        e: 调用接口时抛出的异常，可以是SDK包装后的异常
+
+    Returns:
+        bool: 错误码以 Throttling 开头或HTTP状态码为429时返回True
+    """
+    e = unwrap_error(e)
+    code = getattr(e, 'code', None)
+    if code is not None and str(code).startswith('Throttling'):
+        return True
+    data = getattr(e, 'data', None)
+    return isinstance(data, dict) and data.get('statusCode') == 429
+
+
+def is_overload_error(e: BaseException) -> bool:
+    """
+    限流错误或请求超时，均视为接口过载的信号
+
+    与 resilience.classify_error 使用相同的判断，SDK包装的超时同样按 inner_exception 中的原因识别
+    """
+    return is_throttling_error(e) or is_timeout_error(e)
+
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class TokenBucket:
+    """令牌桶（线程安全），按预约方式分配令牌，等待者按到达顺序依次获得"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        """
+        Args:
+            rate: 每秒补充的令牌数，即QPS上限
+            burst: 桶容量，允许的瞬时突发请求数，默认等于rate（至少为1）
+        """
+        self.rate = float(rate)
+        self.capacity = float(burst) if burst else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, deadline: Optional[float]) -> float:
+        """预约一个令牌，返回需要等待的秒数；超过截止时间时不预约并抛出DeadlineExceeded"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            wait = 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                raise DeadlineExceeded("等待限流令牌将超过调用截止时间，未发送请求")
+            self._tokens -= 1
+            return wait
+
+    def acquire(self, deadline: Optional[float] = None):
+        """
+        获取一个令牌，必要时阻塞等待
+
+        Args:
+            deadline: 截止时间(time.monotonic()时间戳)
+        """
+        wait = self._reserve(deadline)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, deadline: Optional[float] = None):
+        """acquire 的异步版本，等待期间不阻塞事件循环"""
+        wait = self._reserve(deadline)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD自适应并发上限（线程安全）
+
+    请求成功且延迟不超过基线延迟的latency_tolerance倍时，上限每轮（约等于当前上限个请求）加1；
+    收到限流或超时错误时上限乘以backoff，同一轮拥塞中只降低一次
+    """
+
+    def __init__(self, initial: int = 4, min_limit: int = 1, max_limit: int = 64,
+                 backoff: float = 0.5, latency_tolerance: float = 2.0):
+        """
+        Args:
+            initial: 初始并发上限
+            min_limit: 并发上限的下限
+            max_limit: 并发上限的上限
+            backoff: 过载时上限的缩减比例
+            latency_tolerance: 延迟超过基线的该倍数时不再增加上限
+        """
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.throttled = 0
+        self._baseline_latency = None
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    def acquire(self, deadline: Optional[float] = None):
+        """
+        占用一个并发名额，名额用完时阻塞等待
+
+        Args:
+            deadline: 截止时间(time.monotonic()时间戳)
+        """
+        with self._cond:
+            if not self._cond.wait_for(self._has_capacity, _remaining(deadline)):
+                raise DeadlineExceeded("等待并发名额超过调用截止时间，未发送请求")
+            self.in_flight += 1
+
+    async def acquire_async(self, deadline: Optional[float] = None, poll_interval: float = 0.01):
+        """acquire 的异步版本，以短间隔轮询，不阻塞事件循环"""
+        while True:
+            with self._cond:
+                if self._has_capacity():
+                    self.in_flight += 1
+                    return
+            if deadline is not None and time.monotonic() + poll_interval > deadline:
+                raise DeadlineExceeded("等待并发名额超过调用截止时间，未发送请求")
+            await asyncio.sleep(poll_interval)
+
+    def release(self, started_at: float, latency: Optional[float], overloaded: bool):
+        """
+        归还并发名额并根据本次请求的结果调整上限
+
+        Args:
+            started_at: 请求发出的时间(time.monotonic()时间戳)
+            latency: 请求耗时(秒)，请求失败时为None
+            overloaded: 是否收到限流或超时错误
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if overloaded:
+                self.throttled += 1
+                # 本轮降低之前发出的请求返回的限流错误不再重复降低
+                if started_at >= self._last_decrease:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = time.monotonic()
+            elif latency is not None:
+                # 基线取近期最低延迟，并以1%的权重向当前延迟靠拢，以适应接口整体变慢
+                if self._baseline_latency is None or latency < self._baseline_latency:
+                    self._baseline_latency = latency
+                else:
+                    self._baseline_latency += (latency - self._baseline_latency) * 0.01
+                if latency <= self._baseline_latency * self.latency_tolerance:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class OCRRateLimiter:
+    """组合令牌桶和自适应并发控制，包在每次OCR接口调用外层"""
+
+    def __init__(self, qps: float = 0, burst: Optional[float] = None,
+                 concurrency: Optional[AdaptiveConcurrencyLimiter] = None):
+        """
+        Args:
+            qps: 每秒请求数上限，0表示不限制
+            burst: 令牌桶容量
+            concurrency: 自适应并发控制，None表示不限制并发
+        """
+        self.bucket = TokenBucket(qps, burst) if qps > 0 else None
+        self.concurrency = concurrency
+
+    def acquire(self, deadline: Optional[float] = None) -> float:
+        """
+        等待并发名额和令牌
+
+        Args:
+            deadline: 截止时间(time.monotonic()时间戳)，等待将超过截止时间时抛出DeadlineExceeded
+
+        Returns:
+            float: 请求发出时间，需传给 release
+        """
+        if self.concurrency is not None:
+            self.concurrency.acquire(deadline)
+        try:
+            if self.bucket is not None:
+                self.bucket.acquire(deadline)
+        except BaseException:
+            self.cancel()
+            raise
+        return time.monotonic()
+
+    async def acquire_async(self, deadline: Optional[float] = None) -> float:
+        """acquire 的异步版本"""
+        if self.concurrency is not None:
+            await self.concurrency.acquire_async(deadline)
+        try:
+            if self.bucket is not None:
+                await self.bucket.acquire_async(deadline)
+        except BaseException:
+            self.cancel()
+            raise
+        return time.monotonic()
+
+    def release(self, started_at: float, error: Optional[BaseException] = None):
+        """
+        请求结束后调用
+
+        Args:
+            started_at: acquire 的返回值
+            error: 请求失败时的异常
+        """
+        if self.concurrency is not None:
+            latency = time.monotonic() - started_at if error is None else None
+            overloaded = error is not None and is_overload_error(error)
+            self.concurrency.release(started_at, latency, overloaded)
+
+    def cancel(self):
+        """请求未发出时归还并发名额，不调整并发上限"""
+        if self.concurrency is not None:
+            self.concurrency.release(time.monotonic(), None, False)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取限流状态
+
+        Returns:
+            Dict: QPS上限、当前并发上限、在途请求数和累计过载次数
+        """
+        stats = {"qps": self.bucket.rate if self.bucket else 0}
+        if self.concurrency is not None:
+            stats.update({
+                "concurrency_limit": int(self.concurrency.limit),
+                "in_flight": self.concurrency.in_flight,
+                "throttled": self.concurrency.throttled,
+            })
+        return stats
+
+
+def rate_limiter_from_env() -> OCRRateLimiter:
+    """
+    根据环境变量创建限流器
+
+    环境变量:
+        OCR_QPS: 每秒请求数上限，默认0（不限制）
+        OCR_QPS_BURST: 允许的瞬时突发请求数，默认等于OCR_QPS
+        OCR_ADAPTIVE_CONCURRENCY: 设为0时关闭自适应并发控制，默认开启
+        OCR_CONCURRENCY_INITIAL / OCR_CONCURRENCY_MIN / OCR_CONCURRENCY_MAX:
+            初始、最小和最大并发上限，默认 4 / 1 / 64
+
+    Returns:
+        OCRRateLimiter: 限流器
+    """
+    concurrency = None
+    if os.environ.get('OCR_ADAPTIVE_CONCURRENCY', '1') != '0':
+        concurrency = AdaptiveConcurrencyLimiter(
+            initial=int(os.environ.get('OCR_CONCURRENCY_INITIAL', '4')),
+            min_limit=int(os.environ.get('OCR_CONCURRENCY_MIN', '1')),
+            max_limit=int(os.environ.get('OCR_CONCURRENCY_MAX', '64')),
+        )
+    burst = os.environ.get('OCR_QPS_BURST')
+    return OCRRateLimiter(
+        qps=float(os.environ.get('OCR_QPS', '0')),
+        burst=float(burst) if burst else None,
+        concurrency=concurrency,
+    )
+
+
+_shared_limiter = None
+_shared_limiter_lock = threading.Lock()
+
+
+def get_shared_rate_limiter() -> OCRRateLimiter:
+    """获取进程内共享的限流器，同一进程中所有OCR实例共用QPS和并发上限"""
+    global _shared_limiter
+    if _shared_limiter is None:
+        with _shared_limiter_lock:
+            if _shared_limiter is None:
+                _shared_limiter = rate_limiter_from_env()
+    return _shared_limiter
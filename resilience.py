@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+OCR接口容错模块
+按错误类型区分可重试（超时、网络错误、5xx、限流）和不可重试（图片无效、鉴权失败等）的失败，
+可重试的失败按带抖动的指数退避在单次调用的时间预算内重试；
+接口持续不可用时熔断器直接拒绝请求，避免排队中的每张发票都各自等到超时
+"""
+
+import os
+import random
+import threading
+import time
+from typing import Optional
+
+from rate_limit import DeadlineExceeded, is_throttling_error, is_timeout_error, unwrap_error
+
+
+# 错误分类
+THROTTLED = "throttled"      # 被限流，接口可用，稍后重试
+UNAVAILABLE = "unavailable"  # 超时、网络错误或服务端5xx，接口可能不可用
+PERMANENT = "permanent"      # 图片无效、鉴权失败等，重试也不会成功
+
+# 服务端临时故障的错误码
+_UNAVAILABLE_CODES = ('ServiceUnavailable', 'InternalError', 'ServiceTimeout', 'Timeout')
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开期间拒绝请求时抛出"""
+
+
+def _status_code(e: BaseException) -> Optional[int]:
+    data = getattr(e, 'data', None)
+    status = data.get('statusCode') if isinstance(data, dict) else getattr(e, 'statusCode', None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(e: BaseException) -> str:
+    """
+    判断一次接口调用失败的类型
+
+    Args:
+        e: 调用接口时抛出的异常，SDK包装的异常按 inner_exception 中的原因判断
+
+    Returns:
+        str: THROTTLED、UNAVAILABLE 或 PERMANENT
+    """
+    e = unwrap_error(e)
+    if isinstance(e, (DeadlineExceeded, CircuitOpenError)):
+        return PERMANENT
+    if is_throttling_error(e):
+        return THROTTLED
+
+    code = getattr(e, 'code', None)
+    if code is not None and str(code).startswith(_UNAVAILABLE_CODES):
+        return UNAVAILABLE
+    status = _status_code(e)
+    if status is not None:
+        return UNAVAILABLE if status >= 500 else PERMANENT
+
+    # 未收到服务端响应：连接失败、连接中断或读取超时（SDK包装为 RetryError）
+    name = type(e).__name__.lower()
+    if isinstance(e, OSError) or is_timeout_error(e) or name == 'retryerror' or 'connect' in name:
+        return UNAVAILABLE
+    return PERMANENT
+
+
+def is_retryable(e: BaseException) -> bool:
+    """限流和临时不可用的失败可以重试"""
+    return classify_error(e) != PERMANENT
+
+
+class RetryPolicy:
+    """带全抖动（full jitter）的指数退避重试策略"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.2, max_delay: float = 5.0,
+                 budget: Optional[float] = 30.0):
+        """
+        Args:
+            max_attempts: 包括首次调用在内的最多尝试次数
+            base_delay: 首次重试的退避上限(秒)，之后每次翻倍
+            max_delay: 单次退避的上限(秒)
+            budget: 单次调用（含全部重试）的时间预算(秒)，None表示只受调用方截止时间限制
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+
+    def deadline(self, deadline: Optional[float] = None) -> Optional[float]:
+        """
+        计算本次调用的截止时间：调用方截止时间与时间预算中较早的一个
+
+        Args:
+            deadline: 调用方传入的截止时间(time.monotonic()时间戳)
+
+        Returns:
+            float: 截止时间，都未设置时为None
+        """
+        if self.budget is None:
+            return deadline
+        budget_deadline = time.monotonic() + self.budget
+        return budget_deadline if deadline is None else min(deadline, budget_deadline)
+
+    def next_delay(self, attempt: int, error: BaseException, deadline: Optional[float]) -> Optional[float]:
+        """
+        计算第attempt次尝试失败后的退避时间
+
+        Args:
+            attempt: 已完成的尝试次数（从1开始）
+            error: 本次失败的异常
+            deadline: 截止时间(time.monotonic()时间戳)
+
+        Returns:
+            float: 退避秒数；不应重试（不可重试、次数用完或退避后已无剩余时间）时返回None
+        """
+        if attempt >= self.max_attempts or not is_retryable(error):
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+
+class CircuitBreaker:
+    """
+    熔断器（线程安全）
+
+    连续failure_threshold次调用因接口不可用而失败后打开，打开期间直接拒绝请求；
+    reset_timeout秒后进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            failure_threshold: 触发熔断的连续失败次数
+            reset_timeout: 熔断后多久允许探测请求(秒)
+        """
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        调用接口前检查熔断状态
+
+        Raises:
+            CircuitOpenError: 熔断器打开（或半开且已有探测请求）时
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenError("OCR服务暂时不可用，已暂停调用，请稍后重试")
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    raise CircuitOpenError("OCR服务暂时不可用，正在探测恢复情况，请稍后重试")
+                self._probe_in_flight = True
+
+    def cancel(self):
+        """before_call 之后请求未发出时调用，不改变熔断状态"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record(self, error: Optional[BaseException] = None):
+        """
+        记录一次调用的结果
+
+        Args:
+            error: 调用失败的异常，成功时为None；只有接口不可用类的失败计入熔断
+        """
+        unavailable = error is not None and classify_error(error) == UNAVAILABLE
+        with self._lock:
+            self._probe_in_flight = False
+            if not unavailable:
+                self.failures = 0
+                self.state = self.CLOSED
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+def retry_policy_from_env() -> RetryPolicy:
+    """
+    根据环境变量创建重试策略
+
+    环境变量:
+        OCR_RETRY_MAX_ATTEMPTS: 最多尝试次数（含首次），默认3，设为1表示不重试
+        OCR_RETRY_BASE_DELAY_MS / OCR_RETRY_MAX_DELAY_MS: 退避基数和上限(毫秒)，默认 200 / 5000
+        OCR_RETRY_BUDGET_MS: 单次调用含重试的总时间预算(毫秒)，默认30000，设为0表示不限制
+
+    Returns:
+        RetryPolicy: 重试策略
+    """
+    budget_ms = int(os.environ.get('OCR_RETRY_BUDGET_MS', '30000'))
+    return RetryPolicy(
+        max_attempts=int(os.environ.get('OCR_RETRY_MAX_ATTEMPTS', '3')),
+        base_delay=int(os.environ.get('OCR_RETRY_BASE_DELAY_MS', '200')) / 1000,
+        max_delay=int(os.environ.get('OCR_RETRY_MAX_DELAY_MS', '5000')) / 1000,
+        budget=budget_ms / 1000 if budget_ms > 0 else None,
+    )
+
+
+def circuit_breaker_from_env() -> CircuitBreaker:
+    """
+    根据环境变量创建熔断器
+
+    环境变量:
+        OCR_BREAKER_THRESHOLD: 触发熔断的连续失败次数，默认5
+        OCR_BREAKER_RESET_S: 熔断后多久允许探测请求(秒)，默认30
+
+    Returns:
+        CircuitBreaker: 熔断器
+    """
+    return CircuitBreaker(
+        failure_threshold=int(os.environ.get('OCR_BREAKER_THRESHOLD', '5')),
+        reset_timeout=float(os.environ.get('OCR_BREAKER_RESET_S', '30')),
+    )
+
+
+_shared_breaker = None
+_shared_breaker_lock = threading.Lock()
+
+
+def get_shared_circuit_breaker() -> CircuitBreaker:
+    """获取进程内共享的熔断器，同一进程中所有OCR实例共享接口可用状态"""
+    global _shared_breaker
+    if _shared_breaker is None:
+        with _shared_breaker_lock:
+            if _shared_breaker is None:
+                _shared_breaker = circuit_breaker_from_env()
+    return _shared_breaker
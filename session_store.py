@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+会话级识别结果存储
+每个浏览器页面有独立的会话ID，上传记录和识别结果按会话保存，
+多个用户同时使用时互不影响；SQLite后端可供多个服务进程共享
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class SessionStore(ABC):
+    """会话存储接口：每个会话有一份状态字典和按序号保存的识别结果"""
+
+    @abstractmethod
+    def get_state(self, session_id: str) -> Dict[str, Any]:
+        """获取会话状态，不存在时返回空字典"""
+
+    @abstractmethod
+    def update_state(self, session_id: str, **fields):
+        """更新会话状态中的字段"""
+
+    @abstractmethod
+    def put_result(self, session_id: str, job_id: str, index: int, result: Dict[str, Any]):
+        """
+        保存任务中一张发票的识别结果
+
+        job_id不是会话状态中的当前任务（会话已重新上传或已清空）时忽略，
+        旧任务迟到的结果不会覆盖新任务，也不会重新创建已清空的会话
+        """
+
+    @abstractmethod
+    def get_results(self, session_id: str, job_id: str) -> Dict[int, Dict[str, Any]]:
+        """获取任务已完成的识别结果，键为发票序号"""
+
+    @abstractmethod
+    def clear(self, session_id: str):
+        """删除会话的全部数据"""
+
+
+class MemorySessionStore(SessionStore):
+    """进程内存储，按最近访问时间淘汰会话，总占用不超过内存上限（线程安全）"""
+
+    def __init__(self, max_size_mb: float = 256):
+        """
+        Args:
+            max_size_mb: 所有会话识别结果的估算总大小上限(MB)
+        """
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._total_size = 0
+        self._lock = threading.Lock()
+
+    def _touch(self, session_id: str) -> Dict[str, Any]:
+        """获取会话并标记为最近使用，不存在时创建（调用方需持有锁，只用于写入）"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = {"state": {}, "job_id": None, "results": {}, "size": 0}
+            self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _lookup(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """获取已有会话并标记为最近使用，不存在时返回None、不创建（调用方需持有锁）"""
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def get_state(self, session_id: str) -> Dict[str, Any]:
+        with self._lock:
+            session = self._lookup(session_id)
+            return dict(session["state"]) if session is not None else {}
+
+    def update_state(self, session_id: str, **fields):
+        with self._lock:
+            self._touch(session_id)["state"].update(fields)
+
+    def put_result(self, session_id: str, job_id: str, index: int, result: Dict[str, Any]):
+        size = len(json.dumps(result, ensure_ascii=False, default=str))
+        with self._lock:
+            session = self._lookup(session_id)
+            if session is None or session["state"].get("job_id") != job_id:
+                return
+            if session["job_id"] != job_id:
+                # 新任务的结果替换旧任务的结果
+                self._total_size -= session["size"]
+                session.update(job_id=job_id, results={}, size=0)
+            session["results"][index] = result
+            session["size"] += size
+            self._total_size += size
+            self._evict(keep=session_id)
+
+    def get_results(self, session_id: str, job_id: str) -> Dict[int, Dict[str, Any]]:
+        with self._lock:
+            session = self._lookup(session_id)
+            if session is None or session["job_id"] != job_id:
+                return {}
+            return dict(session["results"])
+
+    def clear(self, session_id: str):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self._total_size -= session["size"]
+
+    def _evict(self, keep: str):
+        """超出内存上限时淘汰最久未使用的会话（调用方需持有锁）"""
+        while self._total_size > self.max_size_bytes and len(self._sessions) > 1:
+            session_id = next(iter(self._sessions))
+            if session_id == keep:
+                break
+            self._total_size -= self._sessions.pop(session_id)["size"]
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite存储，数据库放在共享目录时可供多个服务进程（如gunicorn多worker）使用"""
+
+    def __init__(self, db_path: str, ttl_seconds: float = 24 * 3600):
+        """
+        Args:
+            db_path: 数据库文件路径
+            ttl_seconds: 会话闲置多久后删除(秒)
+        """
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_db()
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程使用独立连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS session_results (
+                session_id TEXT NOT NULL,
+                job_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                result TEXT NOT NULL,
+                PRIMARY KEY (session_id, job_id, idx)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at)")
+        conn.commit()
+
+    def get_state(self, session_id: str) -> Dict[str, Any]:
+        row = self._conn().execute(
+            "SELECT state FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def update_state(self, session_id: str, **fields):
+        conn = self._conn()
+        with conn:
+            # BEGIN IMMEDIATE 保证多进程同时更新同一会话时不会互相覆盖
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT state FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            state = json.loads(row[0]) if row else {}
+            state.update(fields)
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, state, updated_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(state, ensure_ascii=False, default=str), time.time())
+            )
+        self._maybe_expire()
+
+    def put_result(self, session_id: str, job_id: str, index: int, result: Dict[str, Any]):
+        conn = self._conn()
+        with conn:
+            # 与 update_state 互斥，判断当前任务后再写入
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT state FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None or json.loads(row[0]).get("job_id") != job_id:
+                return
+            conn.execute(
+                "DELETE FROM session_results WHERE session_id = ? AND job_id != ?",
+                (session_id, job_id)
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO session_results (session_id, job_id, idx, result) VALUES (?, ?, ?, ?)",
+                (session_id, job_id, index, json.dumps(result, ensure_ascii=False, default=str))
+            )
+            conn.execute(
+                "UPDATE sessions SET updated_at = ? WHERE session_id = ?", (time.time(), session_id)
+            )
+
+    def get_results(self, session_id: str, job_id: str) -> Dict[int, Dict[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT idx, result FROM session_results WHERE session_id = ? AND job_id = ?",
+            (session_id, job_id)
+        ).fetchall()
+        return {idx: json.loads(result) for idx, result in rows}
+
+    def clear(self, session_id: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM session_results WHERE session_id = ?", (session_id,))
+
+    def _maybe_expire(self):
+        """每100次写入清理一次闲置过期的会话"""
+        self._writes += 1
+        if self._writes % 100:
+            return
+        conn = self._conn()
+        cutoff = time.time() - self.ttl_seconds
+        with conn:
+            conn.execute(
+                "DELETE FROM session_results WHERE session_id IN "
+                "(SELECT session_id FROM sessions WHERE updated_at < ?)", (cutoff,)
+            )
+            conn.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
+
+
+def session_store_from_env() -> SessionStore:
+    """
+    根据环境变量创建会话存储
+
+    环境变量:
+        SESSION_STORE: memory（默认）或 sqlite
+        SESSION_STORE_PATH: SQLite数据库路径，默认 ~/.invoice_ocr/sessions.sqlite3
+        SESSION_STORE_MAX_MB: 内存存储的占用上限(MB)，默认256
+        SESSION_TTL_HOURS: SQLite存储中会话的保留时间(小时)，默认24
+
+    Returns:
+        SessionStore: 会话存储实例
+    """
+    backend = os.environ.get('SESSION_STORE', 'memory').lower()
+    if backend == 'sqlite':
+        db_path = os.environ.get('SESSION_STORE_PATH') or os.path.join(
+            os.path.expanduser('~'), '.invoice_ocr', 'sessions.sqlite3'
+        )
+        ttl_hours = float(os.environ.get('SESSION_TTL_HOURS', '24'))
+        return SQLiteSessionStore(db_path, ttl_seconds=ttl_hours * 3600)
+    return MemorySessionStore(max_size_mb=float(os.environ.get('SESSION_STORE_MAX_MB', '256')))
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+识别结果表格的服务器端分页、排序和筛选
+表格使用 page_action/sort_action/filter_action='custom'，浏览器只接收当前页的数据；
+排序和筛选在服务器上按列的实际含义进行（金额按数值、日期按年月日），
+筛选条件使用 DataTable 生成的 filter_query 语法
+"""
+
+import math
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+
+# 按数值比较和排序的列（显示为 "¥1,234.56" 形式的文本）
+NUMERIC_COLUMNS = ('序号', '发票金额', '发票数量')
+
+# 按日期比较和排序的列（阿里云返回 "2025年03月15日"，也可能是 "2025-03-15"）
+DATE_COLUMNS = ('开票日期',)
+
+# 单个筛选条件，如 {销售方} contains "科技"、{发票金额} >= 1000、{开票日期} datestartswith "2025-03"；
+# 运算符（包括 >= 等符号）可带前缀 s（区分大小写，即默认）或 i（不区分大小写）
+_FILTER_PART = re.compile(
+    r'^\s*\{(?P<column>[^}]+)\}\s+'
+    r'(?:(?P<operator>datestartswith)|(?P<prefix>[is]?)(?P<name>contains|eq|ne|lt|le|gt|ge|>=|<=|!=|=|<|>))\s+'
+    r'(?P<value>.+?)\s*$'
+)
+_QUOTES = '"\'`'
+_SEPARATOR = ' && '
+_SYMBOLS = {'=': 'eq', '!=': 'ne', '<': 'lt', '<=': 'le', '>': 'gt', '>=': 'ge'}
+_RELATIONAL = ('eq', 'ne', 'lt', 'le', 'gt', 'ge')
+_NON_NUMERIC = re.compile(r'[^\d.\-]')
+_DIGITS = re.compile(r'\d+')
+
+
+def _to_numeric(series: pd.Series) -> pd.Series:
+    """去掉货币符号和千分位后转为数值，无法转换的为NaN"""
+    return pd.to_numeric(series.astype(str).str.replace(_NON_NUMERIC, '', regex=True), errors='coerce')
+
+
+def normalize_date(text: Any) -> str:
+    """把 "2025年3月15日"、"2025/03/15" 等统一为 "2025-03-15"，便于按字符串比较"""
+    parts = _DIGITS.findall(str(text or ""))
+    if not parts:
+        return ""
+    return "-".join([parts[0]] + [part.zfill(2) for part in parts[1:3]])
+
+
+def _column_key(series: pd.Series) -> pd.Series:
+    """排序和比较时使用的列值"""
+    if series.name in NUMERIC_COLUMNS:
+        return _to_numeric(series)
+    if series.name in DATE_COLUMNS:
+        # 没有日期的行排在最后
+        dates = series.map(normalize_date)
+        return dates.where(dates != "", None)
+    return series.fillna("").astype(str)
+
+
+def _split_filter_query(filter_query: str) -> List[str]:
+    """按 " && " 拆分条件，引号括起的值中的 " && " 属于值本身"""
+    parts = []
+    start = 0
+    quote = None
+    i = 0
+    while i < len(filter_query):
+        char = filter_query[i]
+        if quote is not None:
+            if char == '\\':
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in _QUOTES and i > 0 and filter_query[i - 1].isspace():
+            # 只有值开头的引号才开始引用，O'Brien 中的引号不算
+            quote = char
+        elif filter_query.startswith(_SEPARATOR, i):
+            parts.append(filter_query[start:i])
+            i += len(_SEPARATOR)
+            start = i
+            continue
+        i += 1
+    parts.append(filter_query[start:])
+    return parts
+
+
+def _parse_filter_query(filter_query: Optional[str]) -> Tuple[List[Tuple[str, str, Any]], List[str]]:
+    """解析 filter_query，返回解析出的条件和无法解析的条件原文"""
+    conditions = []
+    unparsed = []
+    for part in _split_filter_query(filter_query or ""):
+        match = _FILTER_PART.match(part)
+        if not match:
+            if part.strip():
+                unparsed.append(part.strip())
+            continue
+        operator = match.group('operator')
+        if operator is None:
+            name = _SYMBOLS.get(match.group('name'), match.group('name'))
+            operator = 'i' + name if match.group('prefix') == 'i' else name
+        column = match.group('column')
+        value = match.group('value')
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in _QUOTES:
+            value = value[1:-1].replace('\\' + value[0], value[0])
+        elif column in NUMERIC_COLUMNS and operator.lstrip('i') in _RELATIONAL:
+            try:
+                value = float(value)
+            except ValueError:
+                pass
+        conditions.append((column, operator, value))
+    return conditions, unparsed
+
+
+def parse_filter_query(filter_query: Optional[str]) -> List[Tuple[str, str, Any]]:
+    """
+    解析 DataTable 的 filter_query
+
+    Args:
+        filter_query: 如 '{销售方} contains "科技" && {发票金额} ge 1000'
+
+    Returns:
+        List[Tuple[列名, 运算符, 值]]: 运算符统一为 eq/ne/lt/le/gt/ge/contains/datestartswith，
+        符号运算符转为对应的名称，不区分大小写的 icontains、i> 等保留前缀i（如 ilt），前缀s去掉；
+        无法解析的条件被忽略（见 unparsed_filters）。
+        只有 NUMERIC_COLUMNS 的比较运算且值未加引号时值转为float，其余保留原文本，
+        如发票号码 "0123456"、开票日期 "2025"
+    """
+    return _parse_filter_query(filter_query)[0]
+
+
+def unparsed_filters(filter_query: Optional[str]) -> List[str]:
+    """
+    filter_query 中无法解析、因而没有生效的条件
+
+    Args:
+        filter_query: DataTable 的 filter_query
+
+    Returns:
+        List[str]: 条件原文，用于提示用户
+    """
+    return _parse_filter_query(filter_query)[1]
+
+
+def _condition_mask(df: pd.DataFrame, column: str, operator: str, value: Any) -> pd.Series:
+    series = df[column]
+    insensitive = operator.startswith('i')
+    if insensitive:
+        operator = operator[1:]
+
+    if operator == 'contains':
+        text = series.fillna("").astype(str)
+        if insensitive:
+            text, value = text.str.lower(), str(value).lower()
+        mask = text.str.contains(str(value), regex=False)
+        if column in DATE_COLUMNS:
+            # 输入 "2025-03" 也能匹配 "2025年03月15日"
+            mask |= series.map(normalize_date).str.contains(normalize_date(value) or str(value), regex=False)
+        return mask
+    if operator == 'datestartswith':
+        return series.map(normalize_date).str.startswith(normalize_date(value) or str(value))
+
+    if isinstance(value, float) and column not in DATE_COLUMNS:
+        left = _to_numeric(series)
+    else:
+        left = _column_key(series)
+        value = normalize_date(value) if column in DATE_COLUMNS else str(value)
+        if insensitive:
+            left, value = left.str.lower(), value.lower()
+    if operator == 'eq':
+        return left == value
+    if operator == 'ne':
+        return left != value
+    if operator == 'lt':
+        return left < value
+    if operator == 'le':
+        return left <= value
+    if operator == 'gt':
+        return left > value
+    return left >= value
+
+
+def query_table(df: pd.DataFrame, page_current: int = 0, page_size: int = 10,
+                sort_by: Optional[List[Dict[str, str]]] = None,
+                filter_query: Optional[str] = None) -> Tuple[pd.DataFrame, int, int]:
+    """
+    对结果表格筛选、排序并取出一页
+
+    Args:
+        df: 完整的结果表格
+        page_current: 页码，从0开始，超出范围时取最后一页
+        page_size: 每页行数
+        sort_by: DataTable 的 sort_by，如 [{"column_id": "发票金额", "direction": "desc"}]
+        filter_query: DataTable 的 filter_query
+
+    Returns:
+        Tuple[当前页, 总页数, 实际页码]: 总页数至少为1
+    """
+    for column, operator, value in parse_filter_query(filter_query):
+        if column in df.columns:
+            df = df[_condition_mask(df, column, operator, value).fillna(False).astype(bool)]
+
+    sort_by = [item for item in (sort_by or []) if item.get('column_id') in df.columns]
+    if sort_by and not df.empty:
+        df = df.sort_values(
+            by=[item['column_id'] for item in sort_by],
+            ascending=[item.get('direction') != 'desc' for item in sort_by],
+            key=_column_key,
+            kind='mergesort',
+            na_position='last',
+        )
+
+    page_size = max(1, int(page_size or 10))
+    page_count = max(1, math.ceil(len(df) / page_size))
+    page_current = min(max(0, int(page_current or 0)), page_count - 1)
+    start = page_current * page_size
+    return df.iloc[start:start + page_size], page_count, page_current
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+多页文档拆分的测试
+无法本地拆分时各页共用整个文件的视图，不为每页复制文件；大小上限只检查一次整个文件
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import document_pages
+from document_pages import DocumentTooLarge, mmap_file, plan_pages
+
+PDF = b'%PDF-1.4\n' + b''.join(b'%d 0 obj << /Type /Page >> endobj\n' % i for i in range(1, 4))
+
+
+@pytest.fixture
+def no_split(monkeypatch):
+    monkeypatch.setattr(document_pages, 'PYPDF_AVAILABLE', False)
+
+
+def test_page_no_pages_share_one_view(no_split):
+    mode, pages = plan_pages(PDF, "bundle.pdf")
+    assert mode == "page_no"
+    assert [page.request_page_no for page in pages] == [1, 2, 3]
+    assert all(page.data is pages[0].data for page in pages)
+    assert isinstance(pages[0].data, memoryview)
+    assert pages[0].data.obj is PDF
+
+
+def test_page_no_view_of_mapped_file(no_split, tmp_path):
+    path = tmp_path / "bundle.pdf"
+    path.write_bytes(PDF)
+    with mmap_file(str(path)) as buf:
+        mode, pages = plan_pages(buf, str(path))
+        with pages[0].data as data:
+            assert bytes(data) == PDF
+    assert mode == "page_no"
+
+
+def test_page_no_checks_whole_file_once(no_split):
+    with pytest.raises(DocumentTooLarge):
+        plan_pages(PDF, "bundle.pdf", max_request_mb=len(PDF) / 1024 / 1024 / 2)
+    assert plan_pages(PDF, "bundle.pdf", max_request_mb=1)[0] == "page_no"
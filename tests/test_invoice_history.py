@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+发票历史记录的测试
+重复发票按识别出的发票代码+号码确认，同一模板、号码不同的发票不算重复
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from invoice_history import InvoiceHistory, invoice_key
+
+
+def make_result(number, amount="100.00", file_name="a.png"):
+    return {
+        "basic_info": {"发票代码": "044001", "发票号码": number, "开票日期": "2025年03月15日"},
+        "seller_info": {"名称": "示例商贸有限公司", "税号": "91440300ma5example"},
+        "purchaser_info": {"名称": "示例科技有限公司"},
+        "amount_info": {"发票金额": amount},
+        "file_name": file_name,
+    }
+
+
+def test_invoice_key():
+    assert invoice_key(make_result("12345678")) == "044001:12345678"
+    assert invoice_key(make_result("")) is None
+    assert invoice_key({"error": "OCR失败"}) is None
+
+
+def test_find_same_invoice_only(tmp_path):
+    history = InvoiceHistory(str(tmp_path / "history.sqlite3"))
+    record_id = history.record(make_result("12345678", file_name="scan.png"), {"raw": 1})
+
+    found = history.find(invoice_key(make_result("12345678", file_name="photo.jpg")))
+    assert found["id"] == record_id
+    assert found["file_name"] == "scan.png"
+    # 同一模板、仅号码不同
+    assert history.find(invoice_key(make_result("12345679"))) is None
+
+
+def test_record_same_invoice_updates_record(tmp_path):
+    history = InvoiceHistory(str(tmp_path / "history.sqlite3"))
+    first = history.record(make_result("12345678", file_name="scan.png"), {"raw": 1})
+    second = history.record(make_result("12345678", file_name="photo.jpg"), {"raw": 2})
+    assert first == second
+    assert history.count() == 1
+    assert history.find("044001:12345678")["file_name"] == "photo.jpg"
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+限流模块的测试
+SDK包装的读取超时和限流错误都必须让自适应并发上限按比例降低
+"""
+
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("alibabacloud_ocr_api20210707")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from mock_ocr_server import LatencyModel, MockOCRServer
+from Ranch5 import SimpleOCR
+from rate_limit import AdaptiveConcurrencyLimiter, OCRRateLimiter
+from resilience import CircuitBreaker, RetryPolicy
+
+IMAGE = b'\x89PNG\r\n\x1a\n' + b'\0' * 128
+
+
+def call_once(server) -> AdaptiveConcurrencyLimiter:
+    """经过限流器调用一次模拟服务，返回调用后的并发控制器"""
+    concurrency = AdaptiveConcurrencyLimiter(initial=8)
+    ocr = SimpleOCR(access_key_id='x' * 16, access_key_secret='y' * 16,
+                    endpoint=server.endpoint, protocol='HTTP', connect_timeout=300, read_timeout=300,
+                    rate_limiter=OCRRateLimiter(concurrency=concurrency),
+                    retry_policy=RetryPolicy(max_attempts=1),
+                    circuit_breaker=CircuitBreaker())
+    result = ocr.recognize_invoice_bytes(IMAGE, "a.png", validate=False)
+    assert not result["success"]
+    return concurrency
+
+
+def test_read_timeout_decreases_limit():
+    with MockOCRServer(latency=LatencyModel('fixed', ms=2000)) as server:
+        concurrency = call_once(server)
+    assert concurrency.throttled == 1
+    assert concurrency.limit == 4
+    assert concurrency.in_flight == 0
+
+
+def test_throttling_decreases_limit():
+    with MockOCRServer(latency=LatencyModel('fixed', ms=0), throttle_rate=1.0) as server:
+        concurrency = call_once(server)
+    assert concurrency.throttled == 1
+    assert concurrency.limit == 4
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+容错模块的测试
+SDK把连接失败和超时包装为 UnretryableException，必须按其中的原因判断为接口不可用：
+可以重试，并计入熔断器的连续失败次数
+"""
+
+import io
+import os
+import socket
+import sys
+
+import pytest
+
+pytest.importorskip("alibabacloud_ocr_api20210707")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from alibabacloud_ocr_api20210707 import models as ocr_api_20210707_models
+from mock_ocr_server import LatencyModel, MockOCRServer
+from Ranch5 import SimpleOCR
+from rate_limit import OCRRateLimiter
+from resilience import UNAVAILABLE, CircuitBreaker, RetryPolicy, classify_error
+
+IMAGE = b'\x89PNG\r\n\x1a\n' + b'\0' * 128
+
+
+def refused_endpoint() -> str:
+    """绑定后立即关闭的端口，连接会被拒绝"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        host, port = sock.getsockname()
+    return f"{host}:{port}"
+
+
+def make_ocr(endpoint, breaker):
+    return SimpleOCR(access_key_id='x' * 16, access_key_secret='y' * 16,
+                     endpoint=endpoint, protocol='HTTP', connect_timeout=300, read_timeout=300,
+                     rate_limiter=OCRRateLimiter(),
+                     retry_policy=RetryPolicy(max_attempts=2, base_delay=0.01),
+                     circuit_breaker=breaker)
+
+
+def raw_error(ocr):
+    """不经过重试直接调用一次SDK，返回其抛出的异常"""
+    request = ocr_api_20210707_models.RecognizeInvoiceRequest(body=io.BytesIO(IMAGE))
+    with pytest.raises(Exception) as excinfo:
+        ocr.client.recognize_invoice_with_options(request, ocr._build_runtime())
+    return excinfo.value
+
+
+def assert_unavailable(ocr, breaker):
+    assert classify_error(raw_error(ocr)) == UNAVAILABLE
+
+    result = ocr.recognize_invoice_bytes(IMAGE, "a.png", validate=False)
+    assert not result["success"]
+    assert result["attempts"] == 2
+    assert result["error"]["retryable"]
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_refused_connection_is_unavailable():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    assert_unavailable(make_ocr(refused_endpoint(), breaker), breaker)
+
+
+def test_read_timeout_is_unavailable():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    with MockOCRServer(latency=LatencyModel('fixed', ms=2000)) as server:
+        assert_unavailable(make_ocr(server.endpoint, breaker), breaker)
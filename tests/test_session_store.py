@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+会话存储的测试
+读取不存在的会话不会创建会话，旧任务迟到的结果不会写入
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_store import MemorySessionStore, SessionStore, SQLiteSessionStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemorySessionStore(max_size_mb=1)
+    return SQLiteSessionStore(str(tmp_path / "sessions.db"))
+
+
+def test_interface_is_abstract():
+    with pytest.raises(TypeError):
+        SessionStore()
+
+
+def test_reads_do_not_create_sessions():
+    store = MemorySessionStore(max_size_mb=1)
+    for i in range(100):
+        assert store.get_state(f"unknown-{i}") == {}
+        assert store.get_results(f"unknown-{i}", "job") == {}
+    assert len(store._sessions) == 0
+
+
+def test_results_follow_current_job(store):
+    store.update_state("s", job_id="old")
+    store.update_state("s", job_id="new")
+    store.put_result("s", "old", 0, {"name": "late"})
+    store.put_result("s", "new", 0, {"name": "a.png"})
+    assert store.get_state("s") == {"job_id": "new"}
+    assert store.get_results("s", "new") == {0: {"name": "a.png"}}
+    assert store.get_results("s", "old") == {}
+
+
+def test_cleared_session_is_not_recreated(store):
+    store.update_state("s", job_id="job")
+    store.clear("s")
+    store.put_result("s", "job", 0, {"name": "late"})
+    assert store.get_state("s") == {}
+    assert store.get_results("s", "job") == {}
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+结果表格筛选条件的测试
+带前缀的符号运算符、引号中含 && 的值都要正确解析，无法解析的条件要能报告给用户
+"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from table_query import parse_filter_query, query_table, unparsed_filters
+
+
+@pytest.mark.parametrize("query, expected", [
+    ('{发票金额} s> 5', [('发票金额', 'gt', 5.0)]),
+    ('{发票金额} i>= 5', [('发票金额', 'ige', 5.0)]),
+    ('{发票金额} sge 5', [('发票金额', 'ge', 5.0)]),
+    ('{销售方} i= "ACME"', [('销售方', 'ieq', 'ACME')]),
+    ('{销售方} contains "A && B" && {序号} = 2', [('销售方', 'contains', 'A && B'), ('序号', 'eq', 2.0)]),
+    ('{销售方} contains "say \\"hi\\" && x"', [('销售方', 'contains', 'say "hi" && x')]),
+    ("{销售方} contains O'Brien && {序号} = 2", [('销售方', 'contains', "O'Brien"), ('序号', 'eq', 2.0)]),
+])
+def test_parse_filter_query(query, expected):
+    assert parse_filter_query(query) == expected
+    assert unparsed_filters(query) == []
+
+
+def test_unparsed_parts_are_reported():
+    query = '{销售方} ~ 科技 && {序号} s= 1'
+    assert parse_filter_query(query) == [('序号', 'eq', 1.0)]
+    assert unparsed_filters(query) == ['{销售方} ~ 科技']
+
+
+def test_query_with_prefixed_symbol_and_quoted_separator():
+    df = pd.DataFrame({
+        "序号": [1, 2, 3],
+        "销售方": ["A && B 公司", "A 公司", "acme"],
+        "发票金额": ["¥3.00", "¥8.00", "¥12.00"],
+    })
+    page, _, _ = query_table(df, filter_query='{发票金额} s> 5')
+    assert page["序号"].tolist() == [2, 3]
+    page, _, _ = query_table(df, filter_query='{销售方} contains "A && B"')
+    assert page["序号"].tolist() == [1]
+    page, _, _ = query_table(df, filter_query='{销售方} i= "ACME"')
+    assert page["序号"].tolist() == [3]
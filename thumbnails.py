@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+发票预览缩略图模块
+每张图片按内容摘要只生成一次缩略图并保存在磁盘上，
+预览卡片通过URL引用，不再在回调响应中回传整张图片
+"""
+
+import glob
+import hashlib
+import io
+import os
+import threading
+from typing import Optional, Tuple
+
+try:
+    from PIL import Image, features
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+
+DEFAULT_THUMBNAIL_DIR = os.path.join(os.path.expanduser('~'), '.invoice_ocr', 'thumbnails')
+
+# 未安装Pillow时直接保存原图，按扩展名确定返回的Content-Type
+_MIMETYPES = {
+    '.webp': 'image/webp',
+    '.jpg': 'image/jpeg',
+    '.png': 'image/png',
+    '.bmp': 'image/bmp',
+    '.gif': 'image/gif',
+}
+_MAGIC_EXTENSIONS = [
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'BM', '.bmp'),
+    (b'GIF8', '.gif'),
+]
+
+
+def _mtime(path: str) -> float:
+    """文件修改时间，文件已被删除时返回0"""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
+class ThumbnailStore:
+    """按图片内容摘要缓存缩略图文件（线程安全）"""
+
+    def __init__(self, cache_dir: str = None, max_edge: int = 400, quality: int = 80,
+                 max_files: int = 5000):
+        """
+        初始化缩略图存储
+
+        Args:
+            cache_dir: 缩略图目录
+            max_edge: 缩略图最长边(像素)
+            quality: WebP/JPEG编码质量
+            max_files: 最多保留的缩略图数，超出后删除最早生成的文件
+        """
+        self.cache_dir = cache_dir or DEFAULT_THUMBNAIL_DIR
+        self.max_edge = max_edge
+        self.quality = quality
+        self.max_files = max_files
+        self.extension = '.webp' if PIL_AVAILABLE and features.check('webp') else '.jpg'
+        self._lock = threading.Lock()
+        self._added = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def hash_bytes(data: bytes) -> str:
+        """计算图片字节的SHA-256摘要"""
+        return hashlib.sha256(data).hexdigest()
+
+    def add(self, image_data: bytes, digest: str = None) -> Optional[str]:
+        """
+        为图片生成缩略图（已存在时直接返回）
+
+        Args:
+            image_data: 原始图片内容
+            digest: 图片内容摘要，为None时自动计算
+
+        Returns:
+            str: 缩略图的摘要键；无法解码的文件（如PDF）返回None
+        """
+        digest = digest or self.hash_bytes(image_data)
+        if self.lookup(digest) is not None:
+            return digest
+
+        if PIL_AVAILABLE:
+            thumbnail = self._render(image_data)
+            extension = self.extension
+        else:
+            # 没有Pillow时保存原图，浏览器仍可按URL缓存
+            thumbnail = image_data
+            extension = next((ext for magic, ext in _MAGIC_EXTENSIONS if image_data.startswith(magic)), None)
+        if thumbnail is None or extension is None:
+            return None
+
+        # 先写临时文件再改名，避免并发请求读到不完整的文件；
+        # 写入失败（磁盘已满、目录被删除等）时只是没有缩略图，不影响识别
+        path = os.path.join(self.cache_dir, digest + extension)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(thumbnail)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"缩略图写入失败: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return None
+
+        with self._lock:
+            self._added += 1
+            if self._added % 100 == 0:
+                self._prune()
+        return digest
+
+    def _render(self, image_data: bytes) -> Optional[bytes]:
+        """用Pillow生成缩略图，无法解码时返回None"""
+        try:
+            with Image.open(io.BytesIO(image_data)) as img:
+                # JPEG解码时直接按目标尺寸降采样，大图可快数倍
+                img.draft('RGB', (self.max_edge, self.max_edge))
+                img = img.convert('RGB')
+                img.thumbnail((self.max_edge, self.max_edge))
+                output = io.BytesIO()
+                img.save(output, format='WEBP' if self.extension == '.webp' else 'JPEG',
+                         quality=self.quality)
+                return output.getvalue()
+        except Exception:
+            return None
+
+    def lookup(self, digest: str) -> Optional[Tuple[str, str]]:
+        """
+        查找缩略图文件
+
+        Args:
+            digest: 图片内容摘要
+
+        Returns:
+            Tuple[path, mimetype]: 不存在时返回None
+        """
+        for extension, mimetype in _MIMETYPES.items():
+            path = os.path.join(self.cache_dir, digest + extension)
+            if os.path.exists(path):
+                return path, mimetype
+        return None
+
+    def _prune(self):
+        """删除超出数量上限的最早生成的缩略图（调用方需持有锁）"""
+        # 只统计缩略图文件，正在写入的 *.tmp 文件由 add 改名，不能删除
+        files = [path for extension in _MIMETYPES
+                 for path in glob.glob(os.path.join(self.cache_dir, '*' + extension))]
+        excess = len(files) - self.max_files
+        if excess <= 0:
+            return
+        files.sort(key=_mtime)
+        for path in files[:excess]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
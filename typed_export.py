@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+带类型的列式导出模块
+把识别结果转换为带类型的记录（金额为Decimal、开票日期为日期、销售方/购买方名称为分类列），
+按批流式生成CSV、Parquet或Arrow IPC流，下游数据管道可一次向量化读取，不必再解析 "¥1,234.56" 等文本；
+Parquet和Arrow需要安装pyarrow
+"""
+
+import csv
+import io
+from datetime import date
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from table_query import normalize_date
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+
+# 导出的字段及类型：int、str、date、decimal（两位小数）、category（字典编码的字符串）
+EXPORT_FIELDS = (
+    ("index", "int"),
+    ("file_name", "str"),
+    ("invoice_code", "str"),
+    ("invoice_number", "str"),
+    ("invoice_date", "date"),
+    ("seller_name", "category"),
+    ("seller_tax_no", "str"),
+    ("purchaser_name", "category"),
+    ("purchaser_tax_no", "str"),
+    ("item_name", "str"),
+    ("amount_pre_tax", "decimal"),
+    ("tax", "decimal"),
+    ("amount", "decimal"),
+    ("status", "category"),
+    ("error", "str"),
+)
+
+# 格式: (Content-Type, 扩展名, 是否需要pyarrow)
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", ".csv", False),
+    "parquet": ("application/vnd.apache.parquet", ".parquet", True),
+    "arrow": ("application/vnd.apache.arrow.stream", ".arrows", True),
+}
+
+_CENT = Decimal("0.01")
+
+
+def to_decimal(value: Any) -> Optional[Decimal]:
+    """把 "¥1,234.56"、"1234.5" 等金额文本转为两位小数的Decimal，无法转换时返回None"""
+    text = "".join(c for c in str(value if value is not None else "") if c.isdigit() or c in '.-')
+    if not text:
+        return None
+    try:
+        return Decimal(text).quantize(_CENT, rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        return None
+
+
+def to_date(value: Any) -> Optional[date]:
+    """把 "2025年03月15日" 等开票日期转为date，不完整或无效时返回None"""
+    try:
+        return date.fromisoformat(normalize_date(value))
+    except ValueError:
+        return None
+
+
+def typed_record(index: int, result: Dict[str, Any], filename: str = "") -> Dict[str, Any]:
+    """
+    把一张发票的识别结果转换为 EXPORT_FIELDS 对应的带类型记录
+
+    Args:
+        index: 序号（会话导出时从1开始，历史记录导出时为记录ID）
+        result: 识别结果（parse_aliyun_ocr_result 的返回值，或含error的失败结果）
+        filename: 结果中没有file_name时使用的文件名
+
+    Returns:
+        Dict: 字段名到值的映射，缺失的值为None
+    """
+    basic = result.get("basic_info") or {}
+    seller = result.get("seller_info") or {}
+    purchaser = result.get("purchaser_info") or {}
+    amounts = result.get("amount_info") or {}
+    details = result.get("invoice_details") or [{}]
+    return {
+        "index": index,
+        "file_name": result.get("file_name", filename),
+        "invoice_code": basic.get("发票代码") or None,
+        "invoice_number": basic.get("发票号码") or None,
+        "invoice_date": to_date(basic.get("开票日期")),
+        "seller_name": seller.get("名称") or None,
+        "seller_tax_no": seller.get("税号") or None,
+        "purchaser_name": purchaser.get("名称") or None,
+        "purchaser_tax_no": purchaser.get("税号") or None,
+        "item_name": details[0].get("货物名称") or None,
+        "amount_pre_tax": to_decimal(amounts.get("不含税金额")),
+        "tax": to_decimal(amounts.get("发票税额")),
+        "amount": to_decimal(amounts.get("发票金额")),
+        "status": "failed" if "error" in result else "success",
+        "error": result.get("error"),
+    }
+
+
+def _batches(records: Iterable[Dict[str, Any]], batch_size: int) -> Iterator[list]:
+    records = iter(records)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+class _Drain(io.RawIOBase):
+    """只追加的输出缓冲，写入方每写完一批即可取出已写入的字节"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_csv(records: Iterable[Dict[str, Any]], batch_size: int = 5000) -> Iterator[bytes]:
+    """
+    生成UTF-8编码的CSV（无BOM），金额为不带货币符号和千分位的小数，日期为 YYYY-MM-DD，缺失值为空
+
+    Args:
+        records: typed_record 生成的记录
+        batch_size: 每块包含的行数
+    """
+    names = [name for name, kind in EXPORT_FIELDS]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(names)
+    for batch in _batches(records, batch_size):
+        for record in batch:
+            writer.writerow(["" if record[name] is None else record[name] for name in names])
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def arrow_schema(decimal_amounts: bool = True) -> "pa.Schema":
+    """
+    导出使用的Arrow结构
+
+    Args:
+        decimal_amounts: 金额使用decimal128(18, 2)；为False时使用float64
+    """
+    types = {
+        "int": pa.int64(),
+        "str": pa.string(),
+        "date": pa.date32(),
+        "decimal": pa.decimal128(18, 2) if decimal_amounts else pa.float64(),
+        "category": pa.dictionary(pa.int32(), pa.string()),
+    }
+    return pa.schema([pa.field(name, types[kind]) for name, kind in EXPORT_FIELDS])
+
+
+def _record_batch(batch: list, schema: "pa.Schema") -> "pa.RecordBatch":
+    arrays = []
+    for (name, kind), field in zip(EXPORT_FIELDS, schema):
+        values = [record[name] for record in batch]
+        if kind == "category":
+            arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+        elif kind == "decimal" and pa.types.is_floating(field.type):
+            arrays.append(pa.array([None if v is None else float(v) for v in values], type=field.type))
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def iter_arrow(records: Iterable[Dict[str, Any]], batch_size: int = 5000,
+               decimal_amounts: bool = True) -> Iterator[bytes]:
+    """
+    生成Arrow IPC流格式（pyarrow.ipc.open_stream 可读取），每批记录为一个RecordBatch
+
+    Args:
+        records: typed_record 生成的记录
+        batch_size: 每个RecordBatch的行数
+        decimal_amounts: 金额使用decimal128；为False时使用float64
+    """
+    schema = arrow_schema(decimal_amounts)
+    sink = _Drain()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for batch in _batches(records, batch_size):
+            writer.write_batch(_record_batch(batch, schema))
+            yield sink.take()
+    # 流结束标记
+    yield sink.take()
+
+
+def iter_parquet(records: Iterable[Dict[str, Any]], batch_size: int = 5000,
+                 decimal_amounts: bool = True) -> Iterator[bytes]:
+    """
+    生成Parquet文件，每批记录为一个行组，文件尾（元数据）在最后一块中
+
+    Args:
+        records: typed_record 生成的记录
+        batch_size: 每个行组的行数
+        decimal_amounts: 金额使用decimal；为False时使用double
+    """
+    schema = arrow_schema(decimal_amounts)
+    sink = _Drain()
+    with pq.ParquetWriter(sink, schema, compression='zstd') as writer:
+        for batch in _batches(records, batch_size):
+            writer.write_table(pa.Table.from_batches([_record_batch(batch, schema)]))
+            data = sink.take()
+            if data:
+                yield data
+    # 文件尾（元数据）在关闭时写入
+    yield sink.take()
+
+
+def iter_export(fmt: str, records: Iterable[Dict[str, Any]], batch_size: int = 5000,
+                decimal_amounts: bool = True) -> Iterator[bytes]:
+    """
+    按格式生成导出内容
+
+    Args:
+        fmt: EXPORT_FORMATS 中的格式：csv、parquet 或 arrow
+        records: typed_record 生成的记录
+        batch_size: 每批的行数
+        decimal_amounts: Parquet/Arrow的金额使用decimal；为False时使用float64（CSV不受影响）
+
+    Raises:
+        ValueError: 格式不支持，或需要pyarrow但未安装
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    if EXPORT_FORMATS[fmt][2] and not PYARROW_AVAILABLE:
+        raise ValueError(f"导出 {fmt} 需要安装 pyarrow")
+    if fmt == "csv":
+        return iter_csv(records, batch_size)
+    if fmt == "arrow":
+        return iter_arrow(records, batch_size, decimal_amounts)
+    return iter_parquet(records, batch_size, decimal_amounts)
+
+
+def export_headers(fmt: str, basename: str) -> Tuple[str, Dict[str, str]]:
+    """
+    下载响应的Content-Type和响应头
+
+    Args:
+        fmt: 导出格式
+        basename: 不含扩展名的文件名（ASCII）
+    """
+    mimetype, extension, _ = EXPORT_FORMATS[fmt]
+    return mimetype, {
+        "Content-Disposition": f"attachment; filename={basename}{extension}",
+        "Cache-Control": "no-store",
+    }